@@ -0,0 +1,49 @@
+# conductivity using the kernel polynomial method
+from __future__ import print_function,division
+import numpy as np
+from . import kpm
+from .kpmtk import kubo
+
+
+def cell_volume(h):
+  """Volume (length or area) of the unit cell. For zero dimensional
+  systems the number of orbitals is used"""
+  g = h.geometry
+  if h.dimensionality==0: return float(h.intra.shape[0])
+  elif h.dimensionality==1: return np.sqrt(np.sum(np.array(g.a1)**2))
+  elif h.dimensionality==2: return abs(np.cross(g.a1,g.a2)[2])
+  elif h.dimensionality==3: return abs(np.dot(g.a1,np.cross(g.a2,g.a3)))
+  else: raise
+
+
+
+def conductivity_kpm(h,energies=np.linspace(-1.,1.,100),direction="xx",
+        mode="bastin",npol=200,ntries=10,scale=None,k=[0.,0.,0.],
+        volume=None,checkpoint=None,write=True,info=False):
+  """Compute the zero temperature conductivity as a function of the
+  Fermi energy, in units of e^2/h, using the KPM. Large disordered
+  systems should be used as supercells, evaluated at a single k-point.
+    - mode="bastin" uses the Kubo-Bastin formula, valid for both the
+      longitudinal and Hall conductivities
+    - mode="greenwood" uses the Kubo-Greenwood formula, only for the
+      longitudinal conductivity
+    - checkpoint is a file in which the moments are stored, so that
+      the calculation can be restarted"""
+  hk = h.get_hk_gen()(k) # Bloch Hamiltonian
+  (shift,scale) = kpm.get_window(hk,scale=scale) # window of the KPM
+  m = kpm.rescale_matrix(hk,shift=shift,scale=scale) # rescaled matrix
+  va = kubo.velocity_matrix(h,k=k,direction=direction[0]) # velocities
+  vb = kubo.velocity_matrix(h,k=k,direction=direction[1])
+  mus = kubo.kubo_moments(m,va,vb,n=npol,ntries=ntries,
+                    checkpoint=checkpoint,info=info) # moments
+  energies = np.array(energies) # convert to array
+  xs = np.clip((energies-shift)/scale,-0.99,0.99) # rescaled energies
+  if volume is None: volume = cell_volume(h) # volume of the cell
+  nd = hk.shape[0] # dimension, since the moments are normalized
+  if mode=="bastin":
+    ys = 8.*nd/(volume*scale**2)*kubo.bastin(mus,xs)
+  elif mode=="greenwood":
+    ys = 2.*np.pi**2*nd/(volume*scale**2)*kubo.greenwood(mus,xs)
+  else: raise
+  if write: np.savetxt("CONDUCTIVITY.OUT",np.array([energies,ys]).T)
+  return energies,ys
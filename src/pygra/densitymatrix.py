@@ -26,18 +26,12 @@ def full_dm(h,use_fortran=True,nk=10,delta=1e-2):
 
 def full_dm_python(n,es,vs):
   """Calculate the density matrix"""
-#  dm = [[0. for i in range(n)] for j in range(n)] # zero matrix
-  dm = np.zeros((n,n)) +0j
-  for ie in range(len(es)): # loop
-    if es[ie]<0.: # if below Fermi energy
-      for i in range(n):
-        for j in range(n): 
-          dm[i,j] += vs[ie][i].conjugate()*vs[ie][j] # add contribution
-  return dm
+  vs = np.array(vs)[np.array(es)<0.] # states below the Fermi energy
+  return np.conjugate(vs).T@vs # sum of the contributions
 
 
 def restricted_dm(h,use_fortran=True,mode="KPM",pairs=[],
-                   scale=10.0,npol=400,ne=None):
+                   scale=None,npol=400,ne=None):
   """Calculate certain elements of the density matrix"""
   if h.dimensionality != 0 : raise
   if mode=="full": # full inversion and then select
@@ -47,16 +41,47 @@ def restricted_dm(h,use_fortran=True,mode="KPM",pairs=[],
   elif mode=="KPM": # use Kernel polynomial method
     if ne is None: ne = npol*4
     from . import kpm
-    xin = np.linspace(-.99*scale,0.0,ne) # input x array
+    (shift,scale) = kpm.get_window(h.intra,scale=scale) # window
+    if not shift-scale<0.<shift+scale: # Fermi energy outside the window
+      print("Fermi energy outside the spectral window",shift-scale,shift+scale)
+      raise
+    xin = np.linspace(shift-.99*scale,0.0,ne) # input x array
     out = np.zeros(len(pairs),dtype=np.complex)
     ii = 0
     for (i,j) in pairs: # loop over inputs
-      (x,y) = kpm.dm_ij_energy(h.intra,i=i,j=j,scale=scale,npol=npol,
-                      ne=ne,x=xin)
+      (x,y) = kpm.dm_ij_energy(h.intra,i=i,j=j,scale=scale,shift=shift,
+                      npol=npol,ne=ne,x=xin)
       out[ii] = np.trapz(y,x=x)/np.pi # pi is here so it normalizes to 0.5
       ii += 1
     return out
+  elif mode=="FOE": # Fermi operator expansion, all the pairs at once
+    from .kpmtk import fermioperator
+    from . import kpm
+    (shift,scale) = kpm.get_window(h.intra,scale=scale) # window
+    if not shift-scale<0.<shift+scale: # Fermi energy outside the window
+      print("Fermi energy outside the spectral window",shift-scale,shift+scale)
+      raise
+    m = kpm.rescale_matrix(h.intra,shift=shift,scale=scale)
+    cs = fermioperator.fermi_coefficients(npol,mu=-shift/scale)
+    return fermioperator.dm_pairs(m,pairs,cs)
   else: raise
+
+
+
+def sparse_dm(h,mu=0.,temperature=0.,npol=400,scale=None,distance=6,
+                kernel="jackson"):
+  """Density matrix of a zero dimensional Hamiltonian on the sparsity
+  pattern of the Hamiltonian, using a Chebyshev expansion of the Fermi
+  operator and probing vectors. Returns a sparse matrix with elements
+  <i|rho|j>"""
+  if h.dimensionality != 0 : raise
+  from .kpmtk import fermioperator
+  from . import kpm
+  (shift,scale) = kpm.get_window(h.intra,scale=scale) # window
+  m = kpm.rescale_matrix(h.intra,shift=shift,scale=scale)
+  cs = fermioperator.fermi_coefficients(npol,mu=(mu-shift)/scale,
+            temperature=temperature/scale,kernel=kernel)
+  return fermioperator.dm_pattern(m,cs,distance=distance)
        
 
 
@@ -10,6 +10,7 @@ from . import green
 from . import algebra
 from . import parallel
 from .klist import kmesh
+from .dostk import broadening
 
 try:
 #  raise
@@ -20,8 +21,20 @@ except:
   use_fortran = False
 
 
-def calculate_dos(es,xs,d,use_fortran=use_fortran,w=None):
+def calculate_dos(es,xs,d,use_fortran=use_fortran,w=None,
+        kernel="lorentzian",mode="auto",tol=1e-3):
+  """Sum of broadened eigenvalues, mode can be "direct" (loop over
+  eigenvalues), "convolve" (histogram and FFT) or "auto" """
   if w is None: w = np.zeros(len(es)) + 1.0 # initialize
+  if mode=="auto": # choose the fastest algorithm
+    mode = broadening.choose_mode(len(es),xs,d,kernel=kernel,tol=tol)
+  if mode=="convolve": # histogram and convolve
+    return broadening.convolve_dos(es,xs,d,w=w,kernel=kernel,tol=tol)
+  if kernel!="lorentzian": # direct sum of the kernel
+    ys = np.zeros(xs.shape[0]) # initialize
+    for (e,iw) in zip(es,w): # loop over energies
+      ys += broadening.kernel_function(xs-e,d,kernel=kernel)*iw
+    return ys
   if use_fortran: # use fortran routine
     from . import dosf90 
     return dosf90.calculate_dos(es,xs,d,w) # use the Fortran routine
@@ -44,6 +57,13 @@ def calculate_dos(es,xs,d,use_fortran=use_fortran,w=None):
 
 
 
+def calculate_pdos(es,xs,d,ws,**kwargs):
+  """Several projected DOS at once, ws has shape (len(es),nprojections)
+  and the output has shape (len(xs),nprojections)"""
+  return broadening.convolve_pdos(es,xs,d,ws,**kwargs)
+
+
+
 
 def dos_surface(h,output_file="DOS.OUT",
                  energies=np.linspace(-1.,1.,20),delta=0.001):
@@ -103,8 +123,7 @@ def dos0d_sites(h,sites=[0],scale=10.,npol=500,ewindow=None,refine_e=1.0):
   h.turn_sparse() # turn the hamiltonian sparse
   mus = np.array([0.0j for i in range(2*npol)]) # initialize polynomials
   hk = h.intra # hamiltonian
-  for isite in sites:
-    mus += kpm.local_dos(hk/scale,i=isite,n=npol)
+  mus += kpm.sites_dos(hk/scale,sites=sites,n=npol) # all the sites at once
   if ewindow is None:  xs = np.linspace(-0.9,0.9,int(npol*refine_e)) # x points
   else:  xs = np.linspace(-ewindow/scale,ewindow/scale,npol) # x points
   ys = kpm.generate_profile(mus,xs) # generate the profile
@@ -171,8 +190,7 @@ def dos1d_sites(h,sites=[0],scale=10.,nk=100,npol=100,info=False,ewindow=None):
   mus = np.array([0.0j for i in range(2*npol)]) # initialize polynomials
   for k in ks: # loop over kpoints
     hk = hkgen(k) # hamiltonian
-    for isite in sites:
-      mus += kpm.local_dos(hk/scale,i=isite,n=npol)
+    mus += kpm.sites_dos(hk/scale,sites=sites,n=npol) # all the sites
     if info: print("Done",k)
   mus /= nk # normalize by the number of kpoints
   if ewindow is None:  xs = np.linspace(-0.9,0.9,npol) # x points
@@ -182,45 +200,61 @@ def dos1d_sites(h,sites=[0],scale=10.,nk=100,npol=100,info=False,ewindow=None):
 
 
 def calculate_dos_hkgen(hkgen,ks,ndos=100,delta=None,
-         is_sparse=False,numw=10,window=None,energies=None):
-  """Calculate density of states using the ks given on input"""
+         is_sparse=False,numw=10,window=None,energies=None,
+         nchunks=None,nbuffer=100000):
+  """Calculate density of states using the ks given on input. The
+  eigenvalues are binned on the fly in a fixed energy grid, so that
+  the memory does not depend on the number of k-points"""
   if not is_sparse: # if not is sparse
       m = hkgen([0,0,0]) # get the matrix
       if algebra.issparse(m): 
           print("Hamiltonian is sparse, selecting sparse mode in DOS")
           is_sparse = True
-  es = np.zeros((len(ks),hkgen(ks[0]).shape[0])) # empty list
-  tr = timing.Testimator("DOS",maxite=len(ks))
   if delta is None: delta = 5./len(ks) # automatic delta
-  from . import parallel
-  def fun(k): # function to execute
-    if parallel.cores==1: tr.iterate() # print the info
+  def eigk(k): # eigenvalues in a k-point
     hk = hkgen(k) # Hamiltonian
-    t0 = time.clock() # time
     if is_sparse: # sparse Hamiltonian 
-      es = algebra.smalleig(hk,numw=numw,tol=delta/1e3) # eigenvalues
-      ws = np.zeros(es.shape[0])+1.0 # weight
+      return algebra.smalleig(hk,numw=numw,tol=delta/1e3) # eigenvalues
     else: # dense Hamiltonian
-      es = algebra.eigvalsh(hk) # get eigenvalues
-      ws = np.zeros(es.shape[0])+1.0 # weight
-    return es # return energies
-#  for ik in range(len(ks)):  
-  out = parallel.pcall(fun,ks) # launch all the processes
-  es = [] # empty list
-  for o in out: 
-      es = np.concatenate([es,o]) # concatenate
-#    tr.remaining(ik,len(ks))
-#  es = es.reshape(len(es)*len(es[0])) # 1d array
-  es = np.array(es) # convert to array
-  nk = len(ks) # number of kpoints
+      return algebra.eigvalsh(hk) # get eigenvalues
   if energies is not None: # energies given on input
-    xs = energies
+    xs = np.array(energies)
   else:
-    if window is None:
+    if window is None: # estimate the window with a few k-points
+      es = np.concatenate([eigk(k) for k in ks[::max([1,len(ks)//20])]])
       xs = np.linspace(np.min(es)-.5,np.max(es)+.5,ndos) # create x
     else:
       xs = np.linspace(-window,window,ndos) # create x
-  ys = calculate_dos(es,xs,delta) # use the Fortran routine
+  # bin in the fine grid, or sum directly if the grid is too large
+  mode = broadening.choose_mode(nbuffer,xs,delta) 
+  def reduce_energies(es): # contribution of a set of eigenvalues
+    if mode=="convolve": return broadening.bin_eigenvalues(es,xs,delta)
+    else: return [calculate_dos(es,xs,delta,mode="direct")]
+  from . import parallel
+  if nchunks is None: nchunks = 4*parallel.cores
+  nchunks = max([1,min([nchunks,len(ks)])]) # no empty chunks
+  tr = timing.Testimator("DOS",maxite=len(ks))
+  def fun(ic): # compute a subset of k-points
+    out = None # accumulated result
+    buf = [] # buffer of eigenvalues
+    nbuf = 0 # number of eigenvalues in the buffer
+    kc = ks[ic::nchunks] # k-points of this chunk
+    for ik in range(len(kc)):
+      if parallel.cores==1: tr.iterate() # print the info
+      buf.append(eigk(kc[ik])) # store eigenvalues
+      nbuf += len(buf[-1]) # number of eigenvalues
+      if nbuf>nbuffer or ik==len(kc)-1: # reduce the buffer
+        o = reduce_energies(np.concatenate(buf))
+        if out is None: out = o
+        else: out = [a+b for (a,b) in zip(out,o)]
+        buf,nbuf = [],0 # empty buffer
+    return out
+  out = parallel.pcall(fun,range(nchunks)) # launch all the processes
+  tot = out[0] # initialize
+  for o in out[1:]: tot = [a+b for (a,b) in zip(tot,o)] # add all
+  if mode=="convolve": ys = broadening.binned_dos(tot,xs,delta)
+  else: ys = tot[0]
+  nk = len(ks) # number of kpoints
   ys /= nk # normalize by the number of k-points
   ys *= 1./np.pi # normalization of the Lorentzian
   write_dos(xs,ys) # write in file
@@ -426,22 +460,28 @@ def convolve(x,y,delta=None):
 
 
 
-def dos_kpm(h,scale=10.0,ewindow=4.0,ne=10000,
+def dos_kpm(h,scale=None,ewindow=4.0,ne=10000,
         delta=0.01,ntries=10,nk=100,operator=None,
         random=True,
         **kwargs):
-  """Calculate the KDOS bands using the KPM"""
+  """Calculate the KDOS bands using the KPM. If scale is None, it is
+  obtained from the bounds of the spectrum"""
   hkgen = h.get_hk_gen() # get generator
   ks = kmesh(h.dimensionality,nk=nk) # klist
   if random: ks = [np.random.random(3) for k in ks]
   ytot = np.zeros(ne) # initialize
+  if scale is None: # estimate the bounds
+    from .kpmtk import bounds
+    (shift,scale) = bounds.hamiltonian_window(h)
+  else: shift = 0. # no shift
   npol = 5*int(scale/delta) # number of polynomials
   def f(k):
     hk = hkgen(k) # get Hamiltonian
     if callable(operator): op = operator(k) # call the function if necessary
     else: op = operator # take the same operator
-    (x,y) = kpm.tdos(hk,scale=scale,npol=npol,ne=ne,operator=op,
-                   ewindow=ewindow,ntries=ntries,**kwargs) # compute
+    (x,y) = kpm.tdos(hk,scale=scale,shift=shift,npol=npol,ne=ne,
+                   operator=op,ewindow=ewindow,ntries=ntries,
+                   **kwargs) # compute
     return (x,y)
   from . import parallel
   numk = len(ks)
@@ -499,12 +539,59 @@ def dos(h,energies=np.linspace(-4.0,4.0,400),
 #    else: # operator given on input
         def fun(e):
             return green.green_operator(h,operator,e=e,**kwargs) 
-        ds = parallel.pcall(fun,energies) # compute DOS with an operator
+        if callable(operator): # all the energies from one diagonalization
+          ds = green.green_operator(h,operator,e=np.array(energies),**kwargs)
+        else: ds = parallel.pcall(fun,energies) # DOS with an operator
         np.savetxt("DOS.OUT",np.matrix([energies,ds]).T) # write in a file
         return (energies,ds)
+      elif mode=="tetrahedron": # linear tetrahedron method
+        return dos_tetrahedron(h,energies=energies,**kwargs)
+      elif mode=="adaptive": # adaptive k-mesh
+        return dos_adaptive(h,energies=energies,**kwargs)
+      elif mode=="interpolation": # Fourier interpolated bands
+        return dos_interpolated(h,energies=energies,**kwargs)
       else: raise
 
 
+def dos_tetrahedron(h,energies=np.linspace(-1.,1.,200),nk=10,operator=None,
+        write=True):
+  """Compute the DOS with the linear tetrahedron (3d), triangle (2d)
+  or segment (1d) method in a uniform k-mesh"""
+  from .dostk import tetrahedron
+  ys = tetrahedron.dos(h,energies=energies,nk=nk,operator=operator)
+  if write: write_dos(energies,ys) # write in file
+  return (energies,ys)
+
+
+def dos_adaptive(h,energies=np.linspace(-1.,1.,200),nk=10,maxlevel=4,
+        tol=None,delta=None,write=True,info=False):
+  """Compute the DOS with an adaptive k-mesh, that is only refined
+  in the regions contributing to the energy window"""
+  from .dostk import adaptive
+  ys = adaptive.adaptive_dos(h,energies=energies,nk=nk,maxlevel=maxlevel,
+          tol=tol,delta=delta,info=info)
+  if write: write_dos(energies,ys) # write in file
+  return (energies,ys)
+
+
+def dos_interpolated(h,energies=np.linspace(-1.,1.,200),nk=10,nkdense=100,
+        delta=None,operator=None,write=True,**kwargs):
+  """Compute the DOS by diagonalizing in a coarse mesh of nk points and
+  Fourier interpolating the bands in a dense mesh of nkdense points"""
+  from .dostk import fourierbands
+  ys = fourierbands.interpolated_dos(h,energies=energies,nk=nk,
+          nkdense=nkdense,delta=delta,operator=operator,**kwargs)
+  if write: write_dos(energies,ys) # write in file
+  return (energies,ys)
+
+
+def idos_tetrahedron(h,energies=np.linspace(-1.,1.,200),nk=10):
+  """Compute the integrated DOS with the tetrahedron method"""
+  from .dostk import tetrahedron
+  ys = tetrahedron.idos(h,energies=energies,nk=nk)
+  return (energies,ys)
+
+
 def autodos(h,auto=True,**kwargs):
     """Automatic computation of DOS"""
     if auto: # automatic integration
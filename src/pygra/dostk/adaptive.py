@@ -0,0 +1,130 @@
+from __future__ import print_function
+import numpy as np
+from .. import algebra
+from .. import parallel
+from . import tetrahedron
+
+# Adaptive integration of the DOS in reciprocal space. The Brillouin zone
+# is split in patches, starting from a coarse mesh, and only the patches
+# whose bands enter the energy window and whose bands deviate from a
+# linear interpolation are recursively subdivided
+
+
+def get_corners(dim):
+  """Integer offsets of the corners of a patch"""
+  return [c for c in np.ndindex(*([2]*dim))]
+
+
+
+class Patch():
+  """Hypercube in reciprocal space, in integer units of the finest mesh"""
+  def __init__(self,origin,size):
+    self.origin = np.array(origin,dtype=int) # first corner
+    self.size = size # length of the side
+  def corners(self):
+    """Integer coordinates of the corners"""
+    dim = len(self.origin)
+    return [tuple(self.origin + self.size*np.array(c)) for c in get_corners(dim)]
+  def center(self):
+    """Integer coordinates of the center (in units of half the mesh)"""
+    return tuple(2*self.origin + self.size)
+  def split(self):
+    """Return the children patches"""
+    s = self.size//2 # new size
+    dim = len(self.origin)
+    return [Patch(self.origin + s*np.array(c),s) for c in get_corners(dim)]
+
+
+
+def patch_error(ec,ev,window):
+  """Return the estimated error of the linear interpolation in a patch
+  and whether it contributes to the energy window. ec are the energies in
+  the corners and ev in the center, with shape (ncorners,nbands)"""
+  curv = np.abs(ev - np.mean(ec,axis=0)) # deviation from linear
+  emin = np.minimum(np.min(ec,axis=0),ev) - 2*curv # lower limit of each band
+  emax = np.maximum(np.max(ec,axis=0),ev) + 2*curv # upper limit of each band
+  inside = (emax>window[0]) & (emin<window[1]) # bands in the window
+  if not np.any(inside): return 0.,False
+  return np.max(curv[inside]),True
+
+
+
+def adaptive_patches(hkgen,dim,window,nk=10,maxlevel=4,tol=1e-2,
+                         info=False):
+  """Refine the mesh, returns the final patches, a function returning
+  the eigenvalues in the corners and the finest resolution"""
+  nmax = nk*2**maxlevel # number of points of the finest mesh
+  store = dict() # eigenvalues already computed
+  def kvector(ik): # k-point, in units of half the finest mesh
+    k = np.zeros(3) # initialize
+    k[0:dim] = np.array(ik)/(2.*nmax)
+    return k
+  def compute(iks): # compute the new k-points
+    iks = [ik for ik in set(iks) if ik not in store] # new ones
+    es = parallel.pcall(lambda ik: algebra.eigvalsh(hkgen(kvector(ik))),iks)
+    for (ik,e) in zip(iks,es): store[ik] = np.sort(e) # store
+  def corner_key(c): return tuple(2*(np.array(c)%nmax)) # periodic
+  def center_key(p): return tuple(np.array(p.center())%(2*nmax))
+  s0 = 2**maxlevel # initial size
+  queue = [Patch(np.array(c)*s0,s0) for c in np.ndindex(*([nk]*dim))]
+  leaves = [] # final patches
+  level = 0
+  while len(queue)>0: # loop over levels
+    iks = [corner_key(c) for p in queue for c in p.corners()]
+    iks += [center_key(p) for p in queue] # and the centers
+    compute(iks) # diagonalize
+    newqueue = [] # patches to refine
+    for p in queue:
+      ec = np.array([store[corner_key(c)] for c in p.corners()])
+      ev = store[center_key(p)] # center
+      (err,inside) = patch_error(ec,ev,window) # error
+      if inside and err>tol and p.size>1: newqueue += p.split()
+      else: leaves.append(p) # final patch
+    if info: print("Level",level,"refining",len(newqueue),"patches")
+    queue = newqueue # next level
+    level += 1
+  def corner_energies(p):
+    return np.array([store[corner_key(c)] for c in p.corners()])
+  def center_energies(p): return store[center_key(p)]
+  return leaves,corner_energies,center_energies,nmax
+
+
+
+def adaptive_dos(h,energies=np.linspace(-1.,1.,200),nk=10,maxlevel=4,
+                    tol=None,delta=None,info=False):
+  """Compute the DOS with an adaptive k-mesh. If delta is None, each
+  patch is integrated with the linear tetrahedron method, otherwise the
+  eigenvalues in the center of the patches are broadened with delta"""
+  dim = h.dimensionality # dimensionality
+  if dim not in [1,2,3]: raise
+  energies = np.array(energies) # convert to array
+  window = [np.min(energies),np.max(energies)] # energy window
+  if tol is None: # resolution of the energy grid
+    tol = (window[1]-window[0])/len(energies)
+  if delta is not None: window = [window[0]-5*delta,window[1]+5*delta]
+  hkgen = h.get_hk_gen() # generator
+  (leaves,fc,fv,nmax) = adaptive_patches(hkgen,dim,window,nk=nk,
+                            maxlevel=maxlevel,tol=tol,info=info)
+  if delta is None: # linear tetrahedron in each patch
+    cs = tetrahedron.cell_simplices(dim) # simplices of a patch
+    corners = get_corners(dim) # corners of a patch
+    ic = [[corners.index(c) for c in s] for s in cs] # index of the corners
+    es,fs = [],[] # energies and measures of the simplices
+    for p in leaves:
+      ec = fc(p) # energies in the corners
+      vol = (p.size/nmax)**dim/len(cs) # volume of each simplex
+      for s in ic: # loop over simplices
+        es.append(ec[s].T) # (nbands,dim+1)
+        fs.append(np.zeros(ec[s].T.shape) + vol) # measure
+    es = np.concatenate(es) ; fs = np.concatenate(fs)
+    ii = np.argsort(es,axis=1) # sort inside the simplex
+    es = np.take_along_axis(es,ii,axis=1)
+    ys = np.array([tetrahedron.simplex_dos_energy(e,es,fs=fs)
+                     for e in energies])
+  else: # broaden the eigenvalues in the centers
+    from ..dos import calculate_dos
+    es = np.concatenate([fv(p) for p in leaves]) # eigenvalues
+    ws = np.concatenate([fv(p)*0. + (p.size/nmax)**dim for p in leaves])
+    ys = calculate_dos(es,energies,delta,w=ws)/np.pi
+  if info: print("Adaptive DOS with",len(leaves),"patches")
+  return ys
@@ -0,0 +1,183 @@
+from __future__ import print_function
+import numpy as np
+from scipy.signal import fftconvolve
+
+# Broadening of a set of eigenvalues into a smooth DOS, by first binning
+# the eigenvalues in a fine grid and then convolving with the kernel using
+# FFTs. The cost is O(Ne + Ng log Ng) instead of O(Ne*Nx).
+# All the kernels are normalized as in dos.calculate_dos, i.e. they
+# integrate to pi
+
+ntail = 50 # width of the fine window around the energies, in units of delta
+
+
+def kernel_function(x,delta,kernel="lorentzian"):
+  """Return the broadening function evaluated in x"""
+  if kernel=="lorentzian": return delta/(delta*delta + x*x)
+  elif kernel=="gaussian":
+    return np.sqrt(np.pi/2.)/delta*np.exp(-x*x/(2.*delta*delta))
+  else: raise
+
+
+
+def kernel_cutoff(delta,kernel="lorentzian",tol=1e-3):
+  """Distance beyond which the eigenvalues are not included in the fine grid"""
+  if kernel=="lorentzian": return ntail*delta
+  elif kernel=="gaussian": return delta*np.sqrt(2.*np.log(1./tol)) + delta
+  else: raise
+
+
+
+def fine_step(delta,tol=1e-3):
+  """Step of the fine grid, so that the discretization error is below tol"""
+  # linear binning and interpolation have an error (dx/delta)^2/4 each
+  return delta*np.sqrt(2.*tol)
+
+
+
+def fine_grid_size(xs,delta,kernel="lorentzian",tol=1e-3):
+  """Number of points of the fine grid"""
+  cut = kernel_cutoff(delta,kernel=kernel,tol=tol)
+  dx = fine_step(delta,tol=tol)
+  return int(np.ceil((np.max(xs) - np.min(xs) + 2*cut)/dx)) + 2
+
+
+
+def choose_mode(ne,xs,delta,kernel="lorentzian",tol=1e-3,nmax=2**23):
+  """Decide if it is worth using the convolution"""
+  if kernel!="lorentzian": return "convolve" # only possible way
+  ng = fine_grid_size(xs,delta,kernel=kernel,tol=tol) # number of points
+  if ng>nmax: return "direct" # too large grid
+  cost_direct = ne*len(xs) # cost of the direct sum
+  cost_convolve = 4*ne + 10*ng*np.log2(ng) # cost of the convolution
+  if cost_convolve<cost_direct: return "convolve"
+  else: return "direct"
+
+
+
+def bin_linear(es,x0,dx,ng,w):
+  """Distribute the eigenvalues in a uniform grid, using linear
+  interpolation between the two closest points"""
+  t = (es - x0)/dx # position in the grid
+  i0 = np.floor(t).astype(int) # left point
+  i0 = np.clip(i0,0,ng-2) # avoid the edges
+  f = t - i0 # weight of the right point
+  if len(w.shape)==1: # single weight
+    h = np.bincount(i0,weights=(1.-f)*w,minlength=ng)
+    h += np.bincount(i0+1,weights=f*w,minlength=ng)
+  else: # several weights
+    h = np.zeros((ng,w.shape[1])) # initialize
+    for j in range(w.shape[1]): # loop over weights
+      h[:,j] = np.bincount(i0,weights=(1.-f)*w[:,j],minlength=ng)
+      h[:,j] += np.bincount(i0+1,weights=f*w[:,j],minlength=ng)
+  return h
+
+
+
+def interpolate_grid(xs,x0,dx,ys):
+  """Linear interpolation from the uniform grid to xs"""
+  ng = ys.shape[0] # number of grid points
+  t = (xs - x0)/dx # position in the grid
+  i0 = np.clip(np.floor(t).astype(int),0,ng-2) # left point
+  f = t - i0 # weight of the right point
+  if len(ys.shape)==2: f = f[:,None] # several weights
+  return (1.-f)*ys[i0] + f*ys[i0+1]
+
+
+
+def tail_dos(es,xs,delta,w,kernel="lorentzian",cut=None):
+  """Contribution of the eigenvalues far away from xs, using a coarse
+  histogram (only needed for long tail kernels)"""
+  if len(es)==0: return 0. # nothing to do
+  bw = cut/8. # the kernel is smooth on this scale
+  emin,emax = np.min(es),np.max(es) # limits
+  nb = int(np.ceil((emax-emin)/bw)) + 1 # number of bins
+  ib = ((es - emin)/bw).astype(int) # index of the bin
+  ec = emin + (np.arange(nb)+0.5)*bw # center of the bins
+  if len(w.shape)==1: # single weight
+    hw = np.bincount(ib,weights=w,minlength=nb) # weights of each bin
+    ii = hw!=0. # non empty bins
+    ec,hw = ec[ii],hw[ii] # retain only those
+    out = np.zeros(len(xs)) # initialize
+    for (e,iw) in zip(ec,hw): out += kernel_function(xs-e,delta,kernel)*iw
+  else:
+    out = np.zeros((len(xs),w.shape[1])) # initialize
+    hw = np.array([np.bincount(ib,weights=w[:,j],minlength=nb)
+                    for j in range(w.shape[1])]).T # weights of each bin
+    ii = np.sum(np.abs(hw),axis=1)!=0. # non empty bins
+    ec,hw = ec[ii],hw[ii] # retain only those
+    for (e,iw) in zip(ec,hw):
+      out += kernel_function(xs-e,delta,kernel)[:,None]*iw[None,:]
+  return out
+
+
+
+def grid_limits(xs,delta,kernel="lorentzian",tol=1e-3):
+  """First point, step and number of points of the fine grid"""
+  cut = kernel_cutoff(delta,kernel=kernel,tol=tol) # width of the window
+  dx = fine_step(delta,tol=tol) # step of the fine grid
+  x0 = np.min(xs) - cut # first point of the grid
+  ng = fine_grid_size(xs,delta,kernel=kernel,tol=tol) # number of points
+  return x0,dx,ng
+
+
+
+def bin_eigenvalues(es,xs,delta,w=None,kernel="lorentzian",tol=1e-3):
+  """Bin the eigenvalues in the fine grid. Returns a list with the
+  histogram and the contribution of the far away eigenvalues, which
+  can be summed for different sets of eigenvalues"""
+  es = np.array(es).real.reshape(-1) # eigenvalues as array
+  xs = np.array(xs) # output energies
+  if w is None: w = np.ones(len(es)) # unit weights
+  w = np.array(w).real # weights
+  cut = kernel_cutoff(delta,kernel=kernel,tol=tol) # width of the window
+  x0,dx,ng = grid_limits(xs,delta,kernel=kernel,tol=tol) # fine grid
+  x1 = x0 + (ng-1)*dx # last point of the grid
+  inside = (es>=x0) & (es<=x1) # eigenvalues inside the window
+  h = bin_linear(es[inside],x0,dx,ng,w[inside]) # histogram
+  if kernel=="lorentzian": # add the long tails
+    outside = np.logical_not(inside) # far away eigenvalues
+    yt = tail_dos(es[outside],xs,delta,w[outside],kernel=kernel,cut=cut)
+  else: yt = 0. # short range kernel
+  yt = yt + np.zeros((len(xs),)+w.shape[1:]) # as array
+  return [h,yt]
+
+
+
+def add_binned(b1,b2):
+  """Sum two partial results of bin_eigenvalues"""
+  return [b1[0] + b2[0],b1[1] + b2[1]]
+
+
+
+def binned_dos(b,xs,delta,kernel="lorentzian",tol=1e-3):
+  """Transform the output of bin_eigenvalues into the DOS"""
+  h,yt = b[0],b[1] # histogram and tails
+  x0,dx,ng = grid_limits(xs,delta,kernel=kernel,tol=tol) # fine grid
+  cut = kernel_cutoff(delta,kernel=kernel,tol=tol) # width of the window
+  if kernel=="lorentzian": nk = ng - 1 # the whole grid
+  else: nk = min([ng-1,int(np.ceil(cut/dx))]) # short range kernel
+  kern = kernel_function(dx*np.arange(-nk,nk+1),delta,kernel) # kernel
+  if len(h.shape)==2: kern = kern[:,None] # several weights
+  yg = fftconvolve(h,kern,mode="same",axes=0) # convolve
+  return interpolate_grid(np.array(xs),x0,dx,yg) + yt
+
+
+
+def convolve_dos(es,xs,delta,w=None,kernel="lorentzian",tol=1e-3):
+  """Compute the sum of broadened eigenvalues by binning them in a
+  fine grid and performing a FFT convolution. The relative error
+  at the peaks is of the order of tol.
+  If w has two dimensions, each column is an independent set of weights
+  and an array of shape (len(xs),w.shape[1]) is returned"""
+  b = bin_eigenvalues(es,xs,delta,w=w,kernel=kernel,tol=tol) # histogram
+  return binned_dos(b,xs,delta,kernel=kernel,tol=tol)
+
+
+
+def convolve_pdos(es,xs,delta,ws,**kwargs):
+  """Compute several projected DOS at once, ws has shape
+  (len(es),nprojections)"""
+  ws = np.array(ws) # convert to array
+  if len(ws.shape)!=2: raise # two dimensional array
+  return convolve_dos(es,xs,delta,w=ws,**kwargs)
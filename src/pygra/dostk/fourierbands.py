@@ -0,0 +1,155 @@
+from __future__ import print_function
+import numpy as np
+from .. import algebra
+from .. import parallel
+from ..klist import kmesh
+
+# Shankland-Koelling-Wood interpolation of the bands. Each band computed
+# in a coarse uniform mesh is written as a Fourier series
+#   e(k) = sum_R c_R exp(2 pi i k.R)
+# with more lattice vectors R than k-points, choosing the coefficients
+# that go through the data and minimize the roughness sum_R rho(R) |c_R|^2.
+# In a uniform mesh the linear problem is diagonal in Fourier space, so
+# the fit and the evaluation in dense uniform meshes only require FFTs
+
+
+def roughness(rs,rmin,c1=0.75,c2=0.75):
+  """Roughness function of the lattice vectors"""
+  x = rs/rmin # in units of the shortest vector
+  return (1. - c1*x**2)**2 + c2*x**6
+
+
+
+def lattice_vectors(dim,nmax):
+  """Integer lattice vectors inside a box"""
+  return np.array([c for c in np.ndindex(*([2*nmax+1]*dim))]) - nmax
+
+
+
+def disentangle_bands(es,vs,nk,dim):
+  """Reorder the bands in the mesh by maximizing the overlap of the
+  eigenvectors with a neighboring k-point, so that band crossings do not
+  produce kinks. es has shape (nk**dim,nbands), vs (nk**dim,n,nbands)"""
+  from scipy.optimize import linear_sum_assignment
+  es,vs = es.copy(),vs.copy()
+  shape = tuple([nk]*dim) # shape of the mesh
+  for i in range(1,es.shape[0]): # loop over k-points, in mesh order
+    ii = np.array(np.unravel_index(i,shape)) # mesh indexes
+    j = np.max(np.nonzero(ii)[0]) # last nonzero index
+    ii[j] -= 1 # neighbor already ordered
+    i0 = np.ravel_multi_index(tuple(ii),shape) # index of the neighbor
+    ov = np.abs(np.conjugate(vs[i0]).T@vs[i]) # overlaps
+    (r,c) = linear_sum_assignment(-ov) # best assignment
+    es[i] = es[i][c] # reorder the energies
+    vs[i] = vs[i][:,c] # reorder the vectors
+  return es,vs
+
+
+
+class BandInterpolator():
+  """Fourier interpolation of the bands computed in a coarse mesh"""
+  def __init__(self,h,nk=10,nr=2.,operator=None,disentangle=False):
+    self.dimensionality = h.dimensionality # dimensionality
+    dim = self.dimensionality
+    if dim not in [1,2,3]: raise
+    self.nk = nk # coarse mesh
+    hkgen = h.get_hk_gen() # generator
+    ks = kmesh(dim,nk=nk) # coarse mesh
+    if type(operator)==str: operator = h.get_operator(operator)
+    use_vectors = disentangle or (operator is not None)
+    def fun(k): # diagonalize
+      hk = np.array(algebra.todense(hkgen(k))) # Hamiltonian
+      if use_vectors: return algebra.eigh(hk)
+      else: return algebra.eigvalsh(hk),None
+    out = parallel.pcall(fun,ks) # compute all
+    es = np.array([o[0] for o in out]) # energies
+    if use_vectors:
+      vs = np.array([o[1] for o in out]) # eigenvectors
+      if disentangle: es,vs = disentangle_bands(es,vs,nk,dim)
+    self.nbands = es.shape[1] # number of bands
+    # lattice vectors and roughness
+    a = np.array([h.geometry.a1,h.geometry.a2,h.geometry.a3])[0:dim,:]
+    self.rs = lattice_vectors(dim,int(np.ceil(nr*nk/2.))) # vectors
+    rc = self.rs@a # cartesian vectors
+    rn = np.sqrt(np.sum(rc**2,axis=1)) # norm
+    rmin = np.min(rn[rn>0.]) # shortest vector
+    self.w = 1./roughness(rn,rmin) # inverse of the roughness
+    self.c = self.fit(es) # coefficients of the energies
+    if operator is not None: # also interpolate the expectation values
+      def ev(v,k):
+        if callable(operator): return [operator(w,k=k) for w in v.T]
+        else: return [algebra.braket_wAw(w,operator) for w in v.T]
+      ws = np.array([ev(v,k) for (v,k) in zip(vs,ks)]).real
+      self.cw = self.fit(ws) # coefficients of the weights
+    else: self.cw = None
+  def fit(self,fs):
+    """Coefficients of the Fourier series of the functions in the
+    coarse mesh, fs has shape (nk**dim,nfunctions)"""
+    dim,nk = self.dimensionality,self.nk
+    shape = tuple([nk]*dim) # shape of the mesh
+    n = nk**dim # number of points
+    im = tuple((self.rs%nk).T) # index of each vector in the mesh
+    g = np.zeros(shape) # sum of the weights folded in the mesh
+    np.add.at(g,im,self.w)
+    fs = fs.reshape(shape+(fs.shape[1],)) # in mesh form
+    ft = np.fft.fftn(fs,axes=tuple(range(dim))) # Fourier transform
+    return self.w[:,None]*ft[im]/(n*g[im][:,None]) # coefficients
+  def evaluate(self,c,ks,nchunk=2000):
+    """Evaluate a Fourier series in a list of k-points"""
+    dim = self.dimensionality
+    ks = np.array([np.array(k)[0:dim] for k in ks]) # k-points as array
+    out = [] # output
+    for i in range(0,len(ks),nchunk): # loop over chunks
+      ph = np.exp(2j*np.pi*ks[i:i+nchunk]@self.rs.T) # phases
+      out.append((ph@c).real) # evaluate
+    return np.concatenate(out)
+  def evaluate_mesh(self,c,nk):
+    """Evaluate a Fourier series in a uniform mesh with nk points
+    in each direction, ordered as in klist.kmesh"""
+    dim = self.dimensionality
+    shape = tuple([nk]*dim) # shape of the mesh
+    im = tuple((self.rs%nk).T) # fold the vectors in the mesh
+    cm = np.zeros(shape+(c.shape[1],),dtype=complex) # coefficients
+    np.add.at(cm,im,c)
+    out = np.fft.ifftn(cm,axes=tuple(range(dim)))*nk**dim # evaluate
+    return out.real.reshape((nk**dim,c.shape[1]))
+  def get_energies(self,ks):
+    """Energies in a list of k-points"""
+    return self.evaluate(self.c,ks)
+  def get_weights(self,ks):
+    """Expectation value of the operator in a list of k-points"""
+    if self.cw is None: raise
+    return self.evaluate(self.cw,ks)
+  def get_velocities(self,ks):
+    """Derivative of the energies with respect to the k-point, in
+    reduced coordinates, with shape (len(ks),nbands,dimensionality)"""
+    vs = [self.evaluate(2j*np.pi*self.rs[:,i][:,None]*self.c,ks)
+            for i in range(self.dimensionality)]
+    return np.transpose(np.array(vs),(1,2,0))
+  def get_mesh_energies(self,nk):
+    """Energies in a dense uniform mesh"""
+    return self.evaluate_mesh(self.c,nk)
+  def get_mesh_weights(self,nk):
+    """Expectation value of the operator in a dense uniform mesh"""
+    if self.cw is None: raise
+    return self.evaluate_mesh(self.cw,nk)
+
+
+
+def interpolated_dos(h,energies=np.linspace(-1.,1.,200),nk=10,
+        nkdense=100,delta=None,operator=None,**kwargs):
+  """DOS using the interpolated bands in a dense mesh. If delta is None
+  the linear tetrahedron method is used, otherwise a broadening"""
+  bi = BandInterpolator(h,nk=nk,operator=operator,**kwargs) # interpolator
+  es = bi.get_mesh_energies(nkdense) # energies in the dense mesh
+  if operator is None: ws = None
+  else: ws = bi.get_mesh_weights(nkdense) # weights in the dense mesh
+  if delta is None: # tetrahedron method
+    from . import tetrahedron
+    eo,wo = tetrahedron.simplex_energies(es,h.dimensionality,nkdense,ws=ws)
+    return tetrahedron.tetrahedron_dos(eo,energies,bi.nbands,fs=wo)
+  else: # broadening
+    from ..dos import calculate_dos
+    if ws is not None: ws = ws.reshape(-1)
+    ys = calculate_dos(es.reshape(-1),np.array(energies),delta,w=ws)
+    return ys/(np.pi*nkdense**h.dimensionality)
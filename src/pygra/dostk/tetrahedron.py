@@ -0,0 +1,281 @@
+from __future__ import print_function
+import numpy as np
+from .. import algebra
+from .. import parallel
+from ..klist import kmesh
+
+# Linear tetrahedron (3d), triangle (2d) and segment (1d) integration
+# in uniform k-meshes. The bands are linearly interpolated inside each
+# simplex, so that DOS and integrated DOS are computed analytically.
+# Simplices whose energies span less than a tolerance (flat bands) are
+# treated as a delta function: they are a step in the integrated DOS and
+# do not contribute to the DOS, since the formulas divide by the
+# differences of the corner energies
+
+degeneracy_tol = 1e-8 # energy width of the flat simplices
+
+
+def cell_simplices(dim):
+  """Corners of the simplices in which a unit cell of the mesh is split,
+  as integer offsets"""
+  if dim==1: return [[(0,),(1,)]]
+  elif dim==2: # two triangles per square
+    return [[(0,0),(1,0),(1,1)],[(0,0),(0,1),(1,1)]]
+  elif dim==3: # six tetrahedra per cube, sharing the main diagonal
+    paths = [[(1,0,0),(1,1,0)],[(1,0,0),(1,0,1)],[(0,1,0),(1,1,0)],
+             [(0,1,0),(0,1,1)],[(0,0,1),(1,0,1)],[(0,0,1),(0,1,1)]]
+    return [[(0,0,0)] + p + [(1,1,1)] for p in paths]
+  else: raise
+
+
+
+def get_simplices(dim,nk):
+  """Return an array with the indexes of the k-points (as given by
+  kmesh) forming each simplex of the periodic mesh"""
+  def index(ii): # flat index of a mesh point
+    out = 0
+    for i in ii: out = out*nk + (i%nk) # periodic
+    return out
+  cs = cell_simplices(dim) # simplices of a cell
+  out = [] # empty list
+  for c in np.ndindex(*([nk]*dim)): # loop over cells
+    for s in cs: # loop over simplices
+      out.append([index(np.array(c)+np.array(p)) for p in s])
+  return np.array(out,dtype=int)
+
+
+
+def mesh_eigenvalues(h,nk=10,operator=None):
+  """Diagonalize the Hamiltonian in the uniform mesh, returns the
+  eigenvalues with shape (nk**dim,nbands) and the expectation value
+  of the operator (or None)"""
+  hkgen = h.get_hk_gen() # get generator
+  ks = kmesh(h.dimensionality,nk=nk) # uniform mesh
+  if type(operator)==str: operator = h.get_operator(operator)
+  def fun(k): # diagonalize in this k-point
+    hk = np.array(algebra.todense(hkgen(k))) # Hamiltonian
+    if operator is None: return algebra.eigvalsh(hk),None
+    es,ws = algebra.eigh(hk) # eigenvalues and eigenvectors
+    ws = ws.transpose() # eigenvectors as rows
+    if callable(operator): ps = [operator(w,k=k) for w in ws]
+    else: ps = [algebra.braket_wAw(w,operator) for w in ws]
+    return es,np.array(ps).real
+  out = parallel.pcall(fun,ks) # diagonalize all
+  es = np.array([o[0] for o in out]) # eigenvalues
+  if operator is None: return es,None
+  else: return es,np.array([o[1] for o in out])
+
+
+
+def simplex_energies(es,dim,nk,ws=None):
+  """Return the energies (and weights) in the corners of each simplex,
+  for each band, with the energies sorted inside each simplex"""
+  s = get_simplices(dim,nk) # simplices
+  eo = es[s] # shape (nsimplex,dim+1,nbands)
+  eo = np.transpose(eo,(0,2,1)).reshape((-1,dim+1)) # (nsimplex*nbands,dim+1)
+  ii = np.argsort(eo,axis=1) # sort the corners
+  eo = np.take_along_axis(eo,ii,axis=1)
+  if ws is None: return eo,None
+  wo = np.transpose(ws[s],(0,2,1)).reshape((-1,dim+1))
+  wo = np.take_along_axis(wo,ii,axis=1)
+  return eo,wo
+
+
+
+def edge(e,es,fs,i,j):
+  """Value of f in the edge (i,j) where the energy is e"""
+  t = (e - es[:,i])/(es[:,j] - es[:,i]) # position in the edge
+  return fs[:,i] + t*(fs[:,j] - fs[:,i])
+
+
+
+# standard simplex used for the cross sections of tetrahedra, the
+# ratio of areas is invariant under the affine transformations
+corners3d = np.array([[0.,0.,0.],[1.,0.,0.],[0.,1.,0.],[0.,0.,1.]])
+
+
+def quad_average(e,es,fs):
+  """Average of f in the cross section of the tetrahedra when it
+  is a quadrilateral (e2<e<e3)"""
+  cuts = [(0,2),(0,3),(1,3),(1,2)] # cyclic order
+  ps,vs = [],[] # positions and values
+  for (i,j) in cuts:
+    t = ((e - es[:,i])/(es[:,j] - es[:,i]))[:,None] # position in the edge
+    ps.append(corners3d[i] + t*(corners3d[j] - corners3d[i]))
+    vs.append(edge(e,es,fs,i,j))
+  a1 = np.linalg.norm(np.cross(ps[1]-ps[0],ps[2]-ps[0]),axis=1) # area
+  a2 = np.linalg.norm(np.cross(ps[2]-ps[0],ps[3]-ps[0]),axis=1) # area
+  f1 = (vs[0] + vs[1] + vs[2])/3. # average first triangle
+  f2 = (vs[0] + vs[2] + vs[3])/3. # average second triangle
+  a = a1 + a2 # total area
+  a[a==0.] = 1. # degenerate cross section, where the DOS is zero
+  return (a1*f1 + a2*f2)/a
+
+
+
+def split_flat(es,tol=None):
+  """Mask of the simplices that are not flat"""
+  if tol is None: tol = degeneracy_tol
+  return (es[:,-1] - es[:,0])>=tol
+
+
+
+def simplex_dos_energy(e,es,fs=None,tol=None):
+  """DOS at energy e, each simplex has measure one. If fs is
+  given, the DOS is weighted with the linear interpolation of fs"""
+  dim = es.shape[1] - 1 # dimensionality
+  out = 0. # initialize
+  ok = split_flat(es,tol=tol) # remove the flat simplices
+  if not np.all(ok):
+    es = es[ok]
+    if fs is not None: fs = fs[ok]
+  if dim==1:
+    m = (es[:,0]<e) & (e<es[:,1]) ; s = es[m] # crossing segments
+    g = 1./(s[:,1]-s[:,0]) # DOS
+    if fs is not None: g = g*edge(e,s,fs[m],0,1)
+    return np.sum(g)
+  elif dim==2:
+    m = (es[:,0]<e) & (e<es[:,1]) ; s = es[m] # first branch
+    e21,e31 = s[:,1]-s[:,0],s[:,2]-s[:,0]
+    g = 2.*(e-s[:,0])/(e21*e31) # DOS
+    if fs is not None: g = g*(edge(e,s,fs[m],0,1)+edge(e,s,fs[m],0,2))/2.
+    out += np.sum(g)
+    m = (es[:,1]<=e) & (e<es[:,2]) ; s = es[m] # second branch
+    e31,e32 = s[:,2]-s[:,0],s[:,2]-s[:,1]
+    g = 2.*(s[:,2]-e)/(e31*e32) # DOS
+    if fs is not None: g = g*(edge(e,s,fs[m],0,2)+edge(e,s,fs[m],1,2))/2.
+    out += np.sum(g)
+    return out
+  elif dim==3:
+    m = (es[:,0]<e) & (e<es[:,1]) ; s = es[m] # first branch
+    e21,e31,e41 = s[:,1]-s[:,0],s[:,2]-s[:,0],s[:,3]-s[:,0]
+    g = 3.*(e-s[:,0])**2/(e21*e31*e41) # DOS
+    if fs is not None:
+      fm = fs[m]
+      g = g*(edge(e,s,fm,0,1)+edge(e,s,fm,0,2)+edge(e,s,fm,0,3))/3.
+    out += np.sum(g)
+    m = (es[:,1]<=e) & (e<es[:,2]) ; s = es[m] # second branch
+    e21,e31,e41 = s[:,1]-s[:,0],s[:,2]-s[:,0],s[:,3]-s[:,0]
+    e32,e42 = s[:,2]-s[:,1],s[:,3]-s[:,1]
+    x = e - s[:,1]
+    g = (3.*e21 + 6.*x - 3.*(e31+e42)*x**2/(e32*e42))/(e31*e41) # DOS
+    if fs is not None: g = g*quad_average(e,s,fs[m])
+    out += np.sum(g)
+    m = (es[:,2]<=e) & (e<es[:,3]) ; s = es[m] # third branch
+    e41,e42,e43 = s[:,3]-s[:,0],s[:,3]-s[:,1],s[:,3]-s[:,2]
+    g = 3.*(s[:,3]-e)**2/(e41*e42*e43) # DOS
+    if fs is not None:
+      fm = fs[m]
+      g = g*(edge(e,s,fm,0,3)+edge(e,s,fm,1,3)+edge(e,s,fm,2,3))/3.
+    out += np.sum(g)
+    return out
+  else: raise
+
+
+
+def simplex_idos_energy(e,es,tol=None):
+  """Integrated DOS up to energy e, each simplex has measure one"""
+  dim = es.shape[1] - 1 # dimensionality
+  ok = split_flat(es,tol=tol) # flat simplices are a step
+  out = float(np.sum(np.mean(es[~ok],axis=1)<=e))
+  es = es[ok]
+  out += float(np.sum(es[:,dim]<=e)) # fully occupied simplices
+  if dim==1:
+    m = (es[:,0]<e) & (e<es[:,1]) ; s = es[m]
+    out += np.sum((e-s[:,0])/(s[:,1]-s[:,0]))
+  elif dim==2:
+    m = (es[:,0]<e) & (e<es[:,1]) ; s = es[m]
+    out += np.sum((e-s[:,0])**2/((s[:,1]-s[:,0])*(s[:,2]-s[:,0])))
+    m = (es[:,1]<=e) & (e<es[:,2]) ; s = es[m]
+    out += np.sum(1. - (s[:,2]-e)**2/((s[:,2]-s[:,0])*(s[:,2]-s[:,1])))
+  elif dim==3:
+    m = (es[:,0]<e) & (e<es[:,1]) ; s = es[m]
+    e21,e31,e41 = s[:,1]-s[:,0],s[:,2]-s[:,0],s[:,3]-s[:,0]
+    out += np.sum((e-s[:,0])**3/(e21*e31*e41))
+    m = (es[:,1]<=e) & (e<es[:,2]) ; s = es[m]
+    e21,e31,e41 = s[:,1]-s[:,0],s[:,2]-s[:,0],s[:,3]-s[:,0]
+    e32,e42 = s[:,2]-s[:,1],s[:,3]-s[:,1]
+    x = e - s[:,1]
+    out += np.sum((e21**2 + 3.*e21*x + 3.*x**2
+                     - (e31+e42)*x**3/(e32*e42))/(e31*e41))
+    m = (es[:,2]<=e) & (e<es[:,3]) ; s = es[m]
+    e41,e42,e43 = s[:,3]-s[:,0],s[:,3]-s[:,1],s[:,3]-s[:,2]
+    out += np.sum(1. - (s[:,3]-e)**3/(e41*e42*e43))
+  else: raise
+  return out
+
+
+
+def get_nsimplex(es,nbands):
+  """Number of simplices (per band)"""
+  return es.shape[0]//nbands
+
+
+
+def tetrahedron_dos(es,energies,nbands,fs=None):
+  """DOS per unit cell, using the energies of the simplices"""
+  ns = get_nsimplex(es,nbands) # number of simplices
+  return np.array([simplex_dos_energy(e,es,fs=fs) for e in energies])/ns
+
+
+
+def tetrahedron_idos(es,energies,nbands):
+  """Integrated DOS per unit cell"""
+  ns = get_nsimplex(es,nbands) # number of simplices
+  return np.array([simplex_idos_energy(e,es) for e in energies])/ns
+
+
+
+def tetrahedron_fermi(es,nbands,filling=0.5,tol=1e-10):
+  """Fermi energy for a certain filling (fraction of occupied bands),
+  by bisection of the integrated DOS"""
+  ns = get_nsimplex(es,nbands) # number of simplices
+  target = filling*nbands # number of electrons per cell
+  e0,e1 = np.min(es),np.max(es) # limits
+  while e1-e0>tol: # bisection
+    e = (e0+e1)/2.
+    if simplex_idos_energy(e,es)/ns<target: e0 = e
+    else: e1 = e
+  return (e0+e1)/2.
+
+
+
+def tetrahedron_band_energy(es,nbands,fermi=0.0,ne=4000):
+  """Band energy per unit cell of the states below the Fermi energy,
+  computed as E_F N(E_F) - int N(E) dE"""
+  emin = np.min(es) # minimum energy
+  if fermi<=emin: return 0.0
+  xs = np.linspace(emin,fermi,ne) # energies
+  ys = tetrahedron_idos(es,xs,nbands) # integrated DOS
+  return fermi*ys[-1] - np.trapz(ys,xs)
+
+
+
+def get_simplex_data(h,nk=10,operator=None):
+  """Diagonalize in the mesh and return the energies (and weights)
+  of the simplices and the number of bands"""
+  if h.dimensionality not in [1,2,3]: raise
+  es,ws = mesh_eigenvalues(h,nk=nk,operator=operator) # diagonalize
+  eo,wo = simplex_energies(es,h.dimensionality,nk,ws=ws)
+  return eo,wo,es.shape[1]
+
+
+
+def dos(h,energies=np.linspace(-1.,1.,200),nk=10,operator=None):
+  """DOS with the tetrahedron method"""
+  eo,wo,nb = get_simplex_data(h,nk=nk,operator=operator)
+  return tetrahedron_dos(eo,energies,nb,fs=wo)
+
+
+
+def idos(h,energies=np.linspace(-1.,1.,200),nk=10):
+  """Integrated DOS with the tetrahedron method"""
+  eo,wo,nb = get_simplex_data(h,nk=nk)
+  return tetrahedron_idos(eo,energies,nb)
+
+
+
+def fermi_energy(h,filling=0.5,nk=10):
+  """Fermi energy with the tetrahedron method"""
+  eo,wo,nb = get_simplex_data(h,nk=nk)
+  return tetrahedron_fermi(eo,nb,filling=filling)
@@ -11,8 +11,14 @@ import scipy.linalg as lg
 
 def dos_impurity(h,vc=None,energies=np.linspace(-.5,.5,20),
                    mode="adaptive",delta=0.01,nk=50,silent=True,
-                   use_generator=False):
-  """ Calculates the green function using the embedding technique"""
+                   use_generator=False,adaptive=False,solver="inverse",
+                   **kwargs):
+  """ Calculates the green function using the embedding technique.
+  If adaptive is True, energies is the initial grid, which is refined
+  where the DOS changes rapidly (kwargs go to the adaptive sampler) and
+  the energies are also returned. With solver="tmatrix", the defect
+  is treated as a perturbation in the orbitals where vc differs from
+  the pristine cell, see greentk.tmatrix"""
   if vc is None: vc = h.intra  # assume perfect
   iden = np.identity(h.intra.shape[0],dtype=np.complex)
   if use_generator:
@@ -30,10 +36,39 @@ def dos_impurity(h,vc=None,energies=np.linspace(-.5,.5,20),
     dv = -np.trace(gv).imag  # save DOS of the defected
     if not silent: print("Done",energy)
     return [d,dv]
-  out = np.array(parallel.pcall(pfun,energies)) # compute
+  if solver=="tmatrix": # low rank perturbation
+    from .greentk import tmatrix
+    v = algebra.todense(vc) - algebra.todense(h.intra) # perturbation
+    sites = tmatrix.support(v) # orbitals of the defect
+    vs = tmatrix.restrict(v,sites)
+    if use_generator: # only the needed blocks of the Green function
+      from .greentk.spectral import SpectralGreen
+      sg = SpectralGreen(h,nk=nk)
+      deltag = 2./nk # same broadening as green_generator
+      def get_blocks(energy):
+        gcol = sg.get_block([energy],cols=sites,delta=deltag)[0]
+        grow = sg.get_block([energy],rows=sites,delta=deltag)[0]
+        return sg.get_trace([energy],delta=deltag)[0],gcol,grow
+    else:
+      def get_blocks(energy):
+        g = np.array(get_green(energy)[0])
+        return np.trace(g),g[:,sites],g[sites,:]
+    def pfun(energy): # function to parallelize
+      tr,gcol,grow = get_blocks(energy)
+      t = tmatrix.tmatrix(gcol[sites,:],vs) # T-matrix
+      d = -tr.imag  # save DOS of the pristine
+      dv = d - tmatrix.correction_trace(gcol,t,grow).imag # defected
+      if not silent: print("Done",energy)
+      return [d,dv]
+  if adaptive: # non uniform grid
+    from .greentk.energygrid import adaptive_grid
+    energies,out = adaptive_grid(lambda es: parallel.pcall(pfun,es),
+                                   energies,**kwargs)
+  else: out = np.array(parallel.pcall(pfun,energies)) # compute
   ds,dsv = out[:,0],out[:,1] # get the different data
   np.savetxt("DOS_PRISTINE.OUT",np.array([energies,ds]).T)
   np.savetxt("DOS_DEFECTIVE.OUT",np.array([energies,dsv]).T)
+  if adaptive: return energies,ds,dsv
   return ds,dsv # return object
 
 
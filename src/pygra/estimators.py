@@ -21,7 +21,7 @@ def kmesh_density(h,nk=20,delta=0.01):
       xout.append(x)
       yout.append(y)
   # now create the function that interpolates
-  import interpolation
+  from . import interpolation
   f = interpolation.interpolator2d(xout,yout,out) # interpolator function
   # now define a function that returns a probability density
   def fout(k):
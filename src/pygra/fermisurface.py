@@ -15,8 +15,9 @@ arpack_maxiter = 10000
 def multi_fermi_surface(h,write=True,output_folder="MULTIFERMISURFACE",
                     energies=[0.0],nk=50,nsuper=1,reciprocal=True,
                     delta=None,refine_delta=1.0,operator=None,
-                    numw=20,info=True):
-  """Calculates the Fermi surface of a 2d system"""
+                    numw=20,info=True,nkcoarse=None):
+  """Calculates the Fermi surface of a 2d system. If nkcoarse is given,
+  the bands are Fourier interpolated from a coarse mesh"""
   energies = np.array(energies) # convert to array
   if operator is not None: raise
   if h.dimensionality!=2: raise  # continue if two dimensional
@@ -52,7 +53,13 @@ def multi_fermi_surface(h,write=True,output_folder="MULTIFERMISURFACE",
   from . import parallel
   kxout = rs[:,0] # x coordinate
   kyout = rs[:,1] # y coordinate
-  if parallel.cores==1: # serial execution
+  if nkcoarse is not None: # interpolated bands
+      from .dostk.fourierbands import BandInterpolator
+      bi = BandInterpolator(h,nk=nkcoarse) # interpolator
+      ess = bi.get_energies([fR(r) for r in rs]) # all the energies
+      kdos = [[np.sum(delta/((e-es)**2+delta**2)) for e in energies]
+                for es in ess] # weights
+  elif parallel.cores==1: # serial execution
       kdos = [] # empty list
       for r in rs: # loop
         if info: print("Doing",r)
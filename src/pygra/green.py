@@ -129,11 +129,9 @@ def dos_semiinfinite(intra,inter,energies=np.linspace(-1.0,1.0,100),num_rep=100,
                       mixing=0.7,eps=0.0001,green_guess=None,max_error=0.0001):
    """ Calculates the surface density of states by using a 
     green function approach"""
-   dos = [] # list with the density of states
-   for energy in energies: # loop over energies
-#     gf = dyson(intra,inter,energy=energy,num_rep=num_rep,mixing=mixing,
-     gb,gf = green_renormalization(intra,inter,energy=energy,delta=delta)
-     dos.append(-gf.trace()[0,0].imag)  # calculate the trace of the Green function
+   gb,gf = green_renormalization_multienergy(intra,inter,energies=energies,
+                                               delta=eps)
+   dos = -np.trace(gf,axis1=1,axis2=2).imag # trace of the Green functions
    return energies,dos
 
 
@@ -271,13 +269,14 @@ def read_sparse(f,sparse=True):
 
 
 def gauss_inverse(m,i=0,j=0,test=False):
-  try: from .gauss_invf90 import gauss_inv as ginv
-  except: 
-    test = True # Ups, this might blow up
   """ Calculates the inverso of a block diagonal
       matrix """
   if test: # check whether the inversion worked 
     return block_inverse(m,i=i,j=j)
+  try: from .gauss_invf90 import gauss_inv as ginv
+  except: # use the recursive Green function
+    from .greentk.rgf import rgf_inverse
+    return rgf_inverse(m,i=i,j=j)
   nb = len(m) # number of blocks
   ca = [None for ii in range(nb)]
   ua = [None for ii in range(nb-1)]
@@ -362,6 +361,66 @@ def green_renormalization(intra,inter,energy=0.0,nite=None,
 
 
 
+def green_lead(intra,inter,energy=0.0,delta=0.001,mode="renormalization",
+                 **kwargs):
+  """ Bulk and surface Green functions of a lead, either by the iterative
+  renormalization or from the modes of the lead (exact, also for
+  delta=0) """
+  if mode=="renormalization":
+    return green_renormalization(intra,inter,energy=energy,delta=delta,
+                                   **kwargs)
+  elif mode=="modes":
+    from .greentk import leadmodes
+    return leadmodes.green_modes(intra,inter,energy=energy,delta=delta)
+  else: raise
+
+
+
+def green_renormalization_multienergy(intra,inter,energies=[0.0],
+                            error=None,info=False,delta=0.001,nite=None):
+  """ Calculates bulk and surface Green functions for several energies
+  at once, advancing the renormalization of all of them with stacked
+  linear solves. Energies that have converged are frozen. Returns two
+  arrays of shape (len(energies),n,n) """
+  if error is None: error = delta/100 # same as green_renormalization
+  n = intra.shape[0] # dimension
+  ez = np.array(energies) + 1j*delta # complex energies
+  e = ez[:,None,None]*np.identity(n) # energies times identity
+  ne = len(ez) # number of energies
+  def stack(m): # one copy for each energy
+    return np.zeros((ne,n,n),dtype=np.complex128) + np.array(algebra.todense(m))
+  alpha = stack(inter)
+  beta = stack(algebra.H(inter))
+  epsilon = stack(intra)
+  epsilon_s = epsilon.copy()
+  active = np.arange(ne) # energies not converged
+  ite = 0
+  while len(active)>0: # implementation of Eq 11
+    a,b = alpha[active],beta[active]
+    x = np.linalg.solve(e[active]-epsilon[active],
+                          np.concatenate([b,a],axis=2)) # einv@[beta,alpha]
+    eb,ea = x[:,:,0:n],x[:,:,n:] # einv@beta and einv@alpha
+    aeb = a@eb
+    epsilon_s[active] += aeb
+    epsilon[active] += aeb + b@ea
+    alpha[active] = a@ea  # new alpha
+    beta[active] = b@eb  # new beta
+    ite += 1
+    # stop conditions
+    if nite is not None:
+      if ite > nite: break
+    else:
+      err = np.maximum(np.max(np.abs(alpha[active]),axis=(1,2)),
+                         np.max(np.abs(beta[active]),axis=(1,2)))
+      active = active[err>=error] # remove the converged ones
+  if info:
+    print("Converged in ",ite,"iterations")
+  g_surf = np.linalg.inv(e - epsilon_s) # surface green function
+  g_bulk = np.linalg.inv(e - epsilon)  # bulk green function
+  return g_bulk,g_surf
+
+
+
 def bloch_selfenergy(h,nk=100,energy = 0.0, delta = 0.01,mode="full",
                          error=0.00001):
   """ Calculates the selfenergy of a cell defect,
@@ -380,19 +439,16 @@ def bloch_selfenergy(h,nk=100,energy = 0.0, delta = 0.01,mode="full",
   g = h.intra *0.0j # initialize green function
   e = np.matrix(np.identity(len(g)))*(energy + delta*1j) # complex energy
   if mode=="full":  # full integration
-    if d==1: # one dimensional
-      ks = [[k,0.,0.] for k in np.linspace(0.,1.,nk,endpoint=False)]
-    elif d==2: # two dimensional
-      ks = []
-      kk = np.linspace(0.,1.,nk,endpoint=False)  # interval 0,1
-      for ikx in kk:
-        for iky in kk:
-          ks.append([ikx,iky,0.])
-      ks = np.array(ks)  # all the kpoints
-    else: raise # raise error
-    for k in ks:  # loop in BZ
-      g += (e - hk_gen(k)).I  # add green function  
-    g = g/len(ks)  # normalize
+    from . import klist
+    ks = klist.kmesh(d,nk=nk) # all the kpoints
+    from .greentk.spectral import memory_budget
+    n = len(g) # dimension
+    nc = max([1,int(memory_budget//(2*16*n*n))]) # k-points in each chunk
+    g = np.zeros((n,n),dtype=np.complex128)
+    for i in range(0,len(ks),nc): # batched inversion in chunks
+      hks = np.array([algebra.todense(hk_gen(k)) for k in ks[i:i+nc]])
+      g += np.sum(np.linalg.inv(np.array(e) - hks),axis=0)
+    g = np.matrix(g/len(ks)) # normalize
   #####################################################
   #####################################################
   if mode=="renormalization":
@@ -451,11 +507,13 @@ def get1dhamiltonian(hin,k=[0.0,0.,0.],reverse=False):
 
 
 def green_kchain(h,k=0.,energy=0.,delta=0.01,only_bulk=True,
-                    error=0.0001,hs=None,reverse=False):
+                    error=0.0001,hs=None,reverse=False,mode="renormalization"):
   """ Calculates the green function of a kdependent chain for a 2d system """
   def gr(ons,hop):
     """ Calculates G by renormalization"""
-    gf,sf = green_renormalization(ons,hop,energy=energy,nite=None,
+    if mode=="modes": gf,sf = green_lead(ons,hop,energy=energy,
+                            delta=delta,mode=mode)
+    else: gf,sf = green_renormalization(ons,hop,energy=energy,nite=None,
                             error=error,info=False,delta=delta)
     if hs is not None: # surface matrix provided
       ez = (energy+1j*delta)*np.identity(h.intra.shape[0]) # energy
@@ -524,6 +582,25 @@ def green_kchain_evaluator(h,k=0.,delta=0.01,only_bulk=True,
 
 
 
+def green_kchain_multienergy(h,k=0.,energies=[0.0],delta=0.01,
+                    only_bulk=True,error=0.0001,hs=None,reverse=False):
+  """ Same as green_kchain_evaluator, for all the energies at once,
+  returning arrays of shape (len(energies),n,n) """
+  (ons,hop) = get1dhamiltonian(h,k,reverse=reverse) # get 1D Hamiltonian
+  gf,sf = green_renormalization_multienergy(ons,hop,energies=energies,
+                                   delta=delta,error=error)
+  if hs is not None: # surface matrix provided
+    ez = (np.array(energies)+1j*delta)[:,None,None]*np.identity(ons.shape[0])
+    hop = np.array(algebra.todense(hop))
+    sigma = hop@sf@algebra.H(hop) # selfenergy
+    if callable(hs): ons2 = ons + hs(k)
+    else: ons2 = ons + hs
+    sf = np.linalg.inv(ez - np.array(algebra.todense(ons2)) - sigma) # Dyson
+  if only_bulk:  return gf
+  else:  return gf,sf
+
+
+
 def interface(h1,h2,k=[0.0,0.,0.],energy=0.0,delta=0.01):
   """Get the Green function of an interface"""
   from scipy.sparse import csc_matrix as csc
@@ -587,28 +664,25 @@ def interface_multienergy(h1,h2,k=[0.0,0.,0.],energies=[0.0],delta=0.01,
 
 def surface_multienergy(h1,k=[0.0,0.,0.],energies=[0.0],**kwargs):
   """Get the Green function of an interface"""
-  from scipy.sparse import csc_matrix as csc
-  from scipy.sparse import bmat
-  fun1 = green_kchain_evaluator(h1,k=k,
+  gs1,sf1 = green_kchain_multienergy(h1,k=k,energies=energies,
                    only_bulk=False,reverse=True,
-                   **kwargs) # surface green function 
-  out = [] # output
-  for energy in energies: # loop
-    gs1,sf1 = fun1(energy)
-    out.append([sf1,gs1])
-  return out # return output
-
-
-
-
-
-
-
-
-
+                   **kwargs) # surface green functions
+  return [[np.matrix(s),np.matrix(g)] for (s,g) in zip(sf1,gs1)]
 
 
 
+def surface_dos_adaptive(h1,k=[0.0,0.,0.],energies=np.linspace(-1.,1.,20),
+                           delta=0.01,hs=None,**kwargs):
+  """Surface and bulk DOS of a k-chain in an adaptive energy grid,
+  starting from energies. Returns the energies and an array with the
+  surface and bulk DOS"""
+  from .greentk.energygrid import adaptive_grid
+  def f(es): # DOS for a batch of energies
+    gs,sf = green_kchain_multienergy(h1,k=k,energies=es,delta=delta,hs=hs,
+                   only_bulk=False,reverse=True) # Green functions
+    return -np.array([np.trace(sf,axis1=1,axis2=2).imag,
+                        np.trace(gs,axis1=1,axis2=2).imag]).T
+  return adaptive_grid(f,energies,**kwargs)
 
 
 
@@ -668,46 +742,16 @@ def supercell_selfenergy(h,e=0.0,delta=0.001,nk=100,nsuper=[1,1]):
 
 
 
-def green_generator(h,nk=20):
+def green_generator(h,nk=20,**kwargs):
   """Returns a function capable of calculating the Green function
-  at a certain energy, by explicity summing the k-dependent Green functions"""
-  if h.dimensionality != 2: raise # only for 2d
-  shape = h.intra.shape # shape
-  hkgen = h.get_hk_gen() # get the Hamiltonian generator
-  wfs = np.zeros((nk*nk,shape[0],shape[0]),dtype=np.complex) # allocate vector
-  es = np.zeros((nk*nk,shape[0])) # allocate vector, energies
-  ks = np.zeros((nk*nk,2)) # allocate vector, energies
-  ii = 0 # counter
-  for ik in np.linspace(0.,1.,nk,endpoint=False): # loop
-    for jk in np.linspace(0.,1.,nk,endpoint=False): # loop
-      estmp,wfstmp = lg.eigh(hkgen([ik,jk])) # get eigens
-#      estmp,wfstmp = lg.eigh(hkgen(np.random.random(2))) # get eigens
-      es[ii,:] = estmp.copy() # copy
-      ks[ii,:] = np.array([ik,jk]) # store
-      wfs[ii,:,:] = wfstmp.transpose().copy() # copy
-      ii += 1 # increase counter
-  # All the wavefunctions have been calculate
-  # Now create the output function
-  from scipy.integrate import simps
+  at a certain energy, by explicity summing the k-dependent Green functions.
+  The Hamiltonian is diagonalized only once, see greentk.spectral"""
+  from .greentk.spectral import SpectralGreen
+  sg = SpectralGreen(h,nk=nk,**kwargs) # diagonalize in all the k-points
   def getgreen(energy,delta=0.001):
     """Return the Green function"""
     delta = 2./nk
-#    store = np.zeros((nk*nk,shape),dtype=np.complex) # storage array
-    zero = np.matrix(np.zeros(shape),dtype=np.complex) # zero matrix
-    for ii in range(nk*nk): # loop over kpoints
-      v = energy + delta*1j - es[ii,:] # array
-      C = np.matrix(np.diag(1./v)) # matrix
-      A = np.matrix(wfs[ii,:,:]) # get the matrix with wavefunctions
-#      store[ii,:,:] = A.H*C*A # store contribution
-      zero += A.H@C@A # add contribution
-#    for i in range(shape[0]): # loop 
-#      for j in range(shape[0]): # loop 
-#        m = store[:,i,j].reshape((nk,nk)) # transform into a grid
-#        zero[i,j] =  # normalize
-    zero /= nk*nk # normalize
-    ediag = np.matrix(np.identity(shape[0]))*(energy + delta*1j)
-    selfenergy = ediag - h.intra - zero.I
-    return zero,selfenergy
+    return sg.get_selfenergy(energy,delta=delta)
   return getgreen # return function
 
 
@@ -721,14 +765,12 @@ def green_operator(h0,operator,e=0.0,delta=1e-3,nk=10):
     from . import klist
     ks = klist.kmesh(h.dimensionality,nk=nk) # klist
     out = 0.0 # output
-    if callable(operator): # callable operator
-      for k in ks: # loop over kpoints
-        hk = hkgen(k) # Hamiltonian
-        o0 = lg.inv(iden*(e+1j*delta) - hk) # Green's function
-        if callable(operator): o1 = operator(k)
-        else: o1 = operator
-        out += -(o0@o1).trace().imag # Add contribution
-      out /= len(ks) # normalize
+    if callable(operator) or not np.isscalar(e): # spectral representation
+      from .greentk.spectral import SpectralGreen
+      sg = SpectralGreen(h,ks=ks) # diagonalize once
+      out = -sg.get_trace(np.array([e]).reshape(-1),delta=delta,
+                            operator=operator).imag
+      if np.isscalar(e): out = out[0]
     else:
       g = bloch_selfenergy(h,energy=e,delta=delta,mode="adaptive")[0] 
       out = -(np.array(g)@operator).trace().imag
@@ -0,0 +1,49 @@
+from __future__ import print_function,division
+import numpy as np
+
+# Adaptive sampling of spectra in energy. Starting from an initial grid,
+# the midpoint of each interval is computed and compared with the linear
+# interpolation between the extremes (a measure of the curvature). The
+# two halves of the intervals whose deviation is above the tolerance are
+# refined again, until they reach the minimum resolution or the budget
+# of points is exhausted, in which case the intervals with the largest
+# deviations are refined first
+
+
+def adaptive_grid(f,energies=np.linspace(-1.,1.,20),tol=None,dxmin=None,
+                    maxpoints=1000,batch=True,info=False):
+  """Sample the function f in a non uniform grid. If batch is True, f
+  takes an array of energies and returns the values in the first axis
+  (several quantities can be returned in further axes), otherwise it is
+  called for each energy. tol is the absolute tolerance (1e-3 times the
+  maximum value by default) and dxmin the smallest interval (1e-4 times
+  the energy window by default). Returns the energies and the values"""
+  def fs(es): # evaluate in a set of energies
+    if batch: return np.array(f(np.array(es)))
+    else: return np.array([f(e) for e in es])
+  es = np.array(energies,dtype=float) # initial grid
+  ys = fs(es) # initial values
+  if tol is None: tol = 1e-3*max([np.max(np.abs(ys)),1e-10])
+  if dxmin is None: dxmin = 1e-4*(np.max(es)-np.min(es))
+  # flags of the interval starting at each point (the last is a dummy)
+  refine = np.ones(len(es),dtype=bool) # intervals to refine
+  err = np.zeros(len(es)) + np.inf # error of each interval
+  while True:
+    width = np.diff(es) # length of the intervals
+    ii = np.where(refine[0:-1] & (width>2*dxmin))[0] # intervals to refine
+    nleft = maxpoints - len(es) # points left
+    if len(ii)==0 or nleft<=0: break
+    if len(ii)>nleft: ii = ii[np.argsort(-err[ii])[0:nleft]] # worst ones
+    em = (es[ii] + es[ii+1])/2. # midpoints
+    ym = fs(em) # new values
+    dev = np.abs(ym - (ys[ii] + ys[ii+1])/2.) # deviation from linear
+    dev = dev.reshape((len(ii),-1)).max(axis=1)
+    bad = dev>tol # both halves will be refined
+    refine[ii] = bad ; err[ii] = dev # first halves
+    # add the second halves and sort
+    es = np.concatenate([es,em]) ; ys = np.concatenate([ys,ym])
+    refine = np.concatenate([refine,bad]) ; err = np.concatenate([err,dev])
+    io = np.argsort(es,kind="stable") # order of the points
+    es,ys,refine,err = es[io],ys[io],refine[io],err[io]
+    if info: print("Adaptive grid with",len(es),"points")
+  return es,ys
@@ -0,0 +1,132 @@
+from __future__ import print_function,division
+import os
+import struct
+from collections import OrderedDict
+import numpy as np
+try:
+  import fcntl # file locks
+except ImportError: fcntl = None # no locks available
+
+# Storage of Green functions (or any array) computed at many energies, in
+# a single binary file. Each record is a fixed size header, with the
+# energy, dtype and shape, followed by the raw data, and records are only
+# appended. The index of energies is built by reading the headers, and it
+# is updated with the records written by other processes only when an
+# energy is not found. Appends are done holding an exclusive lock of the
+# file, so several workers of a pool can share the same store, and an
+# incomplete record (from an interrupted run) is removed before writing.
+# The last loaded arrays are kept in memory up to a certain size
+
+header = struct.Struct("<4sd8sq3q") # tag, energy, dtype, ndim, shape
+tag = b"GREN"
+
+
+def lock(f,exclusive=True):
+  """Lock a file"""
+  if fcntl is None: return
+  fcntl.flock(f.fileno(),fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+
+def unlock(f):
+  """Unlock a file"""
+  if fcntl is None: return
+  fcntl.flock(f.fileno(),fcntl.LOCK_UN)
+
+
+
+class GreenStore():
+  """Energy indexed storage of arrays in a single file"""
+  def __init__(self,filename,memory=2**26,tol=1e-8):
+    self.filename = filename
+    self.memory = memory # size of the in memory cache, in bytes
+    self.tol = tol # tolerance to match the energies
+    self.offset = 0 # bytes of the file already indexed
+    self.index = OrderedDict() # energy -> (offset,dtype,shape)
+    self.sorted = np.zeros(0) # sorted energies
+    self.cache = OrderedDict() # energy -> array
+    self.used = 0 # memory of the cache
+    if not os.path.exists(filename): open(filename,"ab").close()
+    self.refresh()
+  def scan(self,f):
+    """Read the headers of the new records, returning the end of the
+    last complete record"""
+    size = os.fstat(f.fileno()).st_size
+    f.seek(self.offset)
+    while self.offset + header.size<=size:
+      (t,e,dt,ndim,s0,s1,s2) = header.unpack(f.read(header.size))
+      if t!=tag: break # corrupted record
+      dt = np.dtype(dt.rstrip(b"\0").decode())
+      shape = (s0,s1,s2)[0:ndim]
+      nbytes = int(np.prod(shape))*dt.itemsize
+      start = self.offset + header.size # start of the data
+      if start + nbytes>size: break # incomplete record
+      if e not in self.index: self.index[e] = (start,dt,shape)
+      self.offset = start + nbytes
+      f.seek(self.offset)
+    self.sorted = np.array(sorted(self.index.keys()))
+    return self.offset
+  def refresh(self):
+    """Add the records written by other processes to the index"""
+    with open(self.filename,"rb") as f:
+      lock(f,exclusive=False) ; self.scan(f) ; unlock(f)
+  def find(self,energy):
+    """Stored energy that matches a certain energy, or None"""
+    if len(self.sorted)==0: return None
+    i = np.searchsorted(self.sorted,energy) # closest energies
+    for j in [i-1,i]:
+      if 0<=j<len(self.sorted) and abs(self.sorted[j]-energy)<=self.tol:
+        return self.sorted[j]
+    return None
+  def remember(self,energy,m):
+    """Store an array in memory, removing the oldest ones"""
+    if energy in self.cache: return
+    self.cache[energy] = m ; self.used += m.nbytes
+    while self.used>self.memory and len(self.cache)>0:
+      (e,mo) = self.cache.popitem(last=False)
+      self.used -= mo.nbytes
+  def load(self,energy):
+    """Array stored for a certain energy, or None"""
+    e = self.find(energy)
+    if e is None: # check the records of other processes
+      self.refresh()
+      e = self.find(energy)
+      if e is None: return None
+    if e in self.cache: # already in memory
+      self.cache.move_to_end(e)
+      return self.cache[e].copy()
+    (start,dt,shape) = self.index[e]
+    with open(self.filename,"rb") as f:
+      f.seek(start)
+      m = np.frombuffer(f.read(int(np.prod(shape))*dt.itemsize),dtype=dt)
+    m = m.reshape(shape)
+    self.remember(e,m)
+    return m.copy()
+  def save(self,energy,m):
+    """Append the array of a certain energy"""
+    m = np.ascontiguousarray(m)
+    if m.ndim>3: raise
+    shape = list(m.shape) + [0]*(3-m.ndim)
+    h = header.pack(tag,float(energy),m.dtype.str.encode(),m.ndim,*shape)
+    with open(self.filename,"r+b") as f:
+      lock(f,exclusive=True)
+      end = self.scan(f) # index the records of other processes
+      if self.find(energy) is None: # not written by another process
+        f.truncate(end) # remove an incomplete record
+        f.seek(end)
+        f.write(h + m.tobytes()) ; f.flush()
+        self.scan(f) # index the new record
+      unlock(f)
+    if self.find(energy)==float(energy): self.remember(float(energy),m.copy())
+  def get(self,fun,energy):
+    """Array at a certain energy, computed with fun if not stored"""
+    m = self.load(energy)
+    if m is None:
+      m = np.array(fun(energy))
+      self.save(energy,m)
+    return m
+  def energies(self):
+    """Stored energies"""
+    self.refresh()
+    return self.sorted.copy()
+  def __len__(self): return len(self.index)
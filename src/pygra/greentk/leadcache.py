@@ -0,0 +1,124 @@
+from __future__ import print_function,division
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from .. import algebra
+
+# Cache and interpolation of the surface Green functions of the leads.
+# The surface Green function only depends on the matrices of the lead,
+# the energy and delta, so it is stored with a key built from a hash of
+# the lead matrices (which for k-dependent leads also identifies k).
+# Several heterostructures with the same leads, and the different
+# transport functions, share the same lead calculations.
+# LeadInterpolator fits the surface Green function with Chebyshev
+# polynomials in energy intervals, which are bisected until the last
+# coefficients of the fit are below a tolerance. The intervals close to
+# band edges, where the Green function is not smooth, are refined
+
+use_cache = True # use the cache by default
+memory_budget = 2**28 # maximum memory of the cache, in bytes
+_cache = OrderedDict() # stored Green functions
+_memory = [0] # memory used
+
+
+def fingerprint(*ms):
+  """Hash of several matrices"""
+  h = hashlib.sha1()
+  for m in ms:
+    m = np.ascontiguousarray(algebra.todense(m)) # dense array
+    h.update(str((m.shape,m.dtype)).encode()) ; h.update(m)
+  return h.hexdigest()
+
+
+
+def clear():
+  """Remove all the stored Green functions"""
+  _cache.clear() ; _memory[0] = 0
+
+
+
+def surface_green(intra,inter,energy=0.0,delta=0.001,mode="renormalization",
+                    key=None):
+  """Surface Green function of a lead, using the cache"""
+  from ..green import green_lead
+  if not use_cache: # compute it
+    return green_lead(intra,inter,energy=energy,delta=delta,mode=mode)[1]
+  if key is None: key = fingerprint(intra,inter) # key of the lead
+  k = (key,float(energy),float(delta),mode) # key of this calculation
+  if k in _cache: # already computed
+    _cache.move_to_end(k) # recently used
+    return _cache[k]
+  g = green_lead(intra,inter,energy=energy,delta=delta,mode=mode)[1]
+  _cache[k] = g ; _memory[0] += g.nbytes # store
+  while _memory[0]>memory_budget and len(_cache)>1: # remove the oldest
+    (ko,go) = _cache.popitem(last=False)
+    _memory[0] -= go.nbytes
+  return g
+
+
+
+def chebyshev_fit(fs):
+  """Chebyshev coefficients from the values in the Chebyshev nodes,
+  fs has the nodes in the first axis"""
+  p = fs.shape[0] # number of nodes
+  th = np.pi*(np.arange(p) + 0.5)/p # angles of the nodes
+  c = 2./p*np.tensordot(np.cos(np.outer(np.arange(p),th)),fs,axes=1)
+  c[0] /= 2.
+  return c
+
+
+
+class LeadInterpolator():
+  """Piecewise Chebyshev interpolation of the surface Green function
+  of a lead in an energy window"""
+  def __init__(self,intra,inter,emin=-4.0,emax=4.0,delta=0.001,tol=1e-4,
+                 npol=12,maxdepth=12,mode="renormalization"):
+    self.intra,self.inter = intra,inter
+    self.delta = delta
+    self.mode = mode
+    self.npol = npol # nodes in each interval
+    self.tol = tol # tolerance of the fit
+    self.intervals = [] # intervals
+    self.coefficients = [] # coefficients of each interval
+    queue = [(emin,emax,0)] # intervals to fit
+    while len(queue)>0:
+      (a,b,d) = queue.pop(0)
+      c = self.fit(a,b)
+      err = np.max(np.abs(c[-2:])) # estimated error
+      if err>tol*max([np.max(np.abs(c)),1.]) and d<maxdepth: # bisect
+        queue += [(a,(a+b)/2.,d+1),((a+b)/2.,b,d+1)]
+      else:
+        self.intervals.append((a,b)) ; self.coefficients.append(c)
+    ii = np.argsort([i[0] for i in self.intervals]) # sort the intervals
+    self.intervals = [self.intervals[i] for i in ii]
+    self.coefficients = [self.coefficients[i] for i in ii]
+    self.edges = np.array([i[0] for i in self.intervals])
+    self.emin,self.emax = emin,emax
+  def fit(self,a,b):
+    """Fit the Green function in an interval"""
+    p = self.npol
+    xs = np.cos(np.pi*(np.arange(p) + 0.5)/p) # nodes
+    es = (a+b)/2. + (b-a)/2.*xs # energies
+    if self.mode=="renormalization": # all the energies at once
+      from ..green import green_renormalization_multienergy
+      gs = green_renormalization_multienergy(self.intra,self.inter,
+                    energies=es,delta=self.delta)[1]
+    else: gs = np.array([surface_green(self.intra,self.inter,energy=e,
+                    delta=self.delta,mode=self.mode) for e in es])
+    return chebyshev_fit(gs)
+  def __call__(self,energy):
+    """Surface Green function at a certain energy"""
+    if energy<self.emin or energy>self.emax: # outside the window
+      return surface_green(self.intra,self.inter,energy=energy,
+                    delta=self.delta,mode=self.mode)
+    i = max([0,np.searchsorted(self.edges,energy,side="right")-1])
+    (a,b) = self.intervals[i]
+    x = (2.*energy - a - b)/(b - a) # in [-1,1]
+    c = self.coefficients[i]
+    ts = np.cos(np.arange(len(c))*np.arccos(np.clip(x,-1.,1.)))
+    return np.matrix(np.tensordot(ts,c,axes=1))
+  def error(self,energies):
+    """Maximum difference with the exact Green function"""
+    return max([np.max(np.abs(self(e) - surface_green(self.intra,
+                  self.inter,energy=e,delta=self.delta,mode=self.mode)))
+                  for e in energies])
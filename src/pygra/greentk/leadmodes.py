@@ -0,0 +1,106 @@
+from __future__ import print_function,division
+import numpy as np
+import scipy.linalg as lg
+from .. import algebra
+
+# Lead Green functions from the modes of the lead. For a lead with onsite
+# matrix h0 and hopping h1 between cell n and n+1, the solutions
+# psi_n = lambda^n phi of the (E - h0 - h1 lambda - h1^dagger/lambda) phi = 0
+# are obtained from a generalized eigenvalue problem of twice the size,
+# which also works for singular hoppings. The modes going to the right
+# (decaying or with positive velocity) define the transfer matrix F with
+# psi_{n+1} = F psi_n, and the surface Green function of a lead extending
+# to the right is
+#   g = (E - h0 - h1 F)^-1
+# This is exact for any delta, including delta = 0, and the cost does
+# not depend on delta as in the iterative renormalization
+
+tol_modes = 1e-6 # tolerance to consider a mode propagating
+
+
+class Modes():
+  """Modes of a lead moving in one direction"""
+  def __init__(self,lambdas,vectors,velocities):
+    self.lambdas = lambdas # Bloch factors, psi_{n+1} = lambda psi_n
+    self.vectors = vectors # modes, as columns
+    self.velocities = velocities # velocities (zero if evanescent)
+    self.propagating = velocities!=0. # propagating modes
+  def transfer(self):
+    """Transfer matrix psi_{n+1} = F psi_n"""
+    v = self.vectors
+    return v@np.diag(self.lambdas)@lg.inv(v)
+  def channels(self):
+    """Number of propagating channels"""
+    return np.sum(self.propagating)
+
+
+
+def velocity_operator(h1,l):
+  """Velocity operator for a propagating mode with Bloch factor l"""
+  return 1j*(l*h1 - np.conjugate(l)*algebra.dagger(h1))
+
+
+
+def propagating_velocities(h1,ls,vs,tol=1e-4):
+  """Velocities of the propagating modes. The modes with the same Bloch
+  factor are rotated so that the velocity is diagonal in them"""
+  vs = vs.copy()
+  vel = np.zeros(len(ls)) # velocities
+  done = np.zeros(len(ls),dtype=bool)
+  for i in range(len(ls)): # loop over modes
+    if done[i]: continue
+    ii = np.where((np.abs(ls-ls[i])<tol) & (~done))[0] # degenerate
+    q,r = np.linalg.qr(vs[:,ii]) # orthonormal basis
+    vop = algebra.dagger(q)@velocity_operator(h1,ls[i])@q
+    (e,u) = lg.eigh((vop + algebra.dagger(vop))/2.) # diagonalize
+    vel[ii] = e ; vs[:,ii] = q@u # store
+    done[ii] = True
+  return vel,vs
+
+
+
+def lead_modes(intra,inter,energy=0.0,delta=0.0,tol=None):
+  """Return the modes going to the right and to the left, as Modes
+  objects. For the left going modes lambda is the factor to the left,
+  psi_{n-1} = lambda psi_n"""
+  if tol is None: tol = tol_modes
+  h0 = np.array(algebra.todense(intra),dtype=np.complex128)
+  h1 = np.array(algebra.todense(inter),dtype=np.complex128)
+  n = h0.shape[0] # dimension
+  ez = (energy + 1j*delta)*np.identity(n) # energy
+  iden = np.identity(n) ; zero = np.zeros((n,n))
+  a = np.block([[zero,iden],[-algebra.dagger(h1),ez-h0]])
+  b = np.block([[iden,zero],[zero,h1]])
+  (ab,vs) = lg.eig(a,b,homogeneous_eigvals=True) # psi_{n-1},psi_n
+  (al,be) = ab # lambda = al/be
+  right = np.abs(al)<(1.-tol)*np.abs(be) # decaying to the right
+  left = np.abs(al)>(1.+tol)*np.abs(be) # decaying to the left
+  prop = ~(right | left) # propagating
+  ls = al[prop]/be[prop] # Bloch factors of the propagating modes
+  vel,vp = propagating_velocities(h1,ls,vs[0:n,prop]) # velocities
+  if np.any(vel==0.): raise # modes at a band edge
+  # right going modes, represented by psi_{n-1}
+  lr = np.concatenate([al[right]/be[right],ls[vel>0.]])
+  vr = np.concatenate([vs[0:n,right],vp[:,vel>0.]],axis=1)
+  velr = np.concatenate([np.zeros(np.sum(right)),vel[vel>0.]])
+  # left going modes, represented by psi_n
+  ll = np.concatenate([be[left]/al[left],1./ls[vel<0.]])
+  vl = np.concatenate([vs[n:,left],vp[:,vel<0.]],axis=1)
+  vell = np.concatenate([np.zeros(np.sum(left)),vel[vel<0.]])
+  if len(lr)!=n or len(ll)!=n: raise # wrong number of modes
+  return Modes(lr,vr,velr),Modes(ll,vl,vell)
+
+
+
+def green_modes(intra,inter,energy=0.0,delta=0.0,**kwargs):
+  """Bulk and surface Green functions of a lead, with the same
+  conventions as green.green_renormalization"""
+  (mr,ml) = lead_modes(intra,inter,energy=energy,delta=delta,**kwargs)
+  h0 = np.array(algebra.todense(intra))
+  h1 = np.array(algebra.todense(inter))
+  ez = (energy + 1j*delta)*np.identity(h0.shape[0]) # energy
+  sr = h1@mr.transfer() # selfenergy of the right part
+  sl = algebra.dagger(h1)@ml.transfer() # selfenergy of the left part
+  g_surf = lg.inv(ez - h0 - sr) # surface green function
+  g_bulk = lg.inv(ez - h0 - sr - sl) # bulk green function
+  return np.matrix(g_bulk),np.matrix(g_surf)
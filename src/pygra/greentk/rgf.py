@@ -0,0 +1,144 @@
+from __future__ import print_function,division
+import numpy as np
+import scipy.linalg as lg
+from scipy.sparse import csr_matrix,issparse
+from .. import algebra
+
+# Recursive Green function for block tridiagonal matrices. Given the
+# blocks A_ij of A = E - H_eff, the left connected Green functions
+#   gL_i = (A_ii - A_i,i-1 gL_i-1 A_i-1,i)^-1
+# and the right connected ones
+#   gR_i = (A_ii - A_i,i+1 gR_i+1 A_i+1,i)^-1
+# are obtained in a forward and a backward sweep, and from them any block
+# of G = A^-1, with a cost that is linear in the number of blocks
+#   G_ii = (A_ii - A_i,i-1 gL_i-1 A_i-1,i - A_i,i+1 gR_i+1 A_i+1,i)^-1
+#   G_ij = -G_i,j-1 A_j-1,j gR_j  (i<j)
+#   G_ij = -gL_i A_i,i+1 G_i+1,j  (i<j, along a column)
+#   G_ij = -gR_i A_i,i-1 G_i-1,j  (i>j)
+
+
+def dense(m):
+  """Dense array of a block"""
+  if m is None: return None
+  return np.array(algebra.todense(m),dtype=np.complex128)
+
+
+
+class BlockGreen():
+  """Green function of a block tridiagonal matrix, m is a list of lists
+  with the blocks of the matrix to invert"""
+  def __init__(self,m):
+    nb = len(m) # number of blocks
+    self.nb = nb
+    self.d = [dense(m[i][i]) for i in range(nb)] # diagonal
+    self.u = [dense(m[i][i+1]) for i in range(nb-1)] # upper
+    self.l = [dense(m[i+1][i]) for i in range(nb-1)] # lower
+    self.gl = [None for i in range(nb)] # left connected
+    self.gr = [None for i in range(nb)] # right connected
+    self.gl[0] = lg.inv(self.d[0])
+    for i in range(1,nb): # forward sweep
+      self.gl[i] = lg.inv(self.d[i] - self.l[i-1]@self.gl[i-1]@self.u[i-1])
+    self.gr[nb-1] = lg.inv(self.d[nb-1])
+    for i in range(nb-2,-1,-1): # backward sweep
+      self.gr[i] = lg.inv(self.d[i] - self.u[i]@self.gr[i+1]@self.l[i])
+    self.diag = [None for i in range(nb)] # diagonal of G
+  def index(self,i):
+    if i<0: i += self.nb # python notation
+    return i
+  def diagonal(self,i):
+    """Diagonal block G_ii"""
+    i = self.index(i)
+    if self.diag[i] is None: # compute it
+      s = self.d[i].copy()
+      if i>0: s -= self.l[i-1]@self.gl[i-1]@self.u[i-1]
+      if i<self.nb-1: s -= self.u[i]@self.gr[i+1]@self.l[i]
+      self.diag[i] = lg.inv(s)
+    return self.diag[i]
+  def element(self,i,j):
+    """Block G_ij"""
+    i,j = self.index(i),self.index(j)
+    g = self.diagonal(i) # G_ii
+    if j>i:
+      for k in range(i+1,j+1): g = -g@self.u[k-1]@self.gr[k] # G_ik
+    elif j<i:
+      g = self.diagonal(j) # G_jj
+      for k in range(j+1,i+1): g = -self.gr[k]@self.l[k-1]@g # G_kj
+    return g
+  def column(self,j=0):
+    """All the blocks G_ij of a block column"""
+    j = self.index(j)
+    out = [None for i in range(self.nb)]
+    out[j] = self.diagonal(j)
+    for k in range(j+1,self.nb): out[k] = -self.gr[k]@self.l[k-1]@out[k-1]
+    for k in range(j-1,-1,-1): out[k] = -self.gl[k]@self.u[k]@out[k+1]
+    return out
+  def diagonals(self):
+    """All the diagonal blocks"""
+    return [self.diagonal(i) for i in range(self.nb)]
+  def bond_currents(self,gamma,hop=None):
+    """Currents between consecutive blocks for electrons injected in
+    the first block with a coupling gamma. hop are the blocks H_i,i+1
+    (by default -A_i,i+1). Returns a list of matrices with the current
+    from each orbital of block i to each orbital of block i+1, whose
+    total is the transmission"""
+    if hop is None: hop = [-u for u in self.u] # hoppings
+    c = self.column(0) # first column
+    out = []
+    for i in range(self.nb-1): # loop over bonds
+      gn = c[i+1]@dense(gamma)@algebra.dagger(c[i]) # G^n_i+1,i
+      out.append(-2.*(dense(hop[i])*gn.T).imag) # -2 Im H_ab G^n_ba
+    return out
+
+
+
+def rgf_inverse(m,i=0,j=0):
+  """Block (i,j) of the inverse of a block tridiagonal matrix"""
+  return np.matrix(BlockGreen(m).element(i,j))
+
+
+
+def slice_blocks(m,first=None,last=None):
+  """Order the orbitals of a sparse matrix and split them in blocks so
+  that the matrix is block tridiagonal. If first is given, those
+  orbitals (coupled to the left lead) form the first block and the rest
+  are added in layers of neighbors, and the orbitals in last (coupled to
+  the right lead) are placed in the last block. Otherwise, a reverse
+  Cuthill-McKee ordering is used. Returns a list with the orbitals of
+  each block"""
+  m = csr_matrix(m,dtype=bool) # sparsity pattern
+  m = (m + m.T).tocsr() # symmetric
+  n = m.shape[0]
+  if first is None: # bandwidth minimizing ordering
+    from scipy.sparse.csgraph import reverse_cuthill_mckee
+    p = reverse_cuthill_mckee(m,symmetric_mode=True) # ordering
+    mp = m[p,:][:,p].tocoo() # reordered
+    bw = max([1,np.max(np.abs(mp.row-mp.col),initial=0)]) # bandwidth
+    return [p[i:i+bw] for i in range(0,n,bw)]
+  layer = np.zeros(n,dtype=int) - 1 # layer of each orbital
+  current = np.unique(np.array(first,dtype=int))
+  il = 0
+  while len(current)>0: # breadth first search
+    layer[current] = il
+    nxt = np.unique(m[current,:].indices) # neighbors
+    current = nxt[layer[nxt]<0] # new ones
+    il += 1
+  layer[layer<0] = il-1 # disconnected orbitals, to the last layer
+  if last is not None: # merge the layers of the last orbitals
+    il = np.min(layer[np.array(last,dtype=int)]) # first of them
+    if il==0: layer[:] = 0 # a single block
+    else: layer[layer>=il] = il
+  return [np.where(layer==i)[0] for i in range(np.max(layer)+1)]
+
+
+
+def block_tridiagonal(m,blocks):
+  """Split a matrix in blocks given by lists of orbitals, returning
+  a list of lists with None outside the three diagonals"""
+  if issparse(m): m = csr_matrix(m)
+  else: m = np.array(m)
+  nb = len(blocks)
+  out = [[None for i in range(nb)] for j in range(nb)]
+  for i in range(nb):
+    for j in range(max([0,i-1]),min([nb,i+2])):
+      out[i][j] = np.matrix(dense(m[blocks[i],:][:,blocks[j]]))
+  return out
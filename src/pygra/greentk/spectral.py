@@ -0,0 +1,110 @@
+from __future__ import print_function,division
+import numpy as np
+from .. import algebra
+from .. import parallel
+
+# Local Green function from the eigenstates of the Bloch Hamiltonian.
+# The Hamiltonian is diagonalized once in each k-point, and all the
+# eigenvectors are stored as the columns of a single N x M array V, so
+# that for any energy
+#   G(z) = 1/nk sum_m v_m v_m^dagger/(z - E_m) = V diag(1/(z-E)) V^dagger/nk
+# The diagonal for many energies at once is a single product
+# |V|^2 @ 1/(z-E), and the full matrices are computed in chunks of
+# energies and states. With an energy window, only the states inside it
+# are kept, and the array V can be stored in a memory-mapped file
+
+memory_budget = 2**28 # memory for the temporal arrays, in bytes
+
+
+class SpectralGreen():
+  """Spectral representation of the local Green function"""
+  def __init__(self,h,nk=20,window=None,memmap=None,ks=None):
+    from .. import klist
+    hkgen = h.get_hk_gen() # generator
+    if ks is None: ks = klist.kmesh(h.dimensionality,nk=nk) # k-points
+    self.nk = len(ks) # number of k-points
+    self.n = h.intra.shape[0] # dimension
+    self.intra = h.intra
+    n = self.n
+    def fun(k): # diagonalize
+      (es,vs) = algebra.eigh(np.array(algebra.todense(hkgen(k))))
+      if window is not None: # only states in the window
+        ii = (es>=window[0]) & (es<=window[1])
+        es,vs = es[ii],vs[:,ii]
+      return es,vs
+    if memmap is None:
+      out = parallel.pcall(fun,ks) # diagonalize all
+      self.energies = np.concatenate([o[0] for o in out])
+      self.vectors = np.concatenate([o[1] for o in out],axis=1)
+      self.kindex = np.concatenate([[i]*len(o[0])
+                                      for (i,o) in enumerate(out)])
+    else: # store the vectors in disk, as they are computed
+      self.vectors = np.lib.format.open_memmap(memmap,mode="w+",
+                         dtype=np.complex128,shape=(n,self.nk*n))
+      es,ik = [],[] # energies and k-index
+      m = 0 # number of states stored
+      for (i,k) in enumerate(ks):
+        (e,v) = fun(k)
+        self.vectors[:,m:m+len(e)] = v ; m += len(e)
+        es.append(e) ; ik.append([i]*len(e))
+      self.vectors.flush()
+      self.vectors = self.vectors[:,0:m] # only the stored states
+      self.energies = np.concatenate(es)
+      self.kindex = np.concatenate(ik)
+    self.ks = ks
+  def chunk(self,size):
+    """Number of states in each chunk"""
+    return max([1,int(memory_budget//(16*max([size,1])))])
+  def get_diagonal(self,energies,delta=0.01):
+    """Diagonal of the Green function, with shape (ne,N)"""
+    out = np.zeros((len(energies),self.n),dtype=np.complex128)
+    M = len(self.energies) # number of states
+    nc = self.chunk(len(energies)+self.n) # states in each chunk
+    zs = np.array(energies) + 1j*delta
+    for i in range(0,M,nc): # loop over chunks of states
+      w = np.abs(self.vectors[:,i:i+nc])**2 # weights
+      r = 1./(zs[:,None] - self.energies[None,i:i+nc]) # resolvent
+      out += r@w.T # single product
+    return out/self.nk
+  def get_block(self,energies,rows=slice(None),cols=slice(None),
+                  delta=0.01):
+    """Block G_rows,cols of the Green function, with shape (ne,nr,nc)"""
+    vr,vc = self.vectors[rows,:],self.vectors[cols,:] # needed components
+    out = np.zeros((len(energies),vr.shape[0],vc.shape[0]),
+                     dtype=np.complex128)
+    M = len(self.energies) # number of states
+    ne = len(energies)
+    nc = self.chunk(max([vr.shape[0],vc.shape[0]])*max([1,ne]))
+    zs = np.array(energies) + 1j*delta
+    for i in range(0,M,nc): # loop over chunks of states
+      a,b = np.array(vr[:,i:i+nc]),np.array(vc[:,i:i+nc]) # vectors
+      r = 1./(zs[:,None] - self.energies[None,i:i+nc]) # resolvent
+      out += (a[None,:,:]*r[:,None,:])@algebra.dagger(b) # batched GEMM
+    return out/self.nk
+  def get_green(self,energies,delta=0.01):
+    """Local Green functions, with shape (ne,N,N)"""
+    return self.get_block(energies,delta=delta)
+  def get_trace(self,energies,delta=0.01,operator=None):
+    """Trace of the Green function times an operator, that can be a
+    matrix or a function of the k-point, for several energies"""
+    if operator is None: ws = np.ones(len(self.energies)) # weights
+    else: # expectation values of the operator
+      ws = np.zeros(len(self.energies),dtype=np.complex128)
+      for i in range(self.nk): # loop over k-points
+        ii = np.where(self.kindex==i)[0] # states of this k-point
+        if len(ii)==0: continue
+        if callable(operator): o = operator(self.ks[i])
+        else: o = operator
+        v = np.array(self.vectors[:,ii])
+        ws[ii] = np.sum(np.conjugate(v)*(o@v),axis=0)
+    out = np.zeros(len(energies),dtype=np.complex128)
+    nc = self.chunk(len(energies))
+    zs = np.array(energies) + 1j*delta
+    for i in range(0,len(ws),nc): # loop over chunks of states
+      out += (1./(zs[:,None] - self.energies[None,i:i+nc]))@ws[i:i+nc]
+    return out/self.nk
+  def get_selfenergy(self,energy,delta=0.01):
+    """Local Green function and selfenergy at a certain energy"""
+    g = np.matrix(self.get_green([energy],delta=delta)[0])
+    ediag = np.matrix(np.identity(self.n))*(energy + delta*1j)
+    return g,ediag - self.intra - g.I
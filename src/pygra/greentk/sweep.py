@@ -0,0 +1,138 @@
+from __future__ import print_function,division
+import numpy as np
+
+# Transport in a grid of energies and parallel momenta. The (energy,k)
+# points are distributed over a persistent pool of workers, which receive
+# the heterostructure only once, when the pool is created, and the
+# results are streamed into an array as they arrive. Optionally, the
+# energy grid is refined where the k-averaged result changes faster than
+# a tolerance, to resolve narrow resonances. The pool of the last
+# heterostructure is kept alive, so that calls at single energies reuse it
+
+_worker = dict() # state of each worker
+_sweeps = dict() # pool of the last heterostructure
+
+
+def point_value(ht,energy,k=0.,kind="didv",delta=None):
+  """Transport quantity at a certain energy and parallel momentum"""
+  if delta is None: delta = ht.delta
+  if ht.dimensionality==2: ht = ht.generate(k) # 1D heterostructure
+  elif ht.dimensionality!=1: raise
+  if kind=="didv": return ht.didv(energy=energy,delta=delta)
+  elif kind=="landauer":
+    from ..heterostructures import landauer
+    return landauer(ht,energy=energy,delta=delta)
+  else: raise
+
+
+
+def init_worker(ht,kind,delta):
+  """Store the heterostructure in the worker"""
+  from .. import parallel
+  parallel.is_child = True # no pools inside the workers
+  _worker["ht"],_worker["kind"],_worker["delta"] = ht,kind,delta
+
+
+
+def worker_value(args):
+  """Compute a single point in a worker"""
+  (ie,ik,energy,k) = args
+  return ie,ik,point_value(_worker["ht"],energy,k=k,kind=_worker["kind"],
+                             delta=_worker["delta"])
+
+
+
+class TransportSweep():
+  """Persistent pool of workers computing the transport of a
+  heterostructure"""
+  def __init__(self,ht,kind="didv",delta=None,cores=None):
+    from .. import parallel
+    if cores is None: cores = parallel.cores
+    if parallel.is_child: cores = 1 # no pools inside other pools
+    self.ht,self.kind,self.delta = ht,kind,delta
+    self.cores = cores
+    if cores>1: # create the pool, sending the heterostructure once
+      from multiprocess import Pool
+      self.pool = Pool(cores,initializer=init_worker,
+                         initargs=(ht,kind,delta))
+    else: self.pool = None
+  def compute(self,energies,ks=[0.],output=None):
+    """Compute the grid of energies and k-points, returning an array
+    of shape (len(energies),len(ks)). If output is a file name, each
+    point is written as soon as it is computed"""
+    tasks = [(ie,ik,e,k) for (ie,e) in enumerate(energies)
+                            for (ik,k) in enumerate(ks)]
+    out = np.zeros((len(energies),len(ks))) # output
+    if output is not None: fo = open(output,"a")
+    if self.pool is None: # serial
+      init_worker(self.ht,self.kind,self.delta)
+      results = map(worker_value,tasks)
+    else: # stream the results
+      results = self.pool.imap_unordered(worker_value,tasks,
+                    chunksize=max([1,len(tasks)//(8*self.cores)]))
+    for (ie,ik,v) in results: # store
+      out[ie,ik] = v
+      if output is not None:
+        fo.write(str(energies[ie])+"  "+str(ik)+"  "+str(v)+"\n")
+        fo.flush()
+    if output is not None: fo.close()
+    return out
+  def sweep(self,energies,nk=1,tol=None,maxlevel=0,output=None):
+    """k-averaged transport in a grid of energies. If tol is given,
+    midpoints are added where the result changes more than tol between
+    consecutive energies, up to maxlevel times. Returns the energies
+    and the results"""
+    ks = np.linspace(0.,1.,nk,endpoint=False) # parallel momenta
+    if self.ht.dimensionality==1: ks = [0.]
+    es = np.array(energies,dtype=float)
+    ys = np.mean(self.compute(es,ks,output=output),axis=1)
+    for il in range(maxlevel): # refinement
+      if tol is None: break
+      jump = np.abs(np.diff(ys))>tol # intervals to refine
+      if not np.any(jump): break
+      enew = (es[:-1][jump] + es[1:][jump])/2. # new energies
+      ynew = np.mean(self.compute(enew,ks,output=output),axis=1)
+      es = np.concatenate([es,enew]) ; ys = np.concatenate([ys,ynew])
+      ii = np.argsort(es) ; es,ys = es[ii],ys[ii] # sort
+    return es,ys
+  def close(self):
+    """Stop the workers"""
+    if self.pool is not None:
+      self.pool.terminate() ; self.pool.join()
+      self.pool = None
+  def __enter__(self): return self
+  def __exit__(self,*args): self.close()
+
+
+
+def get_sweep(ht,kind="didv",delta=None,cores=None):
+  """Persistent pool for a heterostructure, replacing the pool of the
+  previous one"""
+  if cores is None:
+    from .. import parallel
+    cores = parallel.cores
+  # the heterostructure is kept in the pool, so its id is not reused
+  key = (id(ht),id(getattr(ht,"generate",None)),kind,delta,cores)
+  if key not in _sweeps: # create it
+    close_all() # only one pool alive
+    _sweeps[key] = TransportSweep(ht,kind=kind,delta=delta,cores=cores)
+  return _sweeps[key]
+
+
+
+def close_all():
+  """Stop the persistent pools"""
+  for k in list(_sweeps.keys()): _sweeps.pop(k).close()
+
+import atexit
+atexit.register(close_all) # stop the workers at exit
+
+
+
+def transport_sweep(ht,energies=np.linspace(-1.,1.,50),nk=10,kind="didv",
+                      delta=None,tol=None,maxlevel=0,cores=None,
+                      output=None):
+  """Transport of a heterostructure in a grid of energies, averaged
+  over nk parallel momenta for two dimensional heterostructures"""
+  with TransportSweep(ht,kind=kind,delta=delta,cores=cores) as ts:
+    return ts.sweep(energies,nk=nk,tol=tol,maxlevel=maxlevel,output=output)
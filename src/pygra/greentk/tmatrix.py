@@ -0,0 +1,56 @@
+from __future__ import print_function,division
+import numpy as np
+import scipy.linalg as lg
+from .. import algebra
+
+# Embedding of localized perturbations with the T-matrix. If the
+# perturbation V only acts on a subset S of r orbitals, the Dyson equation
+#   G = G0 + G0 V G
+# is solved exactly with the T-matrix restricted to S
+#   T = V_SS (1 - G0_SS V_SS)^-1
+#   G = G0 + G0_:S T G0_S:
+# so only the columns and rows of S of the pristine Green function are
+# needed, and each energy costs O(r^3) + O(N r^2) instead of O(N^3)
+
+
+def support(v,tol=1e-10):
+  """Orbitals in which a perturbation acts"""
+  v = np.abs(np.array(algebra.todense(v)))>tol # non vanishing elements
+  return np.where(np.any(v,axis=0) | np.any(v,axis=1))[0]
+
+
+
+def restrict(v,sites):
+  """Block of a matrix in a subset of orbitals"""
+  v = np.array(algebra.todense(v),dtype=np.complex128)
+  return v[sites,:][:,sites]
+
+
+
+def tmatrix(g0,v):
+  """T-matrix from the pristine Green function and the perturbation,
+  both restricted to the orbitals of the perturbation"""
+  g0,v = np.array(g0),np.array(v)
+  if v.shape[0]==0: return v # no perturbation
+  return v@lg.inv(np.identity(v.shape[0]) - g0@v)
+
+
+
+def correction_diagonal(gcol,t,grow):
+  """Diagonal of G0_:S T G0_S:"""
+  return np.sum((gcol@t)*grow.T,axis=1)
+
+
+
+def correction_trace(gcol,t,grow):
+  """Trace of G0_:S T G0_S:"""
+  return np.trace(t@(grow@gcol))
+
+
+
+def embed(g0,v,sites=None):
+  """Green function with a perturbation v, from the pristine one"""
+  g0 = np.array(algebra.todense(g0))
+  if sites is None: sites = support(v)
+  t = tmatrix(g0[sites,:][:,sites],restrict(v,sites))
+  return g0 + g0[:,sites]@t@g0[sites,:]
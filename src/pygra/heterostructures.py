@@ -26,6 +26,8 @@ class heterostructure():
     self.dimensionality = 1 # default is one dimensional
     self.delta = 0.0001
     self.interpolated_selfenergy = False
+    self.lead_solver = "renormalization" # or "modes"
+    self.lead_interpolators = None # interpolated lead Green functions
     self.block_diagonal = False
     if h is not None:
       self.heff = None  # effective hamiltonian
@@ -108,24 +110,43 @@ class heterostructure():
      if lead==1: return np.matrix(self.selfgen[1](energy)) # return selfenergy
 # run the calculation
    else:
-     from .green import green_renormalization
      if lead==0:
-       intra = self.left_intra
-       inter = self.left_inter
        if pristine: cou = self.left_inter
        else: cou = self.left_coupling*self.scale_lc
      if lead==1:
-       intra = self.right_intra
-       inter = self.right_inter
        if pristine: cou = self.right_inter
        else: cou = self.right_coupling*self.scale_rc
-     ggg,gr = green_renormalization(intra,inter,energy=energy,delta=delta)
+     gr = self.get_surface_green(energy,lead=lead,delta=delta)
      selfr = cou*gr*cou.H # selfenergy
      return selfr # return selfenergy
+  def get_surface_green(self,energy,lead=0,delta=None):
+    """Surface Green function of a lead, interpolated or cached"""
+    if delta is None:  delta = self.delta
+    if self.lead_interpolators is not None: # interpolation available
+      f = self.lead_interpolators[lead]
+      if f.delta==delta and f.mode==self.lead_solver: return f(energy)
+    from .greentk import leadcache
+    if lead==0: intra,inter = self.left_intra,self.left_inter
+    elif lead==1: intra,inter = self.right_intra,self.right_inter
+    else: raise
+    return leadcache.surface_green(intra,inter,energy=energy,delta=delta,
+                                     mode=self.lead_solver)
   def setup_selfenergy_interpolation(self,es=np.linspace(-4.0,4.0,100),
-           delta=0.0001,pristine=False):
-    """Create the functions that interpolate the selfenergy"""
-    from interpolation import intermatrix
+           delta=0.0001,pristine=False,mode="spline",tol=1e-4):
+    """Create the functions that interpolate the selfenergy. With
+    mode="chebyshev" the surface Green functions of the leads are
+    fitted in the window of es, with an adaptive piecewise Chebyshev
+    interpolation with a certain tolerance"""
+    if mode=="chebyshev":
+      from .greentk.leadcache import LeadInterpolator
+      leads = [(self.left_intra,self.left_inter),
+                 (self.right_intra,self.right_inter)]
+      self.lead_interpolators = [LeadInterpolator(intra,inter,
+                  emin=np.min(es),emax=np.max(es),delta=delta,tol=tol,
+                  mode=self.lead_solver) for (intra,inter) in leads]
+      return
+    elif mode!="spline": raise
+    from .interpolation import intermatrix
     self.interpolated_selfenergy = False # set as False
     fsl = lambda e: self.get_selfenergy(e,delta=delta,lead=0,pristine=pristine)
     fsr = lambda e: self.get_selfenergy(e,delta=delta,lead=1,pristine=pristine)
@@ -135,6 +156,9 @@ class heterostructure():
     self.interpolated_selfenergy = True # set as true
   def didv(self,energy=0.0,delta=None,error=1e-4,nk=10,kwant=False,
           opl=None,opr=None):
+    """Differential conductance at a certain energy. For two dimensional
+    heterostructures it is averaged over nk parallel momenta, distributed
+    over a pool that is kept for the next energies"""
     if delta is None: delta = self.delta # set the own delta
     if self.dimensionality==1: # one dimensional
       return didv(self,energy=energy,delta=delta,kwant=kwant,
@@ -142,12 +166,24 @@ class heterostructure():
     elif self.dimensionality==2: # two dimensional
       # function to integrate
       print("Computing",energy)
+      ks = np.linspace(0.,1.,nk,endpoint=False) # parallel momenta
+      from . import parallel
+      if parallel.cores>1 and not parallel.is_child: # distribute the k-points
+        from .greentk.sweep import get_sweep # reused between energies
+        return np.mean(get_sweep(self,delta=delta).compute([energy],ks))
       f = lambda k: self.generate(k).didv(energy=energy,delta=delta)
-      return np.mean([f(x) for x in np.linspace(0.,1.,nk,endpoint=False)])
+      return np.mean([f(x) for x in ks])
     else: raise
   def block2full(self,sparse=False):
     """Put in full form"""
     return block2full(self,sparse=sparse)
+  def full2block(self):
+    """Put in block tridiagonal form"""
+    return full2block(self)
+  def transport_sweep(self,energies=np.linspace(-1.,1.,50),**kwargs):
+    """Transport in a grid of energies (and k-points), in parallel"""
+    from .greentk.sweep import transport_sweep
+    return transport_sweep(self,energies=energies,**kwargs)
 
 
 
@@ -294,6 +330,29 @@ def central_dos(hetero,energies=[0.0],num_rep=100,project=None):
 
 
 
+def adaptive_landauer(hetero,energies=np.linspace(-1.,1.,20),delta=None,
+                        **kwargs):
+  """Transmission in an adaptive energy grid, starting from energies and
+  refining where it changes rapidly. Returns the energies and the
+  transmission"""
+  if delta is None: delta = hetero.delta
+  from .greentk.energygrid import adaptive_grid
+  f = lambda es: landauer(hetero,energy=list(es),delta=delta)
+  return adaptive_grid(f,energies,**kwargs)
+
+
+
+def adaptive_central_dos(hetero,energies=np.linspace(-1.,1.,20),**kwargs):
+  """Central DOS in an adaptive energy grid. Returns the energies and
+  the DOS"""
+  from .greentk.energygrid import adaptive_grid
+  f = lambda es: central_dos(hetero,energies=es)
+  return adaptive_grid(f,energies,**kwargs)
+
+
+
+
+
 def plot_central_dos(ht,energies=[0.0],num_rep=100,
                       mixing=0.7,eps=0.0001,green_guess=None,max_error=0.0001):
    """ Plots the density of states by using a 
@@ -331,6 +390,7 @@ def landauer(hetero,energy=0.0,delta = 0.0001,error=0.0000001,do_leads=True,
      pass
    from . import green
    from .hamiltonians import is_number
+   if not has_eh: hetero = auto_block(hetero) # large central parts with RGF
    if not hetero.block_diagonal:
      intra = hetero.central_intra # central intraterm   
      dimhc = len(intra) # dimension of the central part
@@ -363,22 +423,11 @@ def landauer(hetero,energy=0.0,delta = 0.0001,error=0.0000001,do_leads=True,
      return G
    # reduced matrix
    if hetero.block_diagonal: 
-     from copy import deepcopy
-     heff = deepcopy(intra)
-     heff[0][0] = intra[0][0] + selfl
-     heff[-1][-1] = intra[-1][-1] + selfr
-     dd = (energy+1j*delta)*iden
-     for i in range(len(intra)):  # add the diagonal energy part
-       heff[i][i] = heff[i][i] - dd  # this has the wrong sign!!
-    # now change the sign
-     for i in range(len(intra)):  
-       for j in range(len(intra)):  
-         if heff[i][j] is not None:
-           heff[i][j] = -heff[i][j]
-     # calculate green function
-     from .green import gauss_inverse  # routine to invert the matrix
-     # calculate only some elements of the central green function
-     gcn1 = gauss_inverse(heff,len(heff)-1,0) # calculate element 1,n 
+     heff = effective_tridiagonal_hamiltonian(intra,selfl,selfr,
+                                        energy=energy,delta=delta)
+     # calculate only the element 1,n of the central green function
+     from .greentk.rgf import BlockGreen
+     gcn1 = np.matrix(BlockGreen(heff).element(-1,0))
      # and apply Landauer formula
      G = (gammar*gcn1*gammal*gcn1.H).trace()[0,0].real
    return G # return transmission
@@ -421,6 +470,65 @@ def block2full(ht,sparse=False):
 
 
 
+def full2block(ht):
+  """Convert a heterostructure with a full (possibly sparse) central
+  Hamiltonian into block tridiagonal form, slicing the central part in
+  layers starting from the orbitals coupled to the left lead. The order
+  of the orbitals is stored in block_orbitals"""
+  if ht.block_diagonal: return ht # nothing to do
+  from .greentk import rgf
+  ho = ht.copy()
+  ho.block_cache = None # do not copy the stored block form
+  lc = csc_matrix(ht.left_coupling) # coupling to the left lead
+  rc = csc_matrix(ht.right_coupling) # coupling to the right lead
+  first = np.unique(lc.tocoo().row) # orbitals coupled to the left
+  last = np.unique(rc.tocoo().row) # orbitals coupled to the right
+  blocks = rgf.slice_blocks(ht.central_intra,first=first,last=last)
+  ho.central_intra = rgf.block_tridiagonal(ht.central_intra,blocks)
+  ho.left_coupling = np.matrix(lc[blocks[0],:].todense())
+  ho.right_coupling = np.matrix(rc[blocks[-1],:].todense())
+  ho.block_orbitals = np.concatenate(blocks) # new order of the orbitals
+  ho.block_diagonal = True
+  return ho
+
+
+
+rgf_threshold = 200 # central parts at least this large are sliced in blocks
+
+def auto_block(ht):
+  """Block tridiagonal form of a large central part, used by landauer
+  and get_smatrix. It is computed once and stored in the
+  heterostructure, until the central Hamiltonian is replaced"""
+  if ht.block_diagonal: return ht # already in block form
+  if ht.central_intra.shape[0]<rgf_threshold: return ht # small, invert it
+  c = getattr(ht,"block_cache",None) # stored block form
+  if c is not None and c[0] is ht.central_intra: return c[1]
+  ho = full2block(ht)
+  ht.block_cache = (ht.central_intra,ho) # store
+  return ho
+
+
+
+def block_currents(ht,energy=0.0,delta=None):
+  """Bond currents between consecutive blocks of the central part, for
+  electrons injected from the left lead, from a single recursive sweep.
+  Returns a list of matrices with the currents between each orbital of
+  a block and each orbital of the next one"""
+  if delta is None: delta = ht.delta
+  if not ht.block_diagonal: ht = full2block(ht)
+  from .greentk.rgf import BlockGreen
+  selfl = ht.get_selfenergy(energy,lead=0,delta=delta,pristine=False)
+  selfr = ht.get_selfenergy(energy,lead=1,delta=delta,pristine=False)
+  heff = effective_tridiagonal_hamiltonian(ht.central_intra,selfl,selfr,
+                                        energy=energy,delta=delta)
+  gammal = 1j*(selfl-selfl.H) # coupling to the left lead
+  nb = len(ht.central_intra)
+  hop = [ht.central_intra[i][i+1] for i in range(nb-1)] # hoppings
+  return BlockGreen(heff).bond_currents(gammal,hop=hop)
+
+
+
+
 def plot_landauer(ht,energy=[0.0],delta=0.001,has_eh=False):
    """ Plots the density of states and Landauer transmission
     by using a 
@@ -458,7 +566,8 @@ def plot_local_central_dos(hetero,energies=0.0,gf=None):
    if hetero.block_diagonal:
      intra = hetero.central_intra[0][0] # when it is diagonal
 # dimension of the central part
-     dimhc = len(hetero.central_intra)*len(intra)  
+     nb = len(hetero.central_intra) # number of blocks
+     dimhc = sum([hetero.central_intra[i][i].shape[0] for i in range(nb)])
    iden = np.matrix(np.identity(len(intra),dtype=complex)) # create idntity
    ldos = np.array([0.0 for i in range(dimhc)]) # initialice ldos
    # initialize ldos
@@ -500,42 +609,28 @@ def plot_local_central_dos(hetero,energies=0.0,gf=None):
 #         hetero.write_heff() 
      # reduced matrix
      if hetero.block_diagonal: 
-       from copy import deepcopy
-       heff = deepcopy(intra)
-       heff[0][0] = intra[0][0] + selfl
-       heff[-1][-1] = intra[-1][-1] + selfr
-       dd = (energy+1j*gf.eps)*iden
-       for i in range(len(intra)):  # add the diagonal energy part
-         heff[i][i] = heff[i][i] - dd  # this has the wrong sign!!
-      # now change the sign
-       for i in range(len(intra)):  
-         for j in range(len(intra)):  
-           try:
-             heff[i][j] = -heff[i][j]
-           except:
-             heff[i][j] = heff[i][j]
+       heff = effective_tridiagonal_hamiltonian(intra,selfl,selfr,
+                                        energy=energy,delta=gf.eps)
       # save the green function
        hetero.heff = heff
 #       if save_heff:
 #         from scipy.sparse import bmat
 #         hetero.heff = bmat(heff)
 #         hetero.write_heff() 
-      # calculate the inverse
-       from .green import gauss_inverse  # routine to invert the matrix
-       # list with the diagonal matrices
-       ldos_e = ldos*0.0 # initialice ldos at this energy
-       ii = 0 # counter for the element
-       for i in range(len(heff)): # loop over blocks
-         gci = gauss_inverse(heff,i,i) # calculate each block element      
-         for j in range(len(heff[0][0])): # loop over each block
-           ldos_e[ii] = -gci[j,j].imag 
-           ii += 1 # increase counter
+      # all the diagonal blocks in a single recursive sweep
+       from .greentk.rgf import BlockGreen
+       gcs = BlockGreen(heff).diagonals()
+       ldos_e = np.concatenate([-np.diag(gci).imag for gci in gcs])
+       ii = len(ldos_e) # number of elements
        if not ii==dimhc:
          print("Wrong dimensions",ii,dimhc)
          raise
        ldos += ldos_e # add to the total ldos
 # save the effective hamiltonian
 
+   if getattr(hetero,"block_orbitals",None) is not None: # sliced by full2block
+     ldos0 = np.zeros(len(ldos)) # back to the original order
+     ldos0[hetero.block_orbitals] = ldos ; ldos = ldos0
    if hetero.has_spin: # resum ldos if there is spin degree of freedom
      ldos = [ldos[2*i]+ldos[2*i+1] for i in range(len(ldos)/2)]
    if hetero.has_eh: # resum ldos if there is eh 
@@ -814,7 +909,8 @@ def get_smatrix(ht,energy=0.0,delta=0.000001,as_matrix=False,check=True):
   """Calculate the S-matrix of an heterostructure"""
   # now do the Fisher Lee trick
   smatrix = [[None,None],[None,None]] # smatrix in list form
-  from .green import gauss_inverse # calculate the desired green functions
+  from .greentk.rgf import BlockGreen # calculate the desired green functions
+  ht = auto_block(ht) # large central parts with RGF
   # get the selfenergies, using the same coupling as the lead
   selfl = ht.get_selfenergy(energy,delta=delta,lead=0,pristine=True)
   selfr = ht.get_selfenergy(energy,delta=delta,lead=1,pristine=True)
@@ -823,21 +919,20 @@ def get_smatrix(ht,energy=0.0,delta=0.000001,as_matrix=False,check=True):
 # selfenergy of the leads (coupled to another cell of the lead)
     gmatrix = effective_tridiagonal_hamiltonian(ht2.central_intra,selfl,selfr,
                                                  energy=energy,delta=delta) 
-    test_gauss = False # do the tridiagonal inversion
 #    print(selfr)
   else: # not block diagonal
     gmatrix = build_effective_hlist(ht,energy=energy,delta=delta,selfl=selfl,
                                     selfr=selfr)
-    test_gauss = True # gauss only works with square matrices
 #    print(selfr)
   # gamma functions
   gammar = 1j*(selfr-selfr.H)
   gammal = 1j*(selfl-selfl.H)
   # calculate the relevant terms of the Green function
-  g11 = gauss_inverse(gmatrix,0,0,test=test_gauss)
-  g12 = gauss_inverse(gmatrix,0,-1,test=test_gauss)
-  g21 = gauss_inverse(gmatrix,-1,0,test=test_gauss)
-  g22 = gauss_inverse(gmatrix,-1,-1,test=test_gauss)
+  bg = BlockGreen(gmatrix) # a single recursive sweep
+  g11 = np.matrix(bg.element(0,0))
+  g12 = np.matrix(bg.element(0,-1))
+  g21 = np.matrix(bg.element(-1,0))
+  g22 = np.matrix(bg.element(-1,-1))
 #  print("NAN",np.sum(np.isnan(g12)))
 #  print (gammal*g12*gammar*g21).trace()
   ######## now build up the s matrix with the fisher trick
@@ -1021,9 +1116,8 @@ def effective_tridiagonal_hamiltonian(intra,selfl,selfr,
   if not type(intra) is list: raise # assume is list
   n = len(intra) # number of blocks
   iout = [[None for i in range(n)] for j in range(n)] # empty list
-  iden = np.matrix(np.identity(intra[0][0].shape[0],dtype=np.complex))
-  ez = iden*(energy +1j*delta) # complex energy
   for i in range(n):
+    ez = np.identity(intra[i][i].shape[0])*(energy +1j*delta) # energy
     iout[i][i] = ez - intra[i][i] # simply E -H
   for i in range(n-1):
     iout[i][i+1] = -intra[i][i+1] # simply E -H
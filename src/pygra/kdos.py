@@ -38,8 +38,7 @@ def kdos1d_sites(h,sites=[0],scale=10.,nk=100,npol=100,kshift=0.,
   for k in ks: # loop over kpoints
     mus = np.array([0.0j for i in range(2*npol)]) # initialize polynomials
     hk = hkgen(k+kshift) # hamiltonian
-    for isite in sites:
-      mus += kpm.local_dos(hk/scale,i=isite,n=npol)
+    mus += kpm.sites_dos(hk/scale,sites=sites,n=npol) # all the sites
     ys = kpm.generate_profile(mus,xs) # generate the profile
     write_kdos(k,xs*scale,ys,new=False) # write in file (append)
     if info: print("Done",k)
@@ -145,7 +144,7 @@ def write_surface_3d(h,energies=None,klist=None,delta=0.01):
 
 
 
-def kdos_bands(h,use_kpm=False,kpath=None,scale=10.0,frand=None,
+def kdos_bands(h,use_kpm=False,kpath=None,scale=None,frand=None,
                  ewindow=4.0,ne=1000,delta=0.01,ntries=10,nk=100,
                  operator=None,energies=np.linspace(-3.0,3.0,200)):
   """Calculate the KDOS bands using the KPM"""
@@ -160,11 +159,15 @@ def kdos_bands(h,use_kpm=False,kpath=None,scale=10.0,frand=None,
   else:
     if operator is not None: raise # not implemented
     hkgen = h.get_hk_gen() # get generator
+    if scale is None: # estimate the bounds
+      from .kpmtk import bounds
+      (shift,scale) = bounds.hamiltonian_window(h)
+    else: shift = 0. # no shift
     def pfun(k): # do it for this k-point
       hk = hkgen(k) # get Hamiltonian
       npol = int(scale/delta) # number of polynomials
-      (x,y) = kpm.tdos(hk,scale=scale,npol=npol,ne=ne,frand=frand,
-                   ewindow=ewindow,ntries=ntries) # compute
+      (x,y) = kpm.tdos(hk,scale=scale,shift=shift,npol=npol,ne=ne,
+                   frand=frand,ewindow=ewindow,ntries=ntries) # compute
       return (x,y)
   if kpath is None: 
       kpath = klist.default(h.geometry,nk=nk) # default
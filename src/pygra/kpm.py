@@ -36,7 +36,7 @@ def get_moments(v,m,n=100,use_fortran=use_fortran,test=False):
 
 def python_kpm_moments(v,m,n=100):
   """Python routine to calculate moments"""
-  mus = np.array([0.0j for i in range(2*n)]) # empty arrray for the moments
+  mus = np.zeros(2*n,dtype=np.complex128) # empty arrray for the moments
   am = v.copy() # zero vector
   a = m@v  # vector number 1
   bk = algebra.braket_ww(v,v)
@@ -89,7 +89,7 @@ def python_kpm_moments_clear(v,m,n=100):
 def get_momentsA(v,m,n=100,A=None):
   """ Get the first n moments of a certain vector
   using the Chebychev recursion relations"""
-  mus = np.array([0.0j for i in range(n)]) # empty arrray for the moments
+  mus = np.zeros(n,dtype=np.complex128) # empty arrray for the moments
   am = algebra.matrix2vector(v) # zero vector
   a = m@v  # vector number 1
 #  print(v.shape,A.shape)
@@ -184,6 +184,8 @@ def full_trace(m_in,n=200,use_fortran=use_fortran):
   """ Get full trace of the matrix"""
   m = csc(m_in) # saprse matrix
   nd = m.shape[0] # length of the matrix
+  if not use_fortran: # block recursion with all the sites
+    return sites_dos(m,sites=range(nd),n=n)/nd
   mus = np.array([0.0j for i in range(2*n)])
 #  for i in range(ntries):
   for i in range(nd):
@@ -212,13 +214,81 @@ def local_dos(m_in,i=0,n=200,use_fortran=use_fortran):
 
 
 
-def ldos0d(m_in,i=0,scale=10.,npol=None,ne=500,kernel="jackson"):
-  """Return two arrays with energies and local DOS"""
+def get_window(m_in,scale=None,shift=None):
+  """Return the shift and scale of the Chebyshev expansion. If scale is
+  None, they are obtained from an estimate of the spectral bounds"""
+  if scale is None: # automatic bounds
+    from .kpmtk import bounds
+    (shift0,scale) = bounds.get_window(m_in)
+    if shift is None: shift = shift0
+  if shift is None: shift = 0. # no shift
+  return shift,scale
+
+
+
+def rescale_matrix(m_in,shift=0.,scale=1.):
+  """Map the matrix into the interval [-1,1]"""
+  if shift==0.: return csc_matrix(m_in)/scale # conventional way
+  from .kpmtk import bounds
+  return bounds.rescale(m_in,shift=shift,scale=scale)
+
+
+
+def ldos_map(m_in,scale=None,npol=None,ne=500,kernel="jackson",
+               distance=8,ntries=1,regions=None,shift=None,x=None):
+  """Return the energies and the local DOS in all the sites (or summed
+  in each region), as an array of shape (ne,nsites), from a single
+  recursion with probing vectors. The moments of order up to distance
+  are exact, larger distances use more probing vectors"""
+  if npol is None: npol = ne
+  (shift,scale) = get_window(m_in,scale=scale,shift=shift) # window
+  m = rescale_matrix(m_in,shift=shift,scale=scale) # rescaled matrix
+  from .kpmtk import ldosmap,chebyshev
+  mus = ldosmap.diagonal_moments(m,n=npol,distance=distance,
+                    ntries=ntries,regions=regions) # moments
+  if x is None: xs = np.linspace(-1.0,1.0,ne,endpoint=True)*0.99 # energies
+  else: xs = (x-shift)/scale # use from input
+  if kernel=="jackson": mus = jackson_kernel(mus)
+  elif kernel=="lorentz": mus = lorentz_kernel(mus)
+  else: raise
+  ys = chebyshev.profiles(mus,xs)/np.sqrt(1.-xs*xs)/np.pi # profiles
+  return (shift+scale*xs,ys.T/scale)
+
+
+
+def get_store(m,cache=True,**kwargs):
+  """Moment store of a matrix, cache is True or a folder. The window
+  of the expansion is stored with the moments"""
+  from .kpmtk.store import MomentStore
+  if cache is True: cache = None # default folder
+  return MomentStore(m,folder=cache,**kwargs)
+
+
+
+def sites_dos(m_in,sites=[0],n=200):
+  """Moments of the DOS summed over several sites, using a single
+  block recursion"""
+  from .kpmtk import ldosmap
+  return ldosmap.sites_moments(m_in,sites,n=n)
+
+
+
+def ldos0d(m_in,i=0,scale=None,npol=None,ne=500,kernel="jackson",
+             shift=None,cache=False):
+  """Return two arrays with energies and local DOS. If cache is True (or
+  the name of a folder) the moments are stored in disk and reused"""
   if npol is None: npol = ne
-  mus = local_dos(csc_matrix(m_in)/scale,i=i,n=npol) # get coefficients
+  if cache: # cached moments, with their window
+    store = get_store(m_in,cache,scale=scale,shift=shift)
+    (shift,scale) = store.shift,store.scale
+    mus = store.local_moments(i=i,n=npol)
+  else:
+    (shift,scale) = get_window(m_in,scale=scale,shift=shift) # window
+    m = rescale_matrix(m_in,shift=shift,scale=scale) # rescaled matrix
+    mus = local_dos(m,i=i,n=npol) # get coefficients
   xs = np.linspace(-1.0,1.0,ne,endpoint=True)*0.99 # energies
   ys = generate_profile(mus,xs,kernel=kernel)
-  return (scale*xs,ys/scale)
+  return (shift+scale*xs,ys/scale)
 
 
 
@@ -226,37 +296,73 @@ ldos = ldos0d
 
 
 
-def tdos(m_in,scale=10.,npol=None,ne=500,kernel="jackson",
+def tdos(m_in,scale=None,npol=None,ne=500,kernel="jackson",
               ntries=20,ewindow=None,frand=None,
-              operator=None):
-  """Return two arrays with energies and local DOS"""
+              operator=None,shift=None,precision="double",cache=False):
+  """Return two arrays with energies and local DOS. If scale is None,
+  the spectrum is mapped into [-1,1] using its estimated bounds. If cache
+  is True (or the name of a folder) the moments are stored in disk, and
+  later calls extend them to more moments or random vectors"""
   if npol is None: npol = ne
-  mus = random_trace(m_in/scale,ntries=ntries,n=npol,fun=frand,
-          operator=operator) 
-  if ewindow is None or abs(ewindow)>scale: # no window provided
+  if cache: # use the stored moments, with their window
+    if frand is not None or operator is not None: raise # not implemented
+    store = get_store(m_in,cache,scale=scale,shift=shift,
+                        precision=precision)
+    (shift,scale) = store.shift,store.scale
+    mus = store.random_moments(n=npol,ntries=ntries)
+  else:
+    (shift,scale) = get_window(m_in,scale=scale,shift=shift) # window
+    m = rescale_matrix(m_in,shift=shift,scale=scale) # rescaled matrix
+    mus = random_trace(m,ntries=ntries,n=npol,fun=frand,
+          operator=operator,precision=precision) 
+  if ewindow is None: # no window provided
     xs = np.linspace(-1.0,1.0,ne,endpoint=True)*0.99 # energies
   else:
-    xx = abs(ewindow/scale) # scale
-    xs = np.linspace(-xx,xx,ne,endpoint=True)*0.99 # energies
+    e0 = max([-abs(ewindow),shift-scale]) # lower energy
+    e1 = min([abs(ewindow),shift+scale]) # upper energy
+    if e0>=e1: # no overlap with the spectral window
+      print("ewindow outside the spectral window",shift-scale,shift+scale)
+      raise
+    xs = np.linspace((e0-shift)/scale,(e1-shift)/scale,ne,endpoint=True)*0.99
   ys = generate_profile(mus,xs,kernel=kernel).real
-  return (scale*xs,ys/scale)
+  return (shift+scale*xs,ys/scale)
 
 
 tdos0d = tdos # redefine
 
 
-def total_energy(m_in,scale=10.,npol=None,ne=500,ntries=20):
+def total_energy(m_in,scale=None,npol=None,ne=500,ntries=20):
    x,y = tdos0d(m_in,scale=scale,npol=npol,ne=ne,ntries=ntries)
    z = .5*(np.sign(x)+1.)*x*y # function to integrate
    return np.trapz(z,x)
 
 
 
-def random_trace(m_in,ntries=20,n=200,fun=None,operator=None):
-  """ Calculates local DOS using the KPM"""
+def random_trace(m_in,ntries=20,n=200,fun=None,operator=None,block=True,
+                   memory=None,precision="double",shared=True):
+  """ Calculates local DOS using the KPM. If block is True, the random
+  vectors are propagated in blocks, whose size is chosen
+  from the memory budget (in bytes). Real matrices use real vectors, and
+  precision="single" stores the vectors in single precision. With
+  several cores and shared=True, the matrix is placed in shared memory
+  for a pool of workers"""
   if fun is not None: # check that dimensions are fine
     v0 = fun()
     if len(v0) != m_in.shape[0]: raise
+  if block and shared and fun is None and operator is None:
+    from . import parallel
+    if parallel.cores>1 and not parallel.is_child: # shared memory pool
+      from .kpmtk import sharedkpm
+      return sharedkpm.random_trace(m_in,ntries=ntries,n=n,memory=memory,
+                                      precision=precision)
+  if block: # use sparse matrix-matrix products
+    from .kpmtk import block as kpmblock
+    return kpmblock.random_trace(m_in,ntries=ntries,n=n,fun=fun,
+                                   operator=operator,memory=memory,
+                                   precision=precision)
+  if precision!="double": # only the block recursion changes precision
+    print("precision",precision,"is only available with block=True")
+    raise
   if fun is None:
 #    def fun(): return rand.random(nd) -.5 + 1j*rand.random(nd) -.5j
     def fun(): return (rand.random(nd) - 0.5)*np.exp(2*1j*np.pi*rand.random(nd))
@@ -329,19 +435,22 @@ def correlator0d(m_in,i=0,j=0,scale=10.,npol=None,ne=500,write=True,
 
 
 
-def dm_ij_energy(m_in,i=0,j=0,scale=10.,npol=None,ne=500,x=None):
+def dm_ij_energy(m_in,i=0,j=0,scale=None,npol=None,ne=500,x=None,
+                   shift=None):
   """Return the correlation function"""
   if npol is None: npol = ne
-  mus = get_moments_ij(m_in/scale,n=npol,i=i,j=j,use_fortran=use_fortran)
+  (shift,scale) = get_window(m_in,scale=scale,shift=shift) # window
+  m = rescale_matrix(m_in,shift=shift,scale=scale) # rescaled matrix
+  mus = get_moments_ij(m,n=npol,i=i,j=j,use_fortran=use_fortran)
   if np.sum(np.abs(mus.imag))>0.001:
 #    print("WARNING, off diagonal has nonzero imaginary elements",np.sum(np.abs(mus.imag)))
     pass
   if x is None: xs = np.linspace(-1.0,1.0,ne,endpoint=True)*0.99 # energies
-  else: xs = x/scale # use from input
+  else: xs = (x-shift)/scale # use from input
   ysr = generate_profile(mus.real,xs,kernel="jackson",use_fortran=use_fortran)/scale*np.pi # so it is the Green function
   ysi = generate_profile(mus.imag,xs,kernel="jackson",use_fortran=use_fortran)/scale*np.pi # so it is the Green function
   ys = ysr - 1j*ysi
-  return (scale*xs,ys)
+  return (shift+scale*xs,ys)
 
 
 
@@ -365,8 +474,10 @@ def dm_vivj_energy(m_in,vi,vj,scale=10.,npol=None,ne=500,x=None):
 
 
 
-def generate_profile(mus,xs,kernel="jackson",use_fortran=use_fortran):
-  """ Uses the Chebychev expansion to create a certain profile"""
+def generate_profile(mus,xs,kernel="jackson",use_fortran=use_fortran,
+                       mode="auto"):
+  """ Uses the Chebychev expansion to create a certain profile. With
+  mode="dct" the series is evaluated with a discrete cosine transform"""
   # initialize polynomials
 #  xs = np.array([0.])
   tm = np.zeros(xs.shape) +1.
@@ -374,8 +485,12 @@ def generate_profile(mus,xs,kernel="jackson",use_fortran=use_fortran):
   if kernel=="jackson": mus = jackson_kernel(mus)
   elif kernel=="lorentz": mus = lorentz_kernel(mus)
   else: raise
+  from .kpmtk import chebyshev
+  if mode=="auto": mode = chebyshev.choose_mode(len(mus),len(xs))
   if use_fortran: # call the fortran routine
     ys = kpmf90.generate_profile(mus,xs) 
+  elif mode=="dct": # use the discrete cosine transform
+    ys = chebyshev.cosine_profile(np.array(mus),xs)/np.sqrt(1.-xs*xs)
   else: # do a python loop
     ys = np.zeros(xs.shape,dtype=np.complex) + mus[0] # first term
     # loop over all contributions
@@ -392,7 +507,8 @@ def generate_profile(mus,xs,kernel="jackson",use_fortran=use_fortran):
 
 
 
-def generate_green_profile(mus,xs,kernel="jackson",use_fortran=use_fortran):
+def generate_green_profile(mus,xs,kernel="jackson",use_fortran=use_fortran,
+                             mode="auto"):
   """ Uses the Chebychev expansion to create a certain profile"""
   # initialize polynomials
 #  xs = np.array([0.])
@@ -402,7 +518,13 @@ def generate_green_profile(mus,xs,kernel="jackson",use_fortran=use_fortran):
   if kernel=="jackson": mus = jackson_kernel(mus)
   elif kernel=="lorentz": mus = lorentz_kernel(mus)
   else: raise
-  if True:
+  from .kpmtk import chebyshev
+  if mode=="auto": mode = chebyshev.choose_mode(len(mus),len(xs))
+  if mode=="dct": # use the discrete cosine and sine transforms
+    ys = chebyshev.exponential_profile(np.array(mus,dtype=np.complex),xs)
+    ys = ys/np.sqrt(1.-xs*xs)
+    return 1j*2*ys/np.pi
+  else:
     for i in range(1,len(mus)): # loop over mus
       ys += np.exp(1j*i*np.arccos(xs))*mus[i] # add contribution
     ys = ys/np.sqrt(1.-xs*xs)
@@ -420,35 +542,25 @@ def generate_green_profile(mus,xs,kernel="jackson",use_fortran=use_fortran):
 
 def dos(m_in,xs,ntries=20,n=200,scale=10.):
   """Return the density of states"""
-  if scale is None: scale = 10.*np.max(np.abs(m_in.data)) # estimate of the value
-  mus = random_trace(m_in/scale,ntries=ntries,n=n)
-  ys = generate_profile(mus,xs/scale) # generate the DOS
+  (shift,scale) = get_window(m_in,scale=scale) # window
+  m = rescale_matrix(m_in,shift=shift,scale=scale) # rescaled matrix
+  mus = random_trace(m,ntries=ntries,n=n)
+  ys = generate_profile(mus,(xs-shift)/scale) # generate the DOS
   return ys # return the DOS 
 
 
 
 def jackson_kernel(mus):
   """ Modify coeficient using the Jackson Kernel"""
-  mo = mus.copy() # copy array
-  n = len(mo)
-  pn = np.pi/(n+1.) # factor
-  for i in range(n):
-    fac = ((n-i+1)*np.cos(pn*i)+np.sin(pn*i)/np.tan(pn))/(n+1)
-    mo[i] *= fac
-  return mo
+  from .kpmtk import chebyshev
+  return mus*chebyshev.jackson_coefficients(mus.shape[-1])
 
 
 
 def lorentz_kernel(mus):
   """ Modify coeficient using the Jackson Kernel"""
-  mo = mus.copy() # copy array
-  n = len(mo)
-  pn = np.pi/(n+1.) # factor
-  lamb = 3.
-  for i in range(n):
-    fac = np.sinh(lamb*(1.-i/n))/np.sinh(lamb)
-    mo[i] *= fac
-  return mo
+  from .kpmtk import chebyshev
+  return mus*chebyshev.lorentz_coefficients(mus.shape[-1],lamb=3.)
 
 
 
@@ -456,16 +568,13 @@ def lorentz_kernel(mus):
 
 def fejer_kernel(mus):
   """Default kernel"""
-  n = len(mus)
-  mo = mus.copy()
-  for i in range(len(mus)):
-    mo[i] *= (1.-float(i)/n) 
-  return mo
+  from .kpmtk import chebyshev
+  return mus*chebyshev.fejer_coefficients(mus.shape[-1])
 
 
 
 def edge_dos(intra0,inter0,scale=4.,w=20,npol=300,ne=500,bulk=False,
-                use_random=True,nrand=20):
+                use_random=True,nrand=20,cache=False):
   """Calculated the edge DOS using the KPM"""
   h = [[None for j in range(w)] for i in range(w)]
   intra = csc_matrix(intra0)
@@ -479,10 +588,11 @@ def edge_dos(intra0,inter0,scale=4.,w=20,npol=300,ne=500,bulk=False,
   dsb = np.zeros(ne)
   norb = intra0.shape[0] # orbitals ina cell
   for i in range(norb):
-    (xs,ys) = ldos0d(h,i=i,scale=scale,npol=npol,ne=ne) 
+    (xs,ys) = ldos0d(h,i=i,scale=scale,npol=npol,ne=ne,cache=cache) 
     ds += ys # store
     if bulk:
-      (xs,zs) = ldos0d(h,i=w*norb//2 + i,scale=scale,npol=npol,ne=ne) 
+      (xs,zs) = ldos0d(h,i=w*norb//2 + i,scale=scale,npol=npol,ne=ne,
+                       cache=cache) 
       dsb += zs # store
   if not bulk: return (xs,ds/w)
   else: return (xs,ds/w,dsb/w)
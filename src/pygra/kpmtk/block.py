@@ -0,0 +1,173 @@
+from __future__ import print_function,division
+import numpy as np
+from scipy.sparse import csr_matrix,issparse
+from .. import parallel
+
+# Block Chebyshev recursion. A set of B vectors is stored as an N x B
+# array and all of them are propagated at once, so that every step of the
+# recursion is a sparse matrix-matrix product instead of B sparse
+# matrix-vector products.
+# For real symmetric matrices the recursion is done with real vectors,
+# and with precision="single" the vectors are stored in single precision
+# while the moments are accumulated in double precision. Since the
+# Chebyshev recursion is stable, the rounding errors only grow linearly
+# with the order, and the moments keep a relative error of order
+# n*1e-7, see check_precision
+
+memory_budget = 2**29 # memory for the blocks of vectors, in bytes
+max_block = 64 # maximum number of vectors in a block
+
+
+def block_size(nd,nv,memory=None,dtype=np.complex128):
+  """Number of vectors propagated at once, given the dimension of the
+  matrix, the total number of vectors and the memory budget"""
+  if memory is None: memory = memory_budget
+  nbytes = 4*nd*np.dtype(dtype).itemsize # four arrays of each vector
+  b = int(memory//nbytes) # vectors that fit in memory
+  return max([1,min([b,max_block,nv])])
+
+
+
+def is_real(m):
+  """Check if a matrix has only real entries"""
+  if m is None: return True
+  if issparse(m): m = m.data # only the non zero entries
+  if not np.iscomplexobj(m): return True
+  return np.max(np.abs(np.array(m).imag),initial=0.)==0.
+
+
+
+def recursion_dtype(real=False,precision="double"):
+  """Data type of the vectors in the recursion"""
+  if precision=="double":
+    if real: return np.float64
+    else: return np.complex128
+  elif precision=="single":
+    if real: return np.float32
+    else: return np.complex64
+  else: raise
+
+
+
+def convert(m,dtype):
+  """Convert a matrix or array to the data type of the recursion"""
+  if np.issubdtype(dtype,np.floating) and np.iscomplexobj(m): m = m.real
+  return m.astype(dtype)
+
+
+
+def vdot(a,b):
+  """Scalar product, accumulated in double precision"""
+  if a.dtype in [np.float64,np.complex128]: return np.vdot(a,b)
+  if np.iscomplexobj(a): dtype = np.complex128
+  else: dtype = np.float64
+  return np.sum(np.conjugate(a)*b,dtype=dtype)
+
+
+
+def random_block(nd,nv,real=False):
+  """Block of normalized random vectors, with random phases if the
+  vectors are complex"""
+  vs = np.random.random((nd,nv)) - 0.5
+  if not real: vs = vs*np.exp(2j*np.pi*np.random.random((nd,nv)))
+  return vs/np.sqrt(np.sum(np.abs(vs)**2,axis=0)) # normalize
+
+
+
+def block_moments(vs,m,n=100):
+  """Chebyshev moments of a block of vectors, summed over the vectors.
+  Returns 2n moments, using the same doubling relations as
+  kpm.python_kpm_moments. The recursion uses the data type of vs"""
+  mus = np.zeros(2,dtype=np.complex128) # moments
+  am = vs.copy() # first block
+  a = m@am # second block
+  mus[0] = vdot(am,am) # mu0
+  mus[1] = vdot(a,am) # mu1
+  (mus,am,a) = continue_moments(m,am,a,mus,n=n)
+  return mus
+
+
+
+def continue_moments(m,am,a,mus,n=100):
+  """Continue the recursion of block_moments up to 2n moments, given
+  the moments already computed and the last two blocks of vectors.
+  Returns the moments and the new last two blocks"""
+  k = len(mus)//2 # steps already done
+  out = np.zeros(2*max([n,k]),dtype=np.complex128) # moments
+  out[0:len(mus)] = mus
+  mu0,mu1 = mus[0],mus[1]
+  for i in range(k,n):
+    ap = m@a # recursion relation, in place
+    ap *= 2. ; ap -= am
+    out[2*i] = 2.*vdot(a,a) - mu0
+    out[2*i+1] = 2.*vdot(ap,a) - mu1
+    am,a = a,ap # next iteration
+  return out,am,a
+
+
+
+def block_moments_A(vs,m,n=100,A=None):
+  """Chebyshev moments of an operator A for a block of vectors, summed
+  over the vectors. Same convention as kpm.get_momentsA"""
+  mus = np.zeros(n,dtype=np.complex128) # moments
+  Av = A.conjugate().T@vs # operator times the vectors
+  am = vs.copy() # first block
+  a = m@am # second block
+  mus[0] = vdot(Av,am)
+  mus[1] = vdot(Av,a)
+  for i in range(2,n):
+    ap = m@a # recursion relation, in place
+    ap *= 2. ; ap -= am
+    mus[i] = vdot(Av,ap)
+    am,a = a,ap # next iteration
+  return mus
+
+
+
+def random_trace(m,ntries=20,n=200,fun=None,operator=None,memory=None,
+                   precision="double"):
+  """Stochastic trace of the Chebyshev moments, propagating the random
+  vectors in blocks. Real matrices are propagated with real vectors"""
+  m = csr_matrix(m) # fast matrix-matrix products
+  nd = m.shape[0] # dimension
+  if operator is not None: # convert the operator
+    if issparse(operator): operator = csr_matrix(operator)
+    else: operator = np.array(operator)
+  real = is_real(m) and is_real(operator) # real arithmetic
+  if fun is not None: real = real and np.isrealobj(fun()) # real vectors
+  dtype = recursion_dtype(real=real,precision=precision) # data type
+  m = convert(m,dtype) # convert the matrix
+  if operator is not None: operator = convert(operator,dtype)
+  nb = block_size(nd,ntries,memory=memory,dtype=dtype) # vectors per block
+  sizes = [min([nb,ntries-i]) for i in range(0,ntries,nb)] # block sizes
+  seed = np.random.randint(2**30) # base seed, each block gets its own
+  def fblock(args): # compute a single block
+    (i,b) = args
+    np.random.seed(seed+i) # different vectors in each forked worker
+    if fun is None: vs = random_block(nd,b,real=real) # default vectors
+    else:
+      vs = np.array([fun() for i in range(b)]).T # user provided
+      vs = vs/np.sqrt(np.sum(np.abs(vs)**2,axis=0)) # normalize
+    vs = convert(vs,dtype) # convert the vectors
+    if operator is None: return block_moments(vs,m,n=n)
+    else: return block_moments_A(vs,m,n=2*n,A=operator)
+  tasks = list(enumerate(sizes)) # index and size of each block
+  if len(sizes)==1: out = [fblock(tasks[0])] # single block
+  else: out = parallel.pcall(fblock,tasks) # several blocks
+  return np.sum(out,axis=0)/ntries
+
+
+
+def check_precision(m,n=200,nv=4):
+  """Return the maximum difference between the moments computed in
+  single and double precision, for the same random vectors. The moments
+  of a normalized vector are bounded by one, so this is the error of
+  the single precision recursion"""
+  m = csr_matrix(m) # sparse matrix
+  real = is_real(m) # real matrix
+  vs = random_block(m.shape[0],nv,real=real) # random vectors
+  out = [] # output
+  for p in ["double","single"]:
+    dtype = recursion_dtype(real=real,precision=p) # data type
+    out.append(block_moments(convert(vs,dtype),convert(m,dtype),n=n)/nv)
+  return np.max(np.abs(out[0]-out[1]))
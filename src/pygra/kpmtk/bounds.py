@@ -0,0 +1,110 @@
+from __future__ import print_function,division
+import numpy as np
+from scipy.sparse import csr_matrix,identity,issparse
+from scipy.linalg import eigh_tridiagonal
+
+# Estimation of the spectral bounds of a Hermitian matrix, used to map
+# the spectrum into [-1,1] for the Chebyshev expansions. The Gershgorin
+# bounds are rigorous but loose, the Lanczos bounds are tight but only
+# estimates, so the Lanczos window is enlarged by its residual and a
+# safety margin and then intersected with the Gershgorin one. For Bloch
+# Hamiltonians, the Gershgorin circles of intra + sum_R |t_R| contain
+# the spectrum for every k, and are used as the window
+
+margin = 0.05 # safety margin, relative to the half width
+nlanczos = 40 # number of Lanczos iterations
+seed = 0 # seed of the Lanczos start vector, so the window is reproducible
+
+
+def gershgorin_bounds(m):
+  """Rigorous bounds using the Gershgorin circles"""
+  m = csr_matrix(m) # sparse matrix
+  d = m.diagonal().real # diagonal
+  r = np.array(abs(m).sum(axis=1)).reshape(-1) - np.abs(d) # radii
+  return np.min(d-r),np.max(d+r)
+
+
+
+def lanczos_bounds(m,n=nlanczos):
+  """Estimate of the extremal eigenvalues using the Lanczos algorithm,
+  each one displaced by the norm of its residual"""
+  m = csr_matrix(m) # sparse matrix
+  nd = m.shape[0] # dimension
+  if nd<=2*n: # small matrix, just diagonalize
+    es = np.linalg.eigvalsh(m.todense())
+    return np.min(es),np.max(es)
+  rs = np.random.RandomState(seed) # same start vector in every call
+  v = rs.random_sample(nd) - 0.5 + 1j*(rs.random_sample(nd) - 0.5)
+  v = v/np.linalg.norm(v) # normalize
+  vm = np.zeros(nd,dtype=np.complex128) # previous vector
+  alphas,betas = [],[] # coefficients of the tridiagonal matrix
+  b = 0. # initial beta
+  for i in range(n): # Lanczos iterations
+    w = m@v - b*vm # apply the matrix
+    a = np.vdot(v,w).real # diagonal element
+    w = w - a*v
+    b = np.linalg.norm(w) # off diagonal element
+    alphas.append(a)
+    if b<1e-12: break # invariant subspace
+    betas.append(b)
+    vm,v = v,w/b # next iteration
+  alphas = np.array(alphas)
+  betas = np.array(betas[0:len(alphas)-1]) # off diagonal
+  es,vs = eigh_tridiagonal(alphas,betas) # Ritz values
+  res = b*np.abs(vs[-1,:]) # residuals
+  dw = margin*(es[-1] - es[0]) # extra safety margin
+  return es[0] - res[0] - dw,es[-1] + res[-1] + dw
+
+
+
+def spectral_bounds(m,n=nlanczos):
+  """Bounds of the spectrum of a Hermitian matrix"""
+  (g0,g1) = gershgorin_bounds(m) # rigorous bounds
+  (l0,l1) = lanczos_bounds(m,n=n) # tight bounds
+  return max([g0,l0]),min([g1,l1])
+
+
+
+def bounds2window(e0,e1,margin=margin):
+  """Center and half width of the window, with a safety margin"""
+  shift = (e0 + e1)/2. # center
+  scale = (e1 - e0)/2.*(1. + margin) # half width
+  if scale<1e-6: scale = 1e-6 + abs(shift)*margin # degenerate spectrum
+  return shift,scale
+
+
+
+def get_window(m,margin=margin):
+  """Return the shift and scale so that (m - shift)/scale has its
+  spectrum inside [-1,1]"""
+  (e0,e1) = spectral_bounds(m) # bounds of the spectrum
+  return bounds2window(e0,e1,margin=margin)
+
+
+
+def bloch_bounds(h):
+  """Gershgorin bounds valid for all the Bloch Hamiltonians"""
+  h = h.get_multicell() # all the hoppings
+  intra = csr_matrix(h.intra)
+  d = intra.diagonal().real # onsite energies
+  r = np.array(abs(intra).sum(axis=1)).reshape(-1) - np.abs(d) # radii
+  for t in h.hopping: # the phases can align for some k
+    r = r + np.array(abs(csr_matrix(t.m)).sum(axis=1)).reshape(-1)
+  return np.min(d-r),np.max(d+r)
+
+
+
+def hamiltonian_window(h,margin=margin):
+  """Shift and scale valid for all the Bloch Hamiltonians of a
+  Hamiltonian object"""
+  if h.dimensionality==0: return get_window(h.intra,margin=margin)
+  (e0,e1) = bloch_bounds(h) # rigorous for every k
+  return bounds2window(e0,e1,margin=margin)
+
+
+
+def rescale(m,shift=0.,scale=1.):
+  """Return the sparse matrix (m - shift)/scale"""
+  m = csr_matrix(m) # sparse matrix
+  if shift!=0.: m = m - shift*identity(m.shape[0],format="csr")
+  return m/scale
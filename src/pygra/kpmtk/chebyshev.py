@@ -0,0 +1,126 @@
+from __future__ import print_function,division
+import numpy as np
+from scipy.fft import dct,dst,next_fast_len
+from scipy.interpolate import CubicSpline
+
+# Reconstruction of Chebyshev series. Writing x = cos(theta), the series
+#   sum_n mu_n T_n(x) = sum_n mu_n cos(n theta)
+# is evaluated at once in all the Chebyshev nodes with a DCT, and then
+# interpolated to the desired energies. Since the series is a smooth
+# trigonometric polynomial in theta, a cubic spline with several nodes per
+# oscillation is enough. The cost is O(N log N) instead of O(N*Ne)
+
+oversampling = 8 # number of nodes per moment
+
+
+def jackson_coefficients(n):
+  """Coefficients of the Jackson kernel"""
+  i = np.arange(n) # index of the moments
+  pn = np.pi/(n+1.) # factor
+  return ((n-i+1)*np.cos(pn*i)+np.sin(pn*i)/np.tan(pn))/(n+1)
+
+
+
+def lorentz_coefficients(n,lamb=3.):
+  """Coefficients of the Lorentz kernel"""
+  i = np.arange(n) # index of the moments
+  return np.sinh(lamb*(1.-i/n))/np.sinh(lamb)
+
+
+
+def fejer_coefficients(n):
+  """Coefficients of the Fejer kernel"""
+  return 1. - np.arange(n)/n
+
+
+
+def number_of_nodes(n):
+  """Number of Chebyshev nodes used for n moments"""
+  return next_fast_len(oversampling*n)
+
+
+
+def chebyshev_angles(nn):
+  """Angles of the Chebyshev nodes, x = cos(theta)"""
+  return np.pi*(np.arange(nn) + 0.5)/nn
+
+
+
+def choose_mode(n,ne):
+  """Decide if it is worth using the DCT"""
+  nn = number_of_nodes(n) # number of nodes
+  cost_direct = n*ne # cost of the direct sum
+  cost_dct = 10*nn*np.log2(nn) + 20*ne # cost of the transform
+  if cost_dct<cost_direct: return "dct"
+  else: return "direct"
+
+
+
+def cosine_series(mus,nn):
+  """Return mu_0 + 2 sum_n mu_n cos(n theta_k) in the Chebyshev nodes.
+  If mus has two dimensions, the moments are in the last axis"""
+  c = np.zeros(mus.shape[:-1]+(nn,),dtype=mus.dtype) # pad
+  c[...,0:mus.shape[-1]] = mus
+  if np.iscomplexobj(c): 
+    return dct(c.real,type=3) + 1j*dct(c.imag,type=3)
+  else: return dct(c,type=3)
+
+
+
+def sine_series(mus,nn):
+  """Return sum_n mu_n sin(n theta_k) in the Chebyshev nodes"""
+  c = np.zeros(mus.shape[:-1]+(nn,),dtype=mus.dtype) # pad
+  c[...,0:mus.shape[-1]-1] = mus[...,1:]
+  if np.iscomplexobj(c): 
+    return (dst(c.real,type=3) + 1j*dst(c.imag,type=3))/2.
+  else: return dst(c,type=3)/2.
+
+
+
+def interpolate_angles(ths,ys,xs):
+  """Interpolate a function known at the Chebyshev nodes to xs"""
+  t = np.arccos(np.clip(xs,-1.,1.)) # angles of the output points
+  if np.iscomplexobj(ys):
+    return (CubicSpline(ths,ys.real,axis=-1)(t) + 
+              1j*CubicSpline(ths,ys.imag,axis=-1)(t))
+  else: return CubicSpline(ths,ys,axis=-1)(t)
+
+
+
+def cosine_profile(mus,xs):
+  """Evaluate mu_0 + 2 sum_n mu_n T_n(x)"""
+  nn = number_of_nodes(mus.shape[-1]) # number of nodes
+  ys = cosine_series(mus,nn) # values in the nodes
+  return interpolate_angles(chebyshev_angles(nn),ys,xs)
+
+
+
+def exponential_profile(mus,xs):
+  """Evaluate mu_0/2 + sum_n mu_n exp(i n arccos(x))"""
+  nn = number_of_nodes(mus.shape[-1]) # number of nodes
+  ys = cosine_series(mus,nn)/2. + 1j*sine_series(mus,nn) # in the nodes
+  return interpolate_angles(chebyshev_angles(nn),ys,xs)
+
+
+
+def direct_profile(mus,xs):
+  """Evaluate mu_0 + 2 sum_n mu_n T_n(x) as a matrix product, for
+  moments with shape (nsets,n)"""
+  n = mus.shape[-1] # number of moments
+  ts = np.cos(np.outer(np.arange(n),np.arccos(np.clip(xs,-1.,1.))))
+  ts[1:,:] *= 2. # factor of the series
+  return mus@ts
+
+
+
+def profiles(mus,xs,mode="auto",nchunk=1000):
+  """Evaluate the Chebyshev series of several sets of moments, with
+  shape (nsets,n), in chunks"""
+  if mode=="auto": mode = choose_mode(mus.shape[-1],len(xs))
+  if mode=="dct": 
+    f = cosine_profile
+    nn = number_of_nodes(mus.shape[-1]) # number of nodes
+    nchunk = max([1,min([nchunk,2**23//nn])]) # limit the memory
+  else: f = direct_profile
+  return np.concatenate([f(mus[i:i+nchunk],xs) 
+                            for i in range(0,mus.shape[0],nchunk)])
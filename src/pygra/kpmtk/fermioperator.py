@@ -0,0 +1,105 @@
+from __future__ import print_function,division
+import numpy as np
+from scipy.sparse import csr_matrix
+from . import block
+from . import chebyshev
+from .ldosmap import coloring
+
+# Chebyshev expansion of the Fermi operator. With H rescaled to [-1,1],
+#   rho = f(H) = sum_n c_n T_n(H)
+# and the columns rho|j> are obtained with a single recursion over a
+# block of vectors. The elements on the sparsity pattern of H are
+# computed with probing vectors: sites with the same color are farther
+# apart than a certain distance, so that the sum of the columns of the
+# sites of a color gives rho_ij for the neighbors i of each site j, up to
+# the (exponentially small in a gapped or hot system) elements of rho
+# between sites beyond that distance
+
+
+def fermi_coefficients(n=200,mu=0.,temperature=0.,kernel="jackson"):
+  """Chebyshev coefficients of the Fermi function f(x) of the rescaled
+  energy x, with the chemical potential and temperature in rescaled
+  units"""
+  if temperature==0.: # step function, analytic coefficients
+    a = np.arccos(np.clip(mu,-1.,1.)) # angle of the chemical potential
+    ns = np.arange(1,n)
+    cs = np.zeros(n) # coefficients
+    cs[0] = 1. - a/np.pi
+    cs[1:] = -2.*np.sin(ns*a)/(ns*np.pi)
+  else: # Fermi-Dirac, by a DCT on Chebyshev nodes
+    from scipy.fft import dct
+    nx = chebyshev.number_of_nodes(n) # number of nodes
+    xs = np.cos(chebyshev.chebyshev_angles(nx)) # nodes
+    fs = 0.5*(1. - np.tanh((xs-mu)/(2.*temperature))) # Fermi function
+    cs = dct(fs,type=2)[0:n]/nx # coefficients
+    cs[0] /= 2.
+  if kernel=="jackson": cs = cs*chebyshev.jackson_coefficients(n)
+  elif kernel=="lorentz": cs = cs*chebyshev.lorentz_coefficients(n)
+  elif kernel=="fejer": cs = cs*chebyshev.fejer_coefficients(n)
+  elif kernel is None: pass
+  else: raise
+  return cs
+
+
+
+def apply_expansion(m,vs,cs):
+  """Apply sum_n c_n T_n(m) to a block of vectors"""
+  am = vs.copy() ; out = cs[0]*am # first term
+  if len(cs)==1: return out
+  a = m@am ; out += cs[1]*a
+  for k in range(2,len(cs)): # recursion
+    ap = m@a ; ap *= 2. ; ap -= am
+    out += cs[k]*ap
+    am,a = a,ap # next iteration
+  return out
+
+
+
+def dm_columns(m,cols,cs,memory=None):
+  """Columns rho|j> of the density matrix, as an array of shape
+  (N,len(cols)), using blocks of unit vectors"""
+  m = csr_matrix(m) # sparse matrix
+  nd = m.shape[0] # dimension
+  cols = np.array(cols,dtype=int)
+  out = np.zeros((nd,len(cols)),dtype=np.complex128) # output
+  nb = block.block_size(nd,len(cols),memory=memory) # vectors in a block
+  for i in range(0,len(cols),nb): # loop over blocks
+    c = cols[i:i+nb] # columns of this block
+    vs = np.zeros((nd,len(c)),dtype=np.complex128)
+    vs[c,np.arange(len(c))] = 1. # unit vectors
+    out[:,i:i+nb] = apply_expansion(m,vs,cs)
+  return out
+
+
+
+def dm_pairs(m,pairs,cs,memory=None):
+  """Elements rho_ij for a list of pairs (i,j), exactly, with a single
+  recursion for all the different columns"""
+  pairs = np.array(pairs,dtype=int).reshape((-1,2))
+  cols,inv = np.unique(pairs[:,1],return_inverse=True) # different columns
+  rc = dm_columns(m,cols,cs,memory=memory) # compute the columns
+  return rc[pairs[:,0],inv]
+
+
+
+def dm_pattern(m,cs,distance=6,memory=None):
+  """Density matrix on the sparsity pattern of the matrix (including
+  the diagonal), using probing vectors, as a sparse matrix"""
+  m = csr_matrix(m) # sparse matrix
+  nd = m.shape[0] # dimension
+  if distance<2: raise # the neighbors of a site must have different colors
+  p = csr_matrix(m,dtype=bool) # sparsity pattern
+  p = (p + p.T + csr_matrix((np.ones(nd,dtype=bool),
+                 (np.arange(nd),np.arange(nd))),shape=(nd,nd))).tocoo()
+  colors = coloring(m,distance=distance) # color the sites
+  nc = np.max(colors) + 1 # number of colors
+  vs = np.zeros((nd,nc),dtype=np.complex128) # probing vectors
+  vs[np.arange(nd),colors] = 1.
+  nb = block.block_size(nd,nc,memory=memory) # vectors in a block
+  data = np.zeros(len(p.row),dtype=np.complex128) # elements of rho
+  for i in range(0,nc,nb): # loop over blocks
+    w = apply_expansion(m,vs[:,i:i+nb],cs) # rho on the probing vectors
+    ic = colors[p.col] - i # column of each element in this block
+    inb = (ic>=0) & (ic<w.shape[1]) # elements in this block
+    data[inb] = w[p.row[inb],ic[inb]]
+  return csr_matrix((data,(p.row,p.col)),shape=(nd,nd))
@@ -0,0 +1,156 @@
+from __future__ import print_function,division
+import os
+import numpy as np
+from scipy.sparse import csr_matrix
+from . import block
+from .chebyshev import jackson_coefficients
+
+# Kubo conductivity with the kernel polynomial method. The double
+# Chebyshev moments
+#   mu_mn = Tr[v_a T_m(H) v_b T_n(H)]/N
+# are computed stochastically with blocks of random vectors |r>, as
+#   <r|v_a T_m v_b T_n|r> = (T_m v_a |r>)^dagger v_b (T_n |r>)
+# The left vectors are stored in chunks of m, whose size is chosen from
+# the memory budget, and the right recursion is redone for each chunk.
+# The partial moments can be stored in a checkpoint file after each chunk,
+# so that a long calculation can be restarted
+
+
+def velocity_matrix(h,k=[0.,0.,0.],direction="x"):
+  """Velocity operator v = i[H,r] in a certain direction, including the
+  positions inside the unit cell and the lattice vectors"""
+  from ..operators import get_position
+  ii = {"x":0,"y":1,"z":2}[direction] # index of the direction
+  X = csr_matrix(get_position(h,mode=direction)) # position operator
+  def comm(t): return X@t - t@X # commutator with the position
+  m = csr_matrix(h.intra) # intracell term
+  v = 1j*comm(m) # intracell velocity
+  if h.dimensionality>0: # add the hoppings to other cells
+    hm = h.get_multicell() # multicell Hamiltonian
+    g = h.geometry # geometry
+    a = np.array([g.a1,g.a2,g.a3]) # lattice vectors
+    for t in hm.hopping: # loop over hoppings
+      tm = csr_matrix(t.m) # hopping matrix
+      dr = np.array(t.dir)@a # displacement of the cell
+      ph = g.bloch_phase(t.dir,k) # Bloch phase
+      v = v + 1j*(comm(tm) - dr[ii]*tm)*ph
+  return csr_matrix(v)
+
+
+
+def chebyshev_vectors(m,v0):
+  """Generator of the vectors T_n(m) v0"""
+  am = v0.copy() ; yield am
+  a = m@am ; yield a
+  while True:
+    ap = m@a ; ap *= 2. ; ap -= am
+    yield ap
+    am,a = a,ap
+
+
+
+def chunk_size(nd,nb,n,memory=None):
+  """Number of left vectors stored at once"""
+  if memory is None: memory = block.memory_budget
+  c = int(memory//(16*nd*nb)) # vectors that fit in memory
+  return max([1,min([c,n])])
+
+
+
+def kubo_moments(m,va,vb,n=100,ntries=10,memory=None,checkpoint=None,
+                   seed=None,info=False):
+  """Double Chebyshev moments of Tr[va T_m vb T_n]/N, with shape (n,n).
+  m must have its spectrum inside [-1,1]. If checkpoint is the name
+  of a file, the partial result is stored there after each chunk and
+  the calculation is resumed if the file exists"""
+  m,va,vb = csr_matrix(m),csr_matrix(va),csr_matrix(vb)
+  nd = m.shape[0] # dimension
+  nb = block.block_size(nd,ntries,memory=memory) # vectors per block
+  nblocks = int(np.ceil(ntries/nb)) # number of blocks
+  nc = chunk_size(nd,nb,n,memory=memory) # left vectors per chunk
+  chunks = [(i,min([i+nc,n])) for i in range(0,n,nc)] # chunks
+  mus = np.zeros((n,n),dtype=np.complex128) # moments
+  start = (0,0) # first block and chunk
+  if seed is None: seed = np.random.randint(2**30) # seed of the vectors
+  layout = np.array([n,ntries,nd,nb,nc]) # defines the partial moments
+  if checkpoint is not None and not checkpoint.endswith(".npz"):
+    checkpoint += ".npz" # same name when saving and resuming
+  if checkpoint is not None and os.path.isfile(checkpoint): # restart
+    d = np.load(checkpoint)
+    if "layout" not in d or not np.array_equal(d["layout"],layout):
+      print("Checkpoint incompatible with this calculation",checkpoint)
+      raise
+    mus,seed = d["mus"],int(d["seed"])
+    start = (int(d["iblock"]),int(d["ichunk"]))
+  for ib in range(start[0],nblocks): # loop over blocks
+    b = min([nb,ntries-ib*nb]) # vectors in this block
+    np.random.seed(seed+ib) # reproducible random vectors
+    r0 = block.random_block(nd,b) # random vectors
+    left = chebyshev_vectors(m,va@r0) # generator of the left vectors
+    for ic in range(len(chunks)): # loop over chunks
+      (m0,m1) = chunks[ic]
+      ls = np.array([next(left) for i in range(m0,m1)]) # left vectors
+      if ib==start[0] and ic<start[1]: continue # already done
+      ls = np.conjugate(ls.reshape((m1-m0,nd*b))) # as a matrix
+      right = chebyshev_vectors(m,r0) # generator of the right vectors
+      for j in range(n): # loop over right vectors
+        w = vb@next(right) # velocity times the vector
+        mus[m0:m1,j] += ls@w.reshape(nd*b) # scalar products
+      if info: print("Kubo moments, block",ib,"chunk",ic)
+      if checkpoint is not None: # store the partial result
+        nxt = (ib,ic+1) if ic+1<len(chunks) else (ib+1,0)
+        np.savez(checkpoint,mus=mus,seed=seed,layout=layout,
+                  iblock=nxt[0],ichunk=nxt[1])
+  return mus/ntries
+
+
+
+def kernel_moments(mus):
+  """Apply the Jackson kernel to the double moments"""
+  g = jackson_coefficients(mus.shape[0]) # kernel
+  return mus*np.outer(g,g)
+
+
+
+def greenwood(mus,xs):
+  """Return Tr[va delta(x-H) vb delta(x-H)]/N for the rescaled
+  Hamiltonian, from the double moments"""
+  n = mus.shape[0]
+  mo = kernel_moments(mus) # apply the kernel
+  ts = np.cos(np.outer(np.arange(n),np.arccos(xs))) # polynomials
+  ts[1:,:] *= 2. # factor of the series
+  ys = np.sum(ts*(mo@ts),axis=0) # sum_mn T_m mu_mn T_n
+  return ys.real/(np.pi**2*(1.-xs*xs))
+
+
+
+def bastin_integrand(mus,xs):
+  """Integrand of the Kubo-Bastin formula, for the rescaled
+  Hamiltonian"""
+  n = mus.shape[0]
+  mo = kernel_moments(mus) # apply the kernel
+  fac = np.ones(n) ; fac[0] = 0.5 # factors 1/(1+delta)
+  mo = mo*np.outer(fac,fac)
+  th = np.arccos(xs) # angles
+  ns = np.arange(n) # indexes
+  ts = np.cos(np.outer(ns,th)) # T_n(x)
+  sq = np.sqrt(1.-xs*xs) # square root
+  # (x - i n sqrt(1-x^2)) exp(i n arccos x)
+  es = (xs[None,:] - 1j*ns[:,None]*sq[None,:])*np.exp(1j*np.outer(ns,th))
+  # sum_mn Gamma_mn mu_mn, with Gamma_mn = e_m T_n + T_m conj(e_n), the
+  # first index belongs to va and the second one to vb
+  ys = np.sum(es*(mo@ts),axis=0) + np.sum(ts*(mo@np.conjugate(es)),axis=0)
+  return ys.real/(1.-xs*xs)**2
+
+
+
+def bastin(mus,xs,nx=None):
+  """Zero temperature Kubo-Bastin conductivity for Fermi energies xs
+  of the rescaled Hamiltonian, without prefactors"""
+  n = mus.shape[0]
+  if nx is None: nx = 4*n # number of integration points
+  xi = np.cos(np.pi*(np.arange(nx)[::-1] + 0.5)/nx) # Chebyshev nodes
+  ys = bastin_integrand(mus,xi) # integrand
+  dx = np.diff(xi) # integrate with the trapezoidal rule
+  cs = np.concatenate([[0.],np.cumsum((ys[1:]+ys[:-1])/2.*dx)])
+  return np.interp(xs,xi,cs) # interpolate
@@ -0,0 +1,99 @@
+from __future__ import print_function,division
+import numpy as np
+from scipy.sparse import csr_matrix,identity
+from . import block
+
+# Local DOS in all the sites from a single Chebyshev recursion. The sites
+# are colored so that two sites with the same color are farther apart than
+# a certain distance in the graph of the Hamiltonian, and a probing vector
+# with random phases is built for each color. The diagonal of T_n(H) is
+#   <i|T_n(H)|i> ~ conj(v_c[i]) (T_n(H) v_c)[i]
+# where c is the color of i. The error comes only from pairs of sites with
+# the same color, whose matrix elements decay with their distance, and is
+# further reduced by the random phases and by averaging over several tries
+
+
+def coloring(m,distance=2):
+  """Greedy coloring of the sites, so that sites with the same color
+  are separated by more than distance hoppings"""
+  p = csr_matrix(m,dtype=bool) # sparsity pattern
+  p = (p + p.T + identity(m.shape[0],dtype=bool)).tocsr() # symmetric,
+  # with the diagonal so that the powers contain all the shorter paths
+  pd = p.copy() # neighbors up to a distance
+  for i in range(distance-1): pd = (pd@p).tocsr()
+  pd.eliminate_zeros()
+  nd = m.shape[0] # number of sites
+  colors = np.zeros(nd,dtype=int) - 1 # initialize
+  order = np.argsort(-np.diff(pd.indptr)) # more connected sites first
+  for i in order: # loop over sites
+    used = set(colors[pd.indices[pd.indptr[i]:pd.indptr[i+1]]]) # taken
+    c = 0
+    while c in used: c += 1 # first color available
+    colors[i] = c # store
+  return colors
+
+
+
+def probing_vectors(colors,ntries=1):
+  """Probing vectors with random phases, as a N x (ncolors*ntries) array"""
+  nd = len(colors) # number of sites
+  nc = np.max(colors) + 1 # number of colors
+  vs = np.zeros((nd,nc*ntries),dtype=np.complex128) # initialize
+  for it in range(ntries): # loop over tries
+    ph = np.exp(2j*np.pi*np.random.random(nd)) # random phases
+    vs[np.arange(nd),colors + it*nc] = ph # store
+  return vs
+
+
+
+def diagonal_moments(m,n=100,distance=8,ntries=1,regions=None):
+  """Return 2n Chebyshev moments of the diagonal of the matrix (as
+  kpm.local_dos), as an array of shape (nsites,2n). If a list of regions
+  (lists of sites) is given, the moments are summed in each region"""
+  m = csr_matrix(m) # sparse matrix
+  nd = m.shape[0] # dimension
+  colors = coloring(m,distance=distance) # color the sites
+  vs = probing_vectors(colors,ntries=ntries) # probing vectors
+  if regions is None: proj = None
+  else: # projector on the regions
+    rows = np.concatenate([[i]*len(r) for (i,r) in enumerate(regions)])
+    cols = np.concatenate([r for r in regions])
+    proj = csr_matrix((np.ones(len(cols)),(rows,cols)),
+                         shape=(len(regions),nd))
+  nb = block.block_size(nd,vs.shape[1]) # vectors in each block
+  out = None # output
+  for i in range(0,vs.shape[1],nb): # loop over blocks
+    v = vs[:,i:i+nb] # this block
+    def diag(a): # diagonal of the moment
+      d = np.sum(np.conjugate(v)*a,axis=1).real
+      if proj is None: return d
+      else: return proj@d
+    mus = np.zeros((nd if proj is None else proj.shape[0],2*n)) # moments
+    am = v.copy() ; a = m@am # first two blocks
+    mus[:,0] = diag(am)
+    mus[:,1] = diag(a)
+    for k in range(2,2*n): # recursion
+      ap = m@a ; ap *= 2. ; ap -= am
+      mus[:,k] = diag(ap)
+      am,a = a,ap # next iteration
+    if out is None: out = mus
+    else: out += mus
+  return out/ntries
+
+
+
+def sites_moments(m,sites,n=100):
+  """Moments of the DOS summed over a list of sites, computed exactly
+  with a block of unit vectors. Same output as summing
+  kpm.local_dos over the sites"""
+  m = csr_matrix(m) # sparse matrix
+  nd = m.shape[0] # dimension
+  sites = np.array(sites) # sites
+  nb = block.block_size(nd,len(sites)) # vectors in each block
+  mus = np.zeros(2*n,dtype=np.complex128) # moments
+  for i in range(0,len(sites),nb): # loop over blocks
+    s = sites[i:i+nb] # sites in this block
+    vs = np.zeros((nd,len(s)),dtype=np.complex128) # unit vectors
+    vs[s,np.arange(len(s))] = 1.0
+    mus += block.block_moments(vs,m,n=n)
+  return mus
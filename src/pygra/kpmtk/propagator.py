@@ -0,0 +1,74 @@
+from __future__ import print_function,division
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.special import jv
+
+# Time evolution exp(-iHt) of one or many states using only sparse
+# products. With H = shift + scale*Ht, where Ht has its spectrum in
+# [-1,1], the Chebyshev expansion of the propagator is
+#   exp(-iHt) = exp(-i shift t) sum_n (2-delta_n0) (-i)^n J_n(scale t) T_n(Ht)
+# The Bessel functions decay exponentially for n > scale*t, so a time
+# step needs about scale*t + O(log(1/tol)) products
+
+
+def chebyshev_coefficients(a,tol=1e-12):
+  """Coefficients of the Chebyshev expansion of exp(-i a x)"""
+  n = int(abs(a)) + 20 # initial guess
+  while True:
+    cs = jv(np.arange(n),a) # Bessel functions
+    if np.max(np.abs(cs[-10:]))<tol: break # converged
+    n *= 2 # increase the number of terms
+  nmax = np.max(np.nonzero(np.abs(cs)>tol)[0]) + 1 # last relevant term
+  cs = cs[0:nmax]*(-1j)**np.arange(nmax) # include the phases
+  cs[1:] *= 2. # factor of the series
+  return cs
+
+
+
+class ChebyshevPropagator():
+  """Propagator of states with a sparse Hamiltonian"""
+  def __init__(self,m,scale=None,shift=None,tol=1e-12,mode="chebyshev"):
+    from .. import kpm
+    self.m = csr_matrix(m) # Hamiltonian
+    (self.shift,self.scale) = kpm.get_window(self.m,scale=scale,shift=shift)
+    self.mt = kpm.rescale_matrix(self.m,shift=self.shift,
+                                   scale=self.scale).tocsr() # rescaled
+    self.tol = tol # tolerance of the expansion
+    self.mode = mode # chebyshev or krylov
+    self.coefficients = dict() # coefficients already computed
+  def get_coefficients(self,dt):
+    """Coefficients for a certain time step"""
+    key = round(dt,12) # the same steps are repeated
+    if key not in self.coefficients:
+      self.coefficients[key] = chebyshev_coefficients(self.scale*dt,
+                                                        tol=self.tol)
+    return self.coefficients[key]
+  def step(self,vs,dt):
+    """Evolve the states vs (vector or N x B array) a time dt"""
+    if dt==0.: return vs.copy()
+    if self.mode=="krylov": # use the scipy routine
+      from scipy.sparse.linalg import expm_multiply
+      return expm_multiply(-1j*dt*self.m,vs)
+    elif self.mode!="chebyshev": raise
+    cs = self.get_coefficients(dt) # coefficients
+    vs = np.array(vs,dtype=np.complex128) # initial states
+    am = vs ; out = cs[0]*am # first term
+    if len(cs)>1:
+      a = self.mt@am ; out = out + cs[1]*a # second term
+    for c in cs[2:]: # recursion
+      ap = self.mt@a ; ap *= 2. ; ap -= am
+      out += c*ap # add contribution
+      am,a = a,ap
+    return out*np.exp(-1j*self.shift*dt) # global phase
+  def evolve(self,vs,ts,dtmax=None):
+    """Generator returning the states at times ts, which must be
+    increasing, starting from vs at t=0. If dtmax is given, long
+    intervals are split in steps of dtmax"""
+    t0 = 0. # initial time
+    for t in ts: # loop over times
+      if t<t0: raise # times must be increasing
+      if dtmax is None: nsteps = 1 # a single step
+      else: nsteps = int(np.ceil((t-t0)/dtmax)) # number of steps
+      for i in range(nsteps): vs = self.step(vs,(t-t0)/nsteps)
+      t0 = t # store the time
+      yield vs
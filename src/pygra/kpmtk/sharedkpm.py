@@ -0,0 +1,135 @@
+from __future__ import print_function,division
+import numpy as np
+from scipy.sparse import csr_matrix
+from . import block
+
+# Parallel stochastic KPM with the matrix in shared memory. The CSR arrays
+# are copied once into shared memory blocks, and a persistent pool of
+# workers maps them without copies when it is created. Each task only
+# receives a seed and a number of vectors, propagates that block of random
+# vectors and writes its moments directly in a row of a shared array, so
+# neither the matrix nor the moments are pickled. The pool is kept alive
+# and reused by later calculations with the same matrix, until a
+# different matrix is used or the program exits
+
+_worker = dict() # state of each worker
+_pools = dict() # pool of the last matrix, by its fingerprint
+
+
+def to_shared(a):
+  """Copy an array into a new shared memory block"""
+  from multiprocessing import shared_memory
+  shm = shared_memory.SharedMemory(create=True,size=max([a.nbytes,1]))
+  b = np.ndarray(a.shape,dtype=a.dtype,buffer=shm.buf)
+  b[:] = a[:] # copy
+  return shm,(shm.name,a.shape,a.dtype.str)
+
+
+
+def from_shared(desc):
+  """Map an array stored in a shared memory block"""
+  from multiprocessing import shared_memory
+  (name,shape,dtype) = desc
+  shm = shared_memory.SharedMemory(name=name)
+  return shm,np.ndarray(shape,dtype=np.dtype(dtype),buffer=shm.buf)
+
+
+
+def init_worker(descs,shape,real):
+  """Map the shared arrays in a worker"""
+  shms,arrs = zip(*[from_shared(d) for d in descs])
+  _worker["shms"] = shms # keep them alive
+  _worker["m"] = csr_matrix(tuple(arrs[0:3]),shape=shape,copy=False)
+  _worker["real"] = real
+
+
+
+def worker_moments(args):
+  """Moments of a block of random vectors, stored in a shared array"""
+  (itask,seed,nv,n,desc) = args
+  shm,out = from_shared(desc) # output array
+  m = _worker["m"] # matrix
+  np.random.seed(seed) # reproducible random vectors
+  vs = block.random_block(m.shape[0],nv,real=_worker["real"])
+  vs = block.convert(vs,m.dtype)
+  out[itask,0:2*n] = block.block_moments(vs,m,n=n)
+  del out ; shm.close()
+  return itask
+
+
+
+class SharedKPM():
+  """Persistent pool of workers sharing a matrix"""
+  def __init__(self,m,cores=None,precision="double"):
+    import multiprocessing
+    if cores is None:
+      from .. import parallel
+      cores = parallel.cores
+    m = csr_matrix(m) ; m.sort_indices()
+    self.real = block.is_real(m) # real arithmetic
+    dtype = block.recursion_dtype(real=self.real,precision=precision)
+    m = block.convert(m,dtype) # data type of the recursion
+    self.shape = m.shape # shape of the matrix
+    self.dtype = dtype
+    arrs = [m.data,m.indices,m.indptr] # CSR arrays
+    out = [to_shared(np.ascontiguousarray(a)) for a in arrs]
+    self.shms = [o[0] for o in out] # shared memory blocks
+    descs = [o[1] for o in out] # descriptors
+    self.cores = cores
+    self.pool = multiprocessing.Pool(cores,initializer=init_worker,
+                                       initargs=(descs,m.shape,self.real))
+  def random_trace(self,ntries=20,n=200,memory=None,seed=None):
+    """Stochastic trace of 2n Chebyshev moments"""
+    nd = self.shape[0]
+    nb = block.block_size(nd,ntries,memory=memory,dtype=self.dtype)
+    nb = min([nb,int(np.ceil(ntries/self.cores))]) # use all the cores
+    sizes = [min([nb,ntries-i]) for i in range(0,ntries,nb)] # blocks
+    if seed is None: seed = np.random.randint(2**30) # seed of the tasks
+    mus = np.zeros((len(sizes),2*n),dtype=np.complex128) # moments
+    shm,desc = to_shared(mus) # in shared memory
+    try:
+      tasks = [(i,seed+i,s,n,desc) for (i,s) in enumerate(sizes)]
+      self.pool.map(worker_moments,tasks,chunksize=1) # compute
+      mus = np.ndarray(mus.shape,dtype=mus.dtype,buffer=shm.buf).copy()
+    finally: shm.close() ; shm.unlink()
+    return np.sum(mus,axis=0)/ntries
+  def close(self):
+    """Stop the workers and free the shared memory"""
+    self.pool.terminate() ; self.pool.join()
+    for shm in self.shms: shm.close() ; shm.unlink()
+    self.shms = []
+  def __enter__(self): return self
+  def __exit__(self,*args): self.close()
+
+
+
+def get_shared(m,cores=None,precision="double"):
+  """Persistent pool for a matrix, replacing the pool of the previous
+  matrix"""
+  from .store import fingerprint
+  if cores is None:
+    from .. import parallel
+    cores = parallel.cores
+  key = (fingerprint(m,precision),cores) # identifies the pool
+  if key not in _pools: # create it
+    close_all() # only one pool alive
+    _pools[key] = SharedKPM(m,cores=cores,precision=precision)
+  return _pools[key]
+
+
+
+def close_all():
+  """Stop the persistent pools"""
+  for k in list(_pools.keys()): _pools.pop(k).close()
+
+import atexit
+atexit.register(close_all) # free the shared memory at exit
+
+
+
+def random_trace(m,ntries=20,n=200,cores=None,memory=None,
+                   precision="double"):
+  """Stochastic trace of the Chebyshev moments using a shared memory
+  pool of workers, reused between calls with the same matrix"""
+  skpm = get_shared(m,cores=cores,precision=precision)
+  return skpm.random_trace(ntries=ntries,n=n,memory=memory)
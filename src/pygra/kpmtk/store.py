@@ -0,0 +1,132 @@
+from __future__ import print_function,division
+import os
+import hashlib
+import numpy as np
+from scipy.sparse import csr_matrix
+from . import block
+
+# Disk cache of Chebyshev moments. The moments only depend on the matrix,
+# the window used to rescale it, the vectors and the order, so they are
+# stored in a folder named after a fingerprint of the unscaled matrix,
+# with a subfolder for each window. The first window used for a matrix
+# is stored, and reused when no window is given. Each record holds the moments summed
+# over a chunk of vectors and, optionally, the last two blocks of the
+# recursion, so that an existing record can be extended to more moments
+# by continuing the recursion. The random vectors of a chunk are generated
+# from a seed and its first index, so more random vectors are added as
+# new chunks, and records without vectors can be recomputed exactly.
+# Records are written atomically every nsave steps of the recursion, so
+# an interrupted calculation resumes from the last stored step
+
+cache_folder = "KPM_CACHE" # default folder of the cache
+nsave = 2000 # steps of the recursion between writes
+
+
+def fingerprint(m,*args):
+  """Hash of a sparse matrix and some extra parameters"""
+  m = csr_matrix(m) ; m.sum_duplicates() ; m.sort_indices()
+  h = hashlib.sha1()
+  h.update(str((m.shape,m.dtype)+args).encode())
+  for a in [m.indptr,m.indices,m.data]: h.update(np.ascontiguousarray(a))
+  return h.hexdigest()
+
+
+
+class MomentStore():
+  """Cached moments of a matrix, rescaled as (m - shift)/scale. If
+  scale is None, the stored window (or the estimated one) is used"""
+  def __init__(self,m,folder=None,scale=None,shift=None,keep_vectors=True,
+                 memory=None,precision="double",info=False):
+    from . import bounds
+    m = csr_matrix(m) # sparse matrix
+    self.key = fingerprint(m,precision) # fingerprint of the input matrix
+    if folder is None: folder = cache_folder
+    base = os.path.join(folder,self.key) # folder of the matrix
+    wfile = os.path.join(base,"window.npy") # default window
+    if scale is None: # stored or estimated window
+      if os.path.isfile(wfile): (shift0,scale) = np.load(wfile)
+      else: (shift0,scale) = bounds.get_window(m)
+      if shift is None: shift = shift0
+    if shift is None: shift = 0.
+    self.shift,self.scale = float(shift),float(scale)
+    if not os.path.isfile(wfile): # store the first window
+      if not os.path.isdir(base): os.makedirs(base)
+      np.save(wfile+".tmp.npy",np.array([self.shift,self.scale]))
+      os.replace(wfile+".tmp.npy",wfile) # atomic write
+    self.m = bounds.rescale(m,shift=self.shift,scale=self.scale)
+    self.real = block.is_real(self.m) # real arithmetic
+    self.dtype = block.recursion_dtype(real=self.real,precision=precision)
+    window = "window_%.12g_%.12g"%(self.shift,self.scale)
+    self.folder = os.path.join(base,window) # folder of the records
+    self.keep_vectors = keep_vectors # store the last blocks
+    self.memory = memory # memory budget
+    self.info = info
+  def path(self,name):
+    return os.path.join(self.folder,name+".npz")
+  def load(self,name):
+    """Load a record, or return None"""
+    if not os.path.isfile(self.path(name)): return None
+    d = np.load(self.path(name))
+    return dict([(k,d[k]) for k in d.files])
+  def save(self,name,rec):
+    """Write a record atomically"""
+    if not os.path.isdir(self.folder): os.makedirs(self.folder)
+    tmp = self.path(name)+".tmp.npz" # temporal file
+    np.savez(tmp,**rec)
+    os.replace(tmp,self.path(name))
+  def records(self,prefix):
+    """Names of the stored records with a prefix"""
+    if not os.path.isdir(self.folder): return []
+    fs = [f[:-4] for f in os.listdir(self.folder) if f.endswith(".npz")]
+    return [f for f in fs if f.startswith(prefix) and ".tmp" not in f]
+  def block_record(self,name,fvs,n):
+    """Return 2n moments summed over the block of vectors returned by
+    fvs, reusing and extending the stored record"""
+    m = block.convert(self.m,self.dtype) # matrix in the recursion type
+    rec = self.load(name)
+    if rec is not None and len(rec["mus"])>=2*n: return rec["mus"][0:2*n]
+    if rec is None or "a" not in rec: # start from the vectors
+      vs = block.convert(fvs(),self.dtype)
+      am = vs ; a = m@am # first two blocks
+      mus = np.array([block.vdot(am,am),block.vdot(a,am)])
+    else: mus,am,a = rec["mus"],rec["am"],rec["a"] # continue
+    k = len(mus)//2 # steps done
+    while k<n: # loop over stages
+      k = min([n,k+nsave]) # next stage
+      (mus,am,a) = block.continue_moments(m,am,a,mus,n=k)
+      out = dict(mus=mus)
+      if self.keep_vectors: out["am"],out["a"] = am,a
+      self.save(name,out) # store the stage
+      if self.info: print("Stored",name,"with",2*k,"moments")
+    return mus[0:2*n]
+  def random_moments(self,n=200,ntries=20,seed=0):
+    """Stochastic trace of 2n moments, averaged over at least ntries
+    random vectors (all the cached chunks needed to reach ntries are
+    used, so the number of vectors may be larger)"""
+    prefix = "random_%d_"%seed
+    chunks = [tuple(int(i) for i in r[len(prefix):].split("_"))
+                 for r in self.records(prefix)] # stored chunks
+    chunks = sorted(chunks) # by the first vector of each one
+    nd = self.m.shape[0]
+    nb = block.block_size(nd,ntries,memory=self.memory,dtype=self.dtype)
+    used = [] # chunks used
+    i0 = 0 # first vector not covered
+    for c in chunks: # use the stored consecutive chunks
+      if c[0]<i0: continue # overlaps with the previous ones
+      if c[0]>i0 or i0>=ntries: break
+      used.append(c) ; i0 = c[1]
+    while i0<ntries: # new chunks
+      used.append((i0,min([i0+nb,ntries]))) ; i0 = used[-1][1]
+    mus = np.zeros(2*n,dtype=np.complex128) # output
+    for (i0,i1) in used: # loop over chunks
+      def fvs():
+        np.random.seed(seed+i0) # reproducible random vectors
+        return block.random_block(nd,i1-i0,real=self.real)
+      mus += self.block_record(prefix+"%d_%d"%(i0,i1),fvs,n)
+    return mus/used[-1][1]
+  def local_moments(self,i=0,n=200):
+    """2n moments of the local DOS in a site"""
+    def fvs():
+      v = np.zeros((self.m.shape[0],1)) ; v[i,0] = 1.
+      return v
+    return self.block_record("site_%d"%i,fvs,n)
@@ -28,12 +28,13 @@ def ldos0d(h,e=0.0,delta=0.01,write=True):
 
 
 def ldoskpm(h,m,energies=np.linspace(-1.,1.,100),
-        delta=0.01,scale = 10.0,i=0):
+        delta=0.01,scale = None,i=0):
     """Compute a local DOS using the KPM"""
-    npol = 1*int(scale/delta) # number of polynomials
     from . import kpm
+    (shift,scale) = kpm.get_window(m,scale=scale) # window
+    npol = 1*int(scale/delta) # number of polynomials
     def get(j):
-      es,ds = kpm.ldos(m,i=j,scale=scale,npol=npol,ne=npol*5)
+      es,ds = kpm.ldos(m,i=j,scale=scale,shift=shift,npol=npol,ne=npol*5)
       return es,ds # return
     from scipy.interpolate import interp1d
     if h.has_spin and h.has_eh: # spin with electron-hole
@@ -55,6 +56,33 @@ def ldoskpm(h,m,energies=np.linspace(-1.,1.,100),
 
 
 
+def multi_ldos_kpm(h,es=np.linspace(-1.0,1.0,100),delta=0.01,scale=None,
+        distance=8,ntries=1,write=True):
+  """Calculate the LDOS in all the sites for many energies, using a
+  single KPM recursion with probing vectors"""
+  if h.dimensionality!=0: raise # only for 0d
+  from . import kpm
+  (shift,scale) = kpm.get_window(h.intra,scale=scale) # window
+  npol = 1*int(scale/delta) # number of polynomials
+  (es,outs) = kpm.ldos_map(h.intra,scale=scale,shift=shift,npol=npol,
+                  x=np.array(es),distance=distance,ntries=ntries)
+  outs = [spatial_dos(h,out) for out in outs] # resum if necessary
+  if write:
+    os.system("rm -rf MULTILDOS") # remove folder
+    os.system("mkdir MULTILDOS") # create folder
+    g = h.geometry # geometry
+    fo = open("MULTILDOS/MULTILDOS.TXT","w") # files with the names
+    for (e,out) in zip(es,outs): # loop over energies
+      name0 = "LDOS_"+str(e)+"_.OUT" # name of the output
+      write_ldos(g.x,g.y,out,output_file="MULTILDOS/"+name0) # write
+      fo.write(name0+"\n") # name of the file
+    fo.close() # close file
+  return es,np.array(outs)
+
+
+
+
+
 def dos_site(h,i=0,mode="ED",energies=np.linspace(-1.,1.,100),**kwargs):
     """DOS in a particular site for different energies"""
     if h.dimensionality!=0: raise # only for 0d
@@ -229,6 +257,11 @@ def ldos(h,e=0.0,delta=0.001,nrep=5,nk=None,mode="green",
       print("LDOS using renormalization adaptative Green function")
       gb,gs = green.bloch_selfenergy(h,energy=e,delta=delta,mode="adaptive")
       d = [ -(gb[i,i]).imag for i in range(len(gb))] # get imaginary part
+  elif mode=="spectral": # eigenstates in a k-mesh, any dimension
+    from .greentk.spectral import SpectralGreen
+    if nk is None: nk = 10
+    sg = SpectralGreen(h,nk=nk,**kwargs) # diagonalize once
+    d = -sg.get_diagonal([e],delta=delta)[0].imag # diagonal of G
   elif mode=="arpack" or mode=="diagonalization": # arpack diagonalization
     from . import klist
     if nk is None: nk = 10
@@ -296,15 +329,10 @@ def multi_ldos(h,es=np.linspace(-1.0,1.0,100),delta=0.01,nrep=3,nk=100,numw=3,
   go = h.geometry.copy() # copy geometry
   go = go.supercell(nrep) # create supercell
   fo = open("MULTILDOS/MULTILDOS.TXT","w") # files with the names
-  def getldosi(e):
-    """Get this iteration"""
-    out = np.array([0.0 for i in range(h.intra.shape[0])]) # initialize
-    for (d,p,ie) in zip(ds,ps,evals): # loop over wavefunctions
-      fac = delta/((e-ie)**2 + delta**2) # factor to create a delta
-      out += fac*d*p # add contribution
-    out /= np.pi # normalize
-    return spatial_dos(h,out) # resum if necessary
-  outs = parallel.pcall(getldosi,es) # get energies
+  from .dos import calculate_pdos
+  ws = np.array([d*p for (d,p) in zip(ds,ps)]) # weight of each state
+  outs = calculate_pdos(evals,es,delta,ws)/np.pi # all the energies at once
+  outs = [spatial_dos(h,out) for out in outs] # resum if necessary
   ie = 0
   for e in es: # loop over energies
     print("MULTILDOS for energy",e)
@@ -339,11 +367,11 @@ def spatial_dos(h,dos):
   """Resums a certain DOS to show only the spatial dependence"""
   if h.has_spin == False and h.has_eh==False: return np.array(dos)
   elif h.has_spin == True and h.has_eh==False: 
-    return np.array([dos[2*i]+dos[2*i+1] for i in range(len(dos)//2)])
+    return np.array(dos).reshape((len(dos)//2,2)).sum(axis=1)
   elif h.has_spin == False and h.has_eh==True: 
-    return np.array([dos[2*i]+dos[2*i+1] for i in range(len(dos)//2)])
+    return np.array(dos).reshape((len(dos)//2,2)).sum(axis=1)
   elif h.has_spin == True and h.has_eh==True: 
-    return np.array([dos[4*i]+dos[4*i+1]+dos[4*i+2]+dos[4*i+3] for i in range(len(dos)//4)])
+    return np.array(dos).reshape((len(dos)//4,4)).sum(axis=1)
   else: raise
 
 
@@ -390,24 +418,28 @@ def ldos_finite(h,e=0.0,n=10,nwf=4,delta=0.0001):
 
 
 
-def ldos_defect(h,v,e=0.0,delta=0.001,n=1):
+def ldos_defect(h,v,e=0.0,delta=0.001,n=1,nk=10):
   """Calculates the LDOS of a cell with a defect, writting the n
-  neighring cells"""
-  raise # still not finished
-  from . import green
-  # number of repetitions
-  rep = 2*n +1
-  # calculate pristine green function
-  g,selfe = green.supercell_selfenergy(h,e=e,delta=delta,nk=100,nsuper=rep)
-  # now calculate defective green function 
-  ez = e + 1j*delta # complex energy
-  emat = np.matrix(np.identity(len(g)))*ez  # E +i\delta 
-  from . import supercell
-  pintra = supercell.intra_super2d(h,n=rep) # pristine
-  vintra = supercell.intra_super2d(h,n=rep,central=v) # defective
-  selfe = emat - pintra - g.I # dyson euqation, get selfenergy
-  gv = (emat - vintra -selfe).I   # Green function of a vacancy, with selfener
-  return
+  neighring cells. v is the perturbation in the unit cell, which is
+  placed in the central cell and embedded with the T-matrix"""
+  from .greentk.spectral import SpectralGreen
+  from .greentk import tmatrix
+  rep = 2*n +1 # number of repetitions
+  hs = h.supercell(rep) # supercell
+  ns = h.intra.shape[0] # orbitals in the unit cell
+  ic = (rep**h.dimensionality)//2 # index of the central cell
+  sites = np.arange(ic*ns,(ic+1)*ns) # orbitals of the defect
+  # pristine Green function in the rows and columns of the defect
+  sg = SpectralGreen(hs,nk=nk)
+  gd = sg.get_diagonal([e],delta=delta)[0]
+  gcol = sg.get_block([e],cols=sites,delta=delta)[0]
+  grow = sg.get_block([e],rows=sites,delta=delta)[0]
+  t = tmatrix.tmatrix(gcol[sites,:],algebra.todense(v)) # T-matrix
+  gd = gd + tmatrix.correction_diagonal(gcol,t,grow) # defective
+  d = spatial_dos(hs,-gd.imag) # spatially resolved DOS
+  g = hs.geometry
+  write_ldos(g.x,g.y,d,z=g.z) # write in file
+  return (g.x,g.y,d)
 
 
 
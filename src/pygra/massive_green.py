@@ -26,44 +26,44 @@ def clean():
   """ Clena all the directories"""
   os.system("rm -rf green_storage*")
   os.system("rm -rf pdos_storage*")
+  _stores.clear()
+
+
+
+_stores = dict() # opened stores
+
+def get_store(kind,name=""):
+  """Store of a certain kind and name, in a single file"""
+  from .greentk.greenstore import GreenStore
+  filename = os.getcwd()+"/"+kind+"_storage_"+name+".bin" # name of the file
+  if filename not in _stores: _stores[filename] = GreenStore(filename)
+  return _stores[filename]
+
+
+
+def import_folder(folder,kind="green",name=""):
+  """Move the files of an old storage folder to the single file store"""
+  store = get_store(kind,name=name)
+  for n in os.listdir(folder):
+    e = float(n.split("_")[1].replace(".npy","").replace(".dat",""))
+    if n.endswith(".npy"): m = np.load(folder+"/"+n)
+    else: m = np.loadtxt(folder+"/"+n)
+    if store.load(e) is None: store.save(e,m)
+
 
 
 def get_green(fun_gf,name="",energy=0.0,prec=prec):
   """Looks for the green function at that energy, if it hasn't been calculated
   calculates it"""
-  foldername = "green_storage_"+name # name of the foler
-  dirname = os.getcwd()+"/"+foldername # name of the foler
-  if not foldername in os.listdir(os.getcwd()):
-    os.system("mkdir "+foldername) # create the folder if nonexistent
+  store = get_store("green",name=name)
   er = round(energy,prec) # round the energy value
-  namefile = "green_"+str(er)+".npy" # name of the file
-  files = os.listdir(dirname) # files in the directory
-  if namefile in files: # check if it has been calculated
-    m = np.matrix(np.load(dirname+"/"+namefile)) # get the matrix
-    return m # return the matrix
-  else: # if it hasn't been calculated
-    m = fun_gf(er) # calcualte green function
-    np.save(dirname+"/"+namefile,m) # save the matrix
-    return m # return the matrix
+  return np.matrix(store.get(fun_gf,er)) # get or compute the matrix
 
 
 
 def get_pdos(fun_pd,name="",energy=0.0,prec=6):
   """Looks for the DOS at that energy, if it hasn't been calculated
   calculates it"""
-  foldername = "pdos_storage_"+name # name of the foler
-  dirname = os.getcwd()+"/"+foldername # name of the foler
-  if not foldername in os.listdir(os.getcwd()):
-    os.system("mkdir "+foldername) # create the folder if nonexistent
+  store = get_store("pdos",name=name)
   er = round(energy,prec) # round the energy value
-  namefile = "pdos_"+str(er)+".dat" # name of the file
-  files = os.listdir(dirname) # files in the directory
-  if namefile in files: # check if it has been calculated
-    m = np.loadtxt(dirname+"/"+namefile) # get the matrix
-    return m # return the matrix
-  else: # if it hasn't been calculated
-    m = fun_pd(er) # calcualte green function
-    np.savetxt(dirname+"/"+namefile,m) # save the matrix
-    return m # return the matrix
-
-
+  return store.get(fun_pd,er) # get or compute the DOS
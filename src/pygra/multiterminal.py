@@ -48,6 +48,9 @@ class Device():
   def transmission(self,energy=0.0):
     """Calculate the transmission"""
     return landauer(self,energy)
+  def transmission_matrix(self,energy=0.0,**kwargs):
+    """Transmission between all the pairs of leads"""
+    return transmission_matrix(self,energy,**kwargs)
   def write_current(self,energy=0.0):
     """Calculate the transmission"""
     den = central_density(self,energy=energy)
@@ -61,9 +64,14 @@ class Lead():
   intra = None  # intraterm
   inter = None  # interterm
   coupling = None  # coupling to the center
+  lead_solver = "renormalization" # or "modes"
   def get_green(self,energy,error=0.00001,delta=0.00001):
     """ Get surface green function"""
     from . import green 
+    if self.lead_solver=="modes": # from the modes of the lead
+      grb,gr = green.green_lead(self.intra,self.inter,energy=energy,
+                                  delta=delta,mode="modes")
+      return gr
     grb,gr = green.green_renormalization(self.intra,self.inter,error=error,
                                           energy=energy,delta=delta)
     return gr
@@ -77,9 +85,59 @@ class Lead():
 
 def landauer(d,energy,ij=[(0,1)],error=0.000001,delta=0.00001):
   """ Calculate landauer tranmission between leads i,j """
-  Ms = landauer_matrix(d,energy,ij=ij,error=error,delta=delta) # matrix
-  Ts = [m.trace()[0,0] for m in Ms]
-  return Ts
+  T = transmission_matrix(d,energy,error=error,delta=delta) # all the pairs
+  return [T[i,j] for (i,j) in ij]
+
+
+
+def transmission_matrix(d,energy,error=0.000001,delta=0.00001,
+                          currents=False):
+  """Transmission between all the pairs of leads, computing the
+  selfenergies once and factorizing the central Hamiltonian once.
+  Element (i,j) is the transmission that landauer returns for the pair
+  (i,j). If currents is True, it also returns, for each lead, a sparse
+  matrix with the bond currents of the electrons injected from it"""
+  from scipy.sparse import csc_matrix,coo_matrix,identity
+  from scipy.sparse.linalg import splu
+  from . import algebra
+  n = d.intra.shape[0] # dimension of the central part
+  nl = len(d.leads) # number of leads
+  sites,ss = [],[] # coupled sites and selfenergies in them
+  for l in d.leads:
+    t = csc_matrix(l.coupling) # coupling to the center
+    si = np.unique(t.nonzero()[1]) # sites coupled to the lead
+    ts = np.array(algebra.todense(t[:,si]))
+    gr = np.array(l.get_green(energy,error=error,delta=delta))
+    sites.append(si) ; ss.append(algebra.dagger(ts)@gr@ts) # selfenergy
+  # sparse matrix to factorize
+  sigma = csc_matrix((n,n),dtype=np.complex128)
+  for (si,s) in zip(sites,ss):
+    s = coo_matrix(s)
+    sigma = sigma + csc_matrix((s.data,(si[s.row],si[s.col])),shape=(n,n))
+  hc = csc_matrix(d.intra,dtype=np.complex128) # central Hamiltonian
+  a = (energy + delta*1j)*identity(n,format="csc") - hc - sigma
+  lu = splu(csc_matrix(a)) # single factorization
+  allsites = np.unique(np.concatenate(sites)) # all the coupled sites
+  rhs = np.zeros((n,len(allsites)),dtype=np.complex128)
+  rhs[allsites,np.arange(len(allsites))] = 1.0
+  gcol = lu.solve(rhs) # columns of the Green function
+  cols = [np.searchsorted(allsites,si) for si in sites] # columns of each lead
+  gammas = [1j*(s - algebra.dagger(s)) for s in ss] # spectral functions
+  T = np.zeros((nl,nl)) # transmission matrix
+  for i in range(nl):
+    for j in range(nl):
+      gij = gcol[sites[i],:][:,cols[j]] # G_ij between the leads
+      T[i,j] = np.trace(gammas[i]@gij@gammas[j]@algebra.dagger(gij)).real
+  if not currents: return T
+  hc = hc.tocoo() # bonds of the central part
+  js = [] # currents for each lead
+  for i in range(nl):
+    gi = gcol[:,cols[i]] # columns of the injecting lead
+    x = gi@gammas[i]
+    gn = np.sum(x[hc.col,:]*np.conjugate(gi[hc.row,:]),axis=1) # G^n_ba
+    jab = -2.*(hc.data*gn).imag # -2 Im H_ab G^n_ba
+    js.append(csc_matrix((jab,(hc.row,hc.col)),shape=(n,n)))
+  return T,js
 
 
 def landauer_matrix(d,energy,ij=[(0,1)],error=0.000001,delta=0.00001):
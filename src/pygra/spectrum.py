@@ -17,7 +17,7 @@ arpack_maxiter = 10000
 def fermi_surface(h,write=True,output_file="FERMI_MAP.OUT",
                     e=0.0,nk=50,nsuper=1,reciprocal=True,
                     delta=None,refine_delta=1.0,operator=None,
-                    mode='full',num_waves=2,info=True):
+                    mode='full',num_waves=2,info=True,nkcoarse=10):
   """Calculates the Fermi surface of a 2d system"""
   if operator is None:
     operator = np.matrix(np.identity(h.intra.shape[0]))
@@ -48,6 +48,9 @@ def fermi_surface(h,write=True,output_file="FERMI_MAP.OUT",
       es,waves = slg.eigsh(hk,k=num_waves,sigma=e,tol=arpack_tol,which="LM",
                             maxiter = arpack_maxiter)
       return np.sum(delta/((e-es)**2+delta**2)) # return weight
+  elif mode=='interpolation': # Fourier interpolated bands
+    from .dostk.fourierbands import BandInterpolator
+    bi = BandInterpolator(h,nk=nkcoarse) # interpolator
   else: raise
 
 ##############################################
@@ -62,6 +65,9 @@ def fermi_surface(h,write=True,output_file="FERMI_MAP.OUT",
   def getf(r): # function to compute FS
       rm = np.matrix(r).T
       k = np.array((R*rm).T)[0] # change of basis
+      if mode=='interpolation': # use the interpolated energies
+        es = bi.get_energies([k])[0] # energies
+        return np.sum(delta/((e-es)**2+delta**2)) # return weight
       hk = hk_gen(k) # get hamiltonian
       return get_weight(hk)
   rs = np.array(rs) # transform into array
@@ -308,6 +314,10 @@ def total_energy(h,nk=10,nbands=None,use_kpm=False,random=False,
         etot = integrate.dblquad(lambda x,y: enek([x,y]),-1.,1.,-1.,1.,
                 epsabs=tol,epsrel=tol)[0]
     else: raise
+  elif mode=="tetrahedron": # linear tetrahedron method
+    from .dostk import tetrahedron
+    (es,ws,nb) = tetrahedron.get_simplex_data(h,nk=nk) # energies
+    etot = tetrahedron.tetrahedron_band_energy(es,nb,fermi=0.0)
   else: raise
   return etot
 
@@ -388,7 +398,7 @@ def singlet_map(h,nk=40,nsuper=3,mode="abs"):
 
 
 
-def set_filling(h,filling=0.5,nk=10,extrae=0.,delta=1e-1):
+def set_filling(h,filling=0.5,nk=10,extrae=0.,delta=1e-1,mode="ED"):
     """Set the filling of a Hamiltonian"""
     if h.has_eh: raise
     fill = filling + extrae/h.intra.shape[0] # filling
@@ -397,7 +407,10 @@ def set_filling(h,filling=0.5,nk=10,extrae=0.,delta=1e-1):
     if n>algebra.maxsize: # use the KPM method
         use_kpm = True
         print("Using KPM in set_filling")
-    if use_kpm: # use KPM
+    if mode=="tetrahedron" and not use_kpm: # linear tetrahedron method
+        from .dostk import tetrahedron
+        efermi = tetrahedron.fermi_energy(h,filling=fill,nk=nk)
+    elif use_kpm: # use KPM
         es,ds = h.get_dos(energies=np.linspace(-5.0,5.0,1000),
                 use_kpm=True,delta=delta,nk=nk,random=False)
         from scipy.integrate import cumtrapz
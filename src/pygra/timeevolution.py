@@ -14,6 +14,8 @@ def evolve_local_state(h,i=0,ts=np.linspace(0.,20.,300),
     # get the function that does time evolution
     if mode=="green": evol = evolve_green(h,i=i)
     elif mode=="chi": evol = evolve_chi(h,i=i,ts=ts)
+    elif mode in ["chebyshev","krylov"]: evol = evolve_sparse(h,i=i,mode=mode)
+    else: raise
     g = h.geometry
     os.system("rm -rf MULTITIMEEVOLUTION") # remove folder
     os.system("mkdir MULTITIMEEVOLUTION") # create folder
@@ -65,3 +67,67 @@ def evolve_chi(h,i=0,ts=[0]):
         out = np.array([c@np.exp(1j*es*t) for c in cs])
         return np.abs(out)
     return evol
+
+
+
+
+def evolve_sparse(h,i=0,mode="chebyshev"):
+    """Return the time evolution of the occupations of a state
+    originally localized in a site, using only sparse products. The
+    state is kept between calls, so increasing times are cheap"""
+    from .kpmtk.propagator import ChebyshevPropagator
+    prop = ChebyshevPropagator(h.intra,mode=mode) # propagator
+    v0 = np.zeros(h.intra.shape[0],dtype=np.complex128) # initial state
+    v0[i] = 1.0
+    store = dict(t=0.,v=v0) # current time and state
+    def evol(t):
+        if t<store["t"]: store["t"],store["v"] = 0.,v0 # start again
+        store["v"] = prop.step(store["v"],t-store["t"]) # evolve
+        store["t"] = t # new time
+        return np.abs(store["v"])**2 # occupations
+    return evol
+
+
+
+
+def evolve_states(h,vs,ts=np.linspace(0.,20.,300),mode="chebyshev",
+        write="text",info=False):
+    """Evolve one (vector) or many (N x B array) initial states with
+    the Hamiltonian, using only sparse products. Returns the times and
+    the return probabilities |<v(0)|v(t)>|^2. The occupations summed over
+    the states are written for each time in the folder MULTITIMEEVOLUTION,
+    either as text files (write="text") or as a single array in
+    MULTITIMEEVOLUTION/OCCUPATIONS.npy (write="binary")"""
+    if h.dimensionality!=0: raise # only for 0d
+    from .kpmtk.propagator import ChebyshevPropagator
+    prop = ChebyshevPropagator(h.intra,mode=mode) # propagator
+    v0 = np.array(vs,dtype=np.complex128) # initial states
+    g = h.geometry
+    if write is not None:
+      os.system("rm -rf MULTITIMEEVOLUTION") # remove folder
+      os.system("mkdir MULTITIMEEVOLUTION") # create folder
+    if write=="text":
+      fo = open("MULTITIMEEVOLUTION/MULTITIMEEVOLUTION.TXT","w")
+    elif write=="binary": # single array in disk
+      nsites = len(spatial_dos(h,np.zeros(h.intra.shape[0]))) # sites
+      occ = np.lib.format.open_memmap("MULTITIMEEVOLUTION/OCCUPATIONS.npy",
+              mode="w+",dtype=np.float64,shape=(len(ts),nsites))
+      np.save("MULTITIMEEVOLUTION/TIMES.npy",np.array(ts))
+    ps = [] # return probabilities
+    it = 0
+    for v in prop.evolve(v0,ts): # loop over times
+        ps.append(np.abs(np.sum(np.conjugate(v0)*v,axis=0))**2) # return
+        if write is not None: # compute the occupations
+            out = np.abs(v)**2 # occupations
+            if len(out.shape)==2: out = np.sum(out,axis=1) # sum states
+            out = spatial_dos(h,out) # resum if necessary
+        if write=="text":
+            name = "TIMEEVOLUTION_T_"+str(ts[it])+"_.OUT" # name
+            write_ldos(g.x,g.y,out,output_file="MULTITIMEEVOLUTION/"+name)
+            fo.write(name+"\n") # write this file
+        elif write=="binary": occ[it,:] = out # store
+        if info: print("Time evolution, t =",ts[it])
+        it += 1
+    if write=="text": fo.close()
+    elif write=="binary": occ.flush() # write in disk
+    return np.array(ts),np.array(ps)